@@ -0,0 +1,117 @@
+import os
+import time
+import numpy as np
+from gl import color, mathLinalgNormal
+
+class Keyframes(object):
+    # (cuadros) - lista de (cuadro, valor), el valor es un numero o una lista
+    # interpola linealmente entre los cuadros, antes del primero y despues del ultimo se mantiene el valor
+    def __init__(self, keys):
+        keys = sorted(keys, key = lambda key: key[0])
+
+        self.frames = np.array([frame for frame, value in keys], dtype = float)
+        self.values = np.array([value for frame, value in keys], dtype = float)
+
+    # (cuadro)
+    # valor interpolado en el cuadro
+    def at(self, frame):
+        i = np.searchsorted(self.frames, frame, side = 'right')
+        if i == 0:
+            return self.values[0]
+        if i == len(self.frames):
+            return self.values[-1]
+
+        t = (frame - self.frames[i - 1]) / (self.frames[i] - self.frames[i - 1])
+        return self.values[i - 1] + t * (self.values[i] - self.values[i - 1])
+
+class Animation(object):
+    # (render, cuadros)
+    # recorrido de cámara y cambios de luces sobre la misma escena
+    # la escena, el BVH, las texturas y el mapa de ambiente se reutilizan en todos los cuadros,
+    # cada cuadro solo mueve la cámara, actualiza las luces y lanza los rayos
+    def __init__(self, r, frames):
+        self.render = r
+        self.frames = frames
+
+        self.position = None
+        self.target = None
+        self.up = [0, 1, 0]
+
+        # (luz, atributo, Keyframes)
+        self.lights = []
+
+    # (cuadros de posicion, cuadros de objetivo, arriba) - listas de (cuadro, [x, y, z])
+    # trayectoria de la cámara, sin objetivo la cámara conserva su orientacion
+    def camera(self, position, target = None, up = [0, 1, 0]):
+        self.position = Keyframes(position)
+        self.target = Keyframes(target) if target else None
+        self.up = up
+        return self
+
+    # (luz, atributo, cuadros) - por ejemplo (r.point_lights[0], 'intensity', [(0, 0.7), (30, 0.1)])
+    # anima un atributo de una luz: position, intensity, strength, direction o color (RGB entre 0 y 1)
+    def light(self, light, attribute, keys):
+        self.lights.append((light, attribute, Keyframes(keys)))
+        return self
+
+    # (cuadro)
+    # coloca la cámara y las luces del cuadro
+    def apply(self, frame):
+        r = self.render
+
+        if self.position is not None:
+            position = self.position.at(frame)
+            if self.target is not None:
+                r.glLookAt(position, self.target.at(frame), self.up)
+            else:
+                r.cam_position = position.tolist()
+
+        for light, attribute, keys in self.lights:
+            value = keys.at(frame)
+
+            if attribute == 'color':
+                value = color(*value)
+            elif attribute == 'direction':
+                value = mathLinalgNormal(value.tolist())
+            elif value.ndim:
+                value = value.tolist()
+            else:
+                value = float(value)
+
+            setattr(light, attribute, value)
+
+        # las celdas de luces dependen de la posicion e intensidad de cada luz
+        if self.lights and r.light_grid is not None:
+            r.glBuildLightGrid(r.light_grid.cell_size)
+
+    # (patron del archivo, packet, bvh, primer cuadro)
+    # renderiza los cuadros como secuencia de bmp numerados (patron con %d, por ejemplo 'frames/%04d.bmp')
+    # el BVH y la escena compilada se construyen una sola vez, entre cuadros solo se copian las luces
+    # regresa el tiempo de cada cuadro
+    def run(self, pattern = 'frame%04d.bmp', packet = False, bvh = True, start = 0):
+        r = self.render
+
+        folder = os.path.dirname(pattern % 0)
+        if folder:
+            os.makedirs(folder, exist_ok = True)
+
+        if bvh and r.bvh is None:
+            r.glBuildBVH()
+        if packet:
+            r.glCompileScene()
+
+        times = []
+        for frame in range(start, self.frames):
+            begin = time.perf_counter()
+            self.apply(frame)
+
+            if packet:
+                r.compiled.compileLights(r)
+                r.glRayTracingRenderPacket(compile = False)
+            else:
+                r.glRayTracingRender()
+
+            r.glFinish(pattern % frame)
+            times.append(time.perf_counter() - begin)
+
+        return times
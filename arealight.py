@@ -0,0 +1,160 @@
+from abc import ABC, abstractmethod
+import numpy as np
+from sphere import WHITE
+
+# (cantidad, semilla)
+# muestras estratificadas en [0, 1) x [0, 1) (n-rooks): en la cuadricula n x n cada fila
+# y cada columna tiene una sola muestra, para cualquier cantidad de muestras
+def stratified(n, seed = 0):
+    rng = np.random.RandomState(seed)
+    u = (np.arange(n) + rng.random_sample(n)) / n
+    v = (rng.permutation(n) + rng.random_sample(n)) / n
+    return np.stack([u, v], axis = 1)
+
+# (vectores) - arreglo (..., 3)
+def normalize(v):
+    return v / np.maximum(np.linalg.norm(v, axis = -1), 1e-12)[..., None]
+
+class AreaLight(ABC):
+    # (intensidad, color, muestras, semilla)
+    # luz con superficie, cada punto se ilumina con samples muestras sobre la luz y sus rayos de sombra
+    # la intensidad se reparte entre las muestras, las sombras son suaves en lugar de binarias
+    # las muestras siguen el mismo patron estratificado en todos los puntos, el resultado no tiene ruido
+    # y es igual en todos los modos de render
+    def __init__(self, intensity = 1, _color_ = WHITE, samples = 16, seed = 0):
+        self.intensity = intensity
+        self.color = _color_
+        self.samples = samples
+        self.seed = seed
+
+        self.pattern_cache = None
+
+    # no tiene parámetros
+    # patron (samples, 2) en [0, 1), se calcula de nuevo si cambian samples o seed
+    def pattern(self):
+        if self.pattern_cache is None or self.pattern_cache[0] != (self.samples, self.seed):
+            self.pattern_cache = ((self.samples, self.seed), stratified(self.samples, self.seed))
+
+        return self.pattern_cache[1]
+
+    # (puntos) - arreglo (N, 3)
+    # posiciones de las muestras vistas desde cada punto (N, samples, 3) y su peso (N, samples)
+    @abstractmethod
+    def points(self, point):
+        pass
+
+class RectLight(AreaLight):
+    # (esquina, lado 1, lado 2, intensidad, color, muestras, semilla)
+    # rectangulo esquina + u * lado 1 + v * lado 2, ilumina hacia los dos lados
+    def __init__(self, corner, edge1, edge2, intensity = 1, _color_ = WHITE, samples = 16, seed = 0):
+        AreaLight.__init__(self, intensity, _color_, samples, seed)
+        self.corner = corner
+        self.edge1 = edge1
+        self.edge2 = edge2
+
+    def key(self):
+        return ('rect', tuple(self.corner), tuple(self.edge1), tuple(self.edge2), self.samples, self.seed)
+
+    def points(self, point):
+        uv = self.pattern()
+        position = np.asarray(self.corner, dtype = float) + uv[:, 0:1] * np.asarray(self.edge1, dtype = float) + uv[:, 1:2] * np.asarray(self.edge2, dtype = float)
+
+        n = len(point)
+        return np.broadcast_to(position, (n, self.samples, 3)), np.full((n, self.samples), 1 / self.samples)
+
+class SphereLight(AreaLight):
+    # (centro, radio, intensidad, color, muestras, semilla)
+    # esfera emisora, las muestras se reparten sobre la parte de la esfera que se ve desde cada punto
+    def __init__(self, center, radius, intensity = 1, _color_ = WHITE, samples = 16, seed = 0):
+        AreaLight.__init__(self, intensity, _color_, samples, seed)
+        self.center = center
+        self.radius = radius
+
+    def key(self):
+        return ('sphere', tuple(self.center), self.radius, self.samples, self.seed)
+
+    def points(self, point):
+        uv = self.pattern()
+        center = np.asarray(self.center, dtype = float)
+
+        # base ortonormal con w hacia el punto
+        w = point - center
+        distance = np.linalg.norm(w, axis = 1)
+        w = w / np.maximum(distance, 1e-12)[:, None]
+
+        axis = np.where((np.abs(w[:, 0]) < 0.9)[:, None], [1.0, 0, 0], [0, 1.0, 0])
+        t = normalize(np.cross(axis, w))
+        b = np.cross(w, t)
+
+        # casquete visible: angulos con coseno entre radio / distancia y 1, uniforme en area
+        cos_max = np.where(distance > self.radius, self.radius / np.maximum(distance, 1e-12), 0)
+        cos_theta = 1 - uv[None, :, 0] * (1 - cos_max[:, None])
+        sin_theta = np.sqrt(np.maximum(0, 1 - cos_theta ** 2))
+        phi = 2 * np.pi * uv[None, :, 1]
+
+        direction = (sin_theta * np.cos(phi))[..., None] * t[:, None] + (sin_theta * np.sin(phi))[..., None] * b[:, None] + cos_theta[..., None] * w[:, None]
+        return center + self.radius * direction, np.full((len(point), self.samples), 1 / self.samples)
+
+class BlockLight(AreaLight):
+    # (posicion, tamaño, intensidad, color, muestras, semilla)
+    # bloque emisor (por ejemplo glowstone) centrado en position, igual que Cube
+    # cada muestra elige una de las caras que miran al punto segun su area proyectada
+    def __init__(self, position, size = [1, 1, 1], intensity = 1, _color_ = WHITE, samples = 16, seed = 0):
+        AreaLight.__init__(self, intensity, _color_, samples, seed)
+        self.position = position
+        self.size = size
+
+    def key(self):
+        return ('block', tuple(self.position), tuple(self.size), self.samples, self.seed)
+
+    # no tiene parámetros
+    # caras del bloque: esquina, lado 1, lado 2 y normal (6, 3) y area (6,)
+    def faces(self):
+        position = np.asarray(self.position, dtype = float)
+        size = np.asarray(self.size, dtype = float)
+
+        corners, edges1, edges2, normals, areas = [], [], [], [], []
+        for axis in range(3):
+            a, b = (axis + 1) % 3, (axis + 2) % 3
+            for sign in (-1, 1):
+                normal = np.zeros(3)
+                normal[axis] = sign
+
+                corner = position - size / 2
+                corner[axis] += (sign > 0) * size[axis]
+
+                edge1 = np.zeros(3)
+                edge1[a] = size[a]
+                edge2 = np.zeros(3)
+                edge2[b] = size[b]
+
+                corners.append(corner)
+                edges1.append(edge1)
+                edges2.append(edge2)
+                normals.append(normal)
+                areas.append(size[a] * size[b])
+
+        return np.array(corners), np.array(edges1), np.array(edges2), np.array(normals), np.array(areas)
+
+    def points(self, point):
+        uv = self.pattern()
+        corners, edges1, edges2, normals, areas = self.faces()
+
+        # area proyectada de cada cara vista desde el punto, las caras de atras no cuentan
+        centers = corners + edges1 / 2 + edges2 / 2
+        toward = normalize(point[:, None] - centers[None])
+        weight = np.maximum(0, (toward * normals).sum(axis = 2)) * areas
+
+        total = weight.sum(axis = 1)
+        # un punto dentro del bloque usa todas las caras por igual
+        weight = np.where((total > 0)[:, None], weight, areas)
+        cdf = np.cumsum(weight, axis = 1) / weight.sum(axis = 1)[:, None]
+
+        # la coordenada u elige la cara y se reutiliza dentro de ella
+        face = np.minimum((uv[None, :, 0, None] >= cdf[:, None, :]).sum(axis = 2), 5)
+        low = np.where(face > 0, np.take_along_axis(cdf, np.maximum(face - 1, 0), axis = 1), 0)
+        width = np.take_along_axis(cdf, face, axis = 1) - low
+        u = np.clip((uv[None, :, 0] - low) / np.maximum(width, 1e-12), 0, 1)
+
+        position = corners[face] + u[..., None] * edges1[face] + uv[None, :, 1, None] * edges2[face]
+        return position, np.full((len(point), self.samples), 1 / self.samples)
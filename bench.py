@@ -0,0 +1,272 @@
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import platform
+import subprocess
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from gl import RayTracer, color
+from sphere import *
+from obj import Envmap, Texture
+
+# carpeta del repositorio, las escenas usan rutas relativas a las texturas
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+class RayCounter(object):
+    # (render)
+    # cuenta los rayos primarios, secundarios y de sombra de un RayTracer
+    # envuelve los metodos de la instancia, la clase no cambia
+    def __init__(self, r):
+        self.primary = 0
+        self.secondary = 0
+        self.shadow = 0
+
+        shade = r.glShadeRay
+        occluded = r.scene_occluded
+        shade_packet = r.glShadePacket
+        occluded_packet = r.scene_occluded_packet
+
+        def glShadeRay(origin, direction, origin_object = None, depth = 0):
+            if depth == 0:
+                self.primary += 1
+            else:
+                self.secondary += 1
+            return shade(origin, direction, origin_object, depth)
+
+        def scene_occluded(*args, **kwargs):
+            self.shadow += 1
+            return occluded(*args, **kwargs)
+
+        def glShadePacket(origins, directions, exclude = None, depth = 0):
+            if depth == 0:
+                self.primary += len(origins)
+            else:
+                self.secondary += len(origins)
+            return shade_packet(origins, directions, exclude, depth)
+
+        def scene_occluded_packet(origins, *args, **kwargs):
+            self.shadow += len(origins)
+            return occluded_packet(origins, *args, **kwargs)
+
+        r.glShadeRay = glShadeRay
+        r.scene_occluded = scene_occluded
+        r.glShadePacket = glShadePacket
+        r.scene_occluded_packet = scene_occluded_packet
+
+    # no tiene parámetros
+    # total de rayos por tipo
+    def counts(self):
+        return {
+            'primary': self.primary,
+            'secondary': self.secondary,
+            'shadow': self.shadow,
+            'total': self.primary + self.secondary + self.shadow
+        }
+
+## ESCENAS ##
+
+# (width, height, lado)
+# cuadricula de lado x lado cubos con textura, iluminada por dos luces de punto
+def sceneCubes(width, height, side):
+    stone = Material(texture = Texture('./textures/stone.bmp'))
+    dirt = Material(texture = Texture('./textures/dirt.bmp'))
+
+    r = RayTracer(width, height)
+    r.point_lights.append(PointLight(position = [2, 4, -4], intensity = 0.7))
+    r.point_lights.append(PointLight(position = [-3, 4, -8], intensity = 0.4))
+    r.ambient_light = AmbientLight(strength = 0.2)
+
+    for x in range(side):
+        for z in range(side):
+            position = [x - side // 2, -2, -4 - z]
+            r.scene.append(Cube(position, [1, 1, 1], stone if (x + z) % 2 else dirt))
+
+    return r
+
+# (width, height)
+# campo de esferas difusas sobre un plano
+def sceneSpheres(width, height):
+    r = RayTracer(width, height)
+    r.point_lights.append(PointLight(position = [0, 5, -3], intensity = 0.8))
+    r.directional_light = DirectionalLight(direction = [0.3, -1, -0.5], intensity = 0.5)
+    r.ambient_light = AmbientLight(strength = 0.1)
+
+    for i in range(8):
+        for j in range(6):
+            diffuse = color((i + 1) / 8, (j + 1) / 6, 0.5)
+            r.scene.append(Sphere([i - 3.5, -1.5 + 0.2 * (i % 2), -5 - j], 0.4, Material(diffuse = diffuse, spec = 32)))
+
+    r.scene.append(Plane([0, -2, 0], [0, 1, 0], Material(diffuse = color(0.6, 0.6, 0.6))))
+
+    return r
+
+# (width, height)
+# escena con muchos materiales de vidrio y espejo (muchos rayos secundarios)
+def sceneGlass(width, height):
+    mirror = Material(spec = 64, t = REFLECTIVE)
+    glass = Material(spec = 64, ior = 1.5, t = TRANSPARENT)
+
+    r = RayTracer(width, height)
+    r.point_lights.append(PointLight(position = [0, 4, -4], intensity = 0.8))
+    r.ambient_light = AmbientLight(strength = 0.2)
+    r.env_map = Envmap('./envmaps/nolamps.bmp')
+
+    for i in range(4):
+        r.scene.append(Sphere([i * 1.5 - 2.25, 0, -6], 0.6, glass if i % 2 else mirror))
+        r.scene.append(Cube([i * 1.5 - 2.25, -1.5, -7], [1, 1, 1], mirror if i % 2 else glass))
+
+    r.scene.append(Plane([0, -2, 0], [0, 1, 0], Material(diffuse = color(0.4, 0.5, 0.4))))
+
+    return r
+
+# (width, height)
+# escena de run.py
+def sceneMinecraft(width, height):
+    from run import mobsAtNight
+    return mobsAtNight(width, height)
+
+SCENES = {
+    'cubes_small': lambda w, h: sceneCubes(w, h, 4),
+    'cubes_medium': lambda w, h: sceneCubes(w, h, 10),
+    'cubes_large': lambda w, h: sceneCubes(w, h, 24),
+    'spheres': sceneSpheres,
+    'glass': sceneGlass,
+    'minecraft': sceneMinecraft,
+}
+
+## BENCHMARK ##
+
+# (escena, modo, width, height, bvh)
+# construye y renderiza una escena, regresa las medidas como diccionario
+# se ejecuta en un proceso nuevo para medir la memoria maxima de cada escena
+def runBenchmark(name, mode, width, height, bvh):
+    os.chdir(ROOT)
+    phases = {}
+
+    start = time.perf_counter()
+    r = SCENES[name](width, height)
+    phases['build'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if bvh:
+        r.glBuildBVH()
+    phases['bvh'] = time.perf_counter() - start
+
+    counter = RayCounter(r)
+
+    start = time.perf_counter()
+    if mode == 'packet':
+        r.glRayTracingRenderPacket()
+    else:
+        r.glRayTracingRender()
+    phases['render'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    r.glFinish(os.devnull)
+    phases['write'] = time.perf_counter() - start
+
+    rays = counter.counts()
+
+    return {
+        'mode': mode,
+        'bvh': bvh,
+        'width': width,
+        'height': height,
+        'objects': len(r.scene),
+        'rays': rays,
+        'rays_per_second': rays['total'] / phases['render'] if phases['render'] else 0,
+        'time': phases,
+        'peak_memory_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+# no tiene parámetros
+# informacion del commit y del entorno para comparar resultados
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd = ROOT, capture_output = True, text = True).stdout.strip()
+    except OSError:
+        commit = None
+
+    return {
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+# campos que deben ser iguales para comparar dos resultados de la misma escena
+COMPARABLE = ('mode', 'bvh', 'width', 'height', 'objects')
+
+# (resultados anteriores, resultados nuevos, tolerancia)
+# regresa las escenas cuyo rendimiento (rayos por segundo) bajo mas que la tolerancia
+# y las que no se compararon porque cambio el modo, el BVH, el tamaño o la cantidad de objetos
+def compare(old, new, tolerance = 0.1):
+    regressions = []
+    skipped = []
+
+    for name, result in new['results'].items():
+        previous = old['results'].get(name)
+        if previous is None or previous['rays_per_second'] == 0:
+            continue
+
+        different = [key for key in COMPARABLE if previous.get(key) != result.get(key)]
+        if different:
+            skipped.append((name, [(key, previous.get(key), result.get(key)) for key in different]))
+            continue
+
+        ratio = result['rays_per_second'] / previous['rays_per_second']
+        if ratio < 1 - tolerance:
+            regressions.append((name, previous['rays_per_second'], result['rays_per_second'], ratio))
+
+    return regressions, skipped
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'benchmark del ray tracer con escenas estandar')
+    parser.add_argument('--scenes', nargs = '+', choices = sorted(SCENES), default = sorted(SCENES))
+    parser.add_argument('--mode', choices = ['scalar', 'packet'], default = 'scalar')
+    parser.add_argument('--size', type = int, default = 64, help = 'ancho y alto de la imagen')
+    parser.add_argument('--no-bvh', action = 'store_true', help = 'usar la busqueda lineal de scene_intercept')
+    parser.add_argument('--output', default = None, help = 'archivo json para los resultados')
+    parser.add_argument('--compare', default = None, help = 'json anterior para detectar regresiones')
+    parser.add_argument('--tolerance', type = float, default = 0.1)
+    args = parser.parse_args(argv)
+
+    report = {'environment': environment(), 'results': {}}
+
+    for name in args.scenes:
+        with ProcessPoolExecutor(max_workers = 1, mp_context = get_context('spawn')) as executor:
+            result = executor.submit(runBenchmark, name, args.mode, args.size, args.size, not args.no_bvh).result()
+
+        report['results'][name] = result
+        print('%-14s %8.0f rays/s  %7d rays (%d primary, %d secondary, %d shadow)  render %.2fs  peak %d KB' % (
+            name, result['rays_per_second'], result['rays']['total'], result['rays']['primary'],
+            result['rays']['secondary'], result['rays']['shadow'], result['time']['render'], result['peak_memory_kb']
+        ))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent = 2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions, skipped = compare(json.load(file), report, args.tolerance)
+
+        for name, different in skipped:
+            print('AVISO %s no se compara: %s' % (name, ', '.join('%s %s -> %s' % change for change in different)))
+
+        for name, before, after, ratio in regressions:
+            print('REGRESION %s: %.0f -> %.0f rays/s (%.0f%%)' % (name, before, after, ratio * 100))
+
+        if regressions:
+            return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
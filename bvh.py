@@ -0,0 +1,332 @@
+import numpy as np
+
+# valor grande para evitar divisiones entre cero en las pruebas de cajas
+INFINITE = 1e30
+
+# (direccion) - vector de longitud 3
+# inverso de cada componente de la direccion, usado en la prueba de cajas
+def inverseDirection(direction):
+    return [1 / d if d != 0 else INFINITE for d in direction]
+
+# (objeto, origen, direccion, distancia maxima)
+# regresa verdadero si el objeto bloquea el rayo antes de max_distance
+# usa ray_occluded si el objeto lo tiene, para no calcular normales ni uvs
+def rayOccluded(obj, origin, direction, max_distance):
+    if hasattr(obj, 'ray_occluded'):
+        return obj.ray_occluded(origin, direction, max_distance)
+
+    hit = obj.ray_intersect(origin, direction)
+    return hit is not None and hit.distance < max_distance
+
+# (objeto, origenes, direcciones)
+# interseccion de un paquete con un objeto, distancias, normales, uvs e indices de material
+# los objetos con un solo material pueden regresar solamente los primeros tres valores,
+# para objetos sin ray_intersect_packet se revisa rayo por rayo
+def packetIntersect(obj, origins, directions):
+    if hasattr(obj, 'ray_intersect_packet'):
+        result = obj.ray_intersect_packet(origins, directions)
+        if len(result) == 3:
+            result = result + (np.zeros(len(origins), dtype = int),)
+
+        return result
+
+    n = len(origins)
+    t = np.full(n, np.inf)
+    norm = np.zeros((n, 3))
+    uvs = np.full((n, 2), np.nan)
+    local = np.zeros(n, dtype = int)
+    palette = getattr(obj, 'materials', None)
+
+    for i in range(n):
+        hit = obj.ray_intersect(list(origins[i]), list(directions[i]))
+        if hit is not None:
+            t[i] = hit.distance
+            norm[i] = hit.normal
+            if hit.texture is not None:
+                uvs[i] = hit.texture
+            if palette and hit.material is not None:
+                local[i] = palette.index(hit.material)
+
+    return t, norm, uvs, local
+
+# (minimo, maximo, origen, inverso de la direccion, distancia maxima)
+# prueba de interseccion entre un rayo y una caja alineada a los ejes (slab test)
+# regresa la distancia de entrada o None si no hay interseccion antes de max_distance
+def rayBoxIntersect(boundsMin, boundsMax, origin, inverse, max_distance):
+    tnear = -INFINITE
+    tfar = INFINITE
+
+    for i in range(3):
+        t1 = (boundsMin[i] - origin[i]) * inverse[i]
+        t2 = (boundsMax[i] - origin[i]) * inverse[i]
+
+        if t1 > t2:
+            t1, t2 = t2, t1
+        if t1 > tnear:
+            tnear = t1
+        if t2 < tfar:
+            tfar = t2
+
+        if tnear > tfar or tfar < 0 or tnear > max_distance:
+            return None
+
+    return tnear
+
+class BVHNode(object):
+    # inicialización
+    def __init__(self, boundsMin, boundsMax, items = None, left = None, right = None):
+        self.boundsMin = boundsMin
+        self.boundsMax = boundsMax
+
+        # solamente las hojas tienen objetos, (indice en la escena, objeto)
+        self.items = items
+        self.left = left
+        self.right = right
+
+class BVH(object):
+    # (objetos, objetos por hoja)
+    # los objetos que tienen bounds() forman la jerarquia,
+    # los demas (por ejemplo planos) se revisan siempre
+    def __init__(self, objects, leaf_size = 4):
+        self.leaf_size = leaf_size
+        self.unbounded = []
+
+        bounded = []
+        for index, obj in enumerate(objects):
+            bounds = obj.bounds() if hasattr(obj, 'bounds') else None
+
+            if bounds is None:
+                self.unbounded.append((index, obj))
+            else:
+                bounded.append((index, obj, list(bounds[0]), list(bounds[1])))
+
+        self.root = self.build(bounded) if bounded else None
+
+    # (objetos) - lista de (indice, objeto, minimo, maximo)
+    # construye el arbol dividiendo por la mediana de los centros en el eje mas largo
+    def build(self, items):
+        boundsMin = [min(item[2][i] for item in items) for i in range(3)]
+        boundsMax = [max(item[3][i] for item in items) for i in range(3)]
+
+        if len(items) <= self.leaf_size:
+            return BVHNode(boundsMin, boundsMax, items = [(item[0], item[1]) for item in items])
+
+        centers = [[(item[2][i] + item[3][i]) / 2 for i in range(3)] for item in items]
+        extent = [max(c[i] for c in centers) - min(c[i] for c in centers) for i in range(3)]
+        axis = extent.index(max(extent))
+
+        order = sorted(range(len(items)), key = lambda k: centers[k][axis])
+        half = len(items) // 2
+
+        return BVHNode(
+            boundsMin,
+            boundsMax,
+            left = self.build([items[k] for k in order[:half]]),
+            right = self.build([items[k] for k in order[half:]])
+        )
+
+    # (origen, direccion, objeto de origen)
+    # igual que RayTracer.scene_intercept, regresa el material y la interseccion mas cercana
+    def intersect(self, origin, direction, origin_object = None):
+        tempZbuffer = float('inf')
+        material = None
+        intersect = None
+        best = -1
+
+        for index, obj in self.unbounded:
+            if obj is not origin_object:
+                hit = obj.ray_intersect(origin, direction)
+                if hit is not None and hit.distance < tempZbuffer:
+                    tempZbuffer = hit.distance
+                    material = hit.material or obj.material
+                    intersect = hit
+                    best = index
+
+        if self.root is None:
+            return material, intersect
+
+        inverse = inverseDirection(direction)
+        tnear = rayBoxIntersect(self.root.boundsMin, self.root.boundsMax, origin, inverse, tempZbuffer)
+        stack = [(tnear, self.root)] if tnear is not None else []
+
+        while stack:
+            tnear, node = stack.pop()
+            if tnear > tempZbuffer:
+                continue
+
+            if node.items is not None:
+                for index, obj in node.items:
+                    if obj is not origin_object:
+                        hit = obj.ray_intersect(origin, direction)
+                        # en un empate gana el primer objeto de la escena, igual que en scene_intercept
+                        if hit is not None and (hit.distance < tempZbuffer or (hit.distance == tempZbuffer and index < best)):
+                            tempZbuffer = hit.distance
+                            material = hit.material or obj.material
+                            intersect = hit
+                            best = index
+                continue
+
+            # se visita primero el hijo mas cercano
+            near_left = rayBoxIntersect(node.left.boundsMin, node.left.boundsMax, origin, inverse, tempZbuffer)
+            near_right = rayBoxIntersect(node.right.boundsMin, node.right.boundsMax, origin, inverse, tempZbuffer)
+
+            if near_left is not None and near_right is not None:
+                if near_left < near_right:
+                    stack.append((near_right, node.right))
+                    stack.append((near_left, node.left))
+                else:
+                    stack.append((near_left, node.left))
+                    stack.append((near_right, node.right))
+            elif near_left is not None:
+                stack.append((near_left, node.left))
+            elif near_right is not None:
+                stack.append((near_right, node.right))
+
+        return material, intersect
+
+    # (origen, direccion, distancia maxima, objeto de origen)
+    # regresa verdadero si cualquier objeto bloquea el rayo antes de max_distance
+    def occluded(self, origin, direction, max_distance = float('inf'), origin_object = None):
+        return self.occluder(origin, direction, max_distance, origin_object) is not None
+
+    # (origen, direccion, distancia maxima, objeto de origen)
+    # primer objeto que bloquea el rayo antes de max_distance como (indice, objeto), o None
+    # termina con la primera interseccion que encuentra
+    def occluder(self, origin, direction, max_distance = float('inf'), origin_object = None):
+        for index, obj in self.unbounded:
+            if obj is not origin_object and rayOccluded(obj, origin, direction, max_distance):
+                return index, obj
+
+        if self.root is None:
+            return None
+
+        inverse = inverseDirection(direction)
+        stack = [self.root]
+
+        while stack:
+            node = stack.pop()
+            if rayBoxIntersect(node.boundsMin, node.boundsMax, origin, inverse, max_distance) is None:
+                continue
+
+            if node.items is None:
+                stack.append(node.right)
+                stack.append(node.left)
+                continue
+
+            for index, obj in node.items:
+                if obj is not origin_object and rayOccluded(obj, origin, direction, max_distance):
+                    return index, obj
+
+        return None
+
+    # (origenes, direcciones, indices a ignorar, kernel)
+    # version por paquetes de intersect, kernel(objeto, origenes, direcciones) regresa
+    # distancias, normales, uvs e indices de material. Cada nodo solo se prueba con los rayos que siguen activos
+    def intersect_packet(self, origins, directions, exclude, kernel):
+        n = len(origins)
+        index = np.full(n, -1)
+        distance = np.full(n, np.inf)
+        normal = np.zeros((n, 3))
+        uvs = np.full((n, 2), np.nan)
+        local = np.zeros(n, dtype = int)
+
+        def test(items, rays):
+            for i, obj in items:
+                t, norm, uv, mat = kernel(obj, origins[rays], directions[rays])
+
+                closer = (t < distance[rays]) | ((t == distance[rays]) & (i < index[rays]))
+                if exclude is not None:
+                    closer &= exclude[rays] != i
+
+                if closer.any():
+                    selected = rays[closer]
+                    index[selected] = i
+                    distance[selected] = t[closer]
+                    normal[selected] = norm[closer]
+                    uvs[selected] = uv[closer]
+                    local[selected] = mat[closer]
+
+        rays = np.arange(n)
+        test(self.unbounded, rays)
+
+        if self.root is None:
+            return index, distance, normal, uvs, local
+
+        with np.errstate(divide = 'ignore'):
+            inverse = np.where(directions != 0, 1 / np.where(directions != 0, directions, 1), INFINITE)
+
+        stack = [(self.root, rays)]
+        while stack:
+            node, rays = stack.pop()
+
+            t1 = (np.asarray(node.boundsMin) - origins[rays]) * inverse[rays]
+            t2 = (np.asarray(node.boundsMax) - origins[rays]) * inverse[rays]
+            tnear = np.minimum(t1, t2).max(axis = 1)
+            tfar = np.maximum(t1, t2).min(axis = 1)
+
+            rays = rays[(tnear <= tfar) & (tfar >= 0) & (tnear <= distance[rays])]
+            if len(rays) == 0:
+                continue
+
+            if node.items is not None:
+                test(node.items, rays)
+            else:
+                stack.append((node.right, rays))
+                stack.append((node.left, rays))
+
+        return index, distance, normal, uvs, local
+
+    # (origenes, direcciones, indices a ignorar, distancias maximas, kernel, bloqueadores)
+    # version por paquetes de occluded, los rayos bloqueados dejan de revisarse
+    # occluder (opcional, arreglo de enteros) recibe el indice del objeto que bloqueo cada rayo
+    def occluded_packet(self, origins, directions, exclude, max_distance, kernel, occluder = None):
+        n = len(origins)
+        blocked = np.zeros(n, dtype = bool)
+
+        def test(items, rays):
+            for i, obj in items:
+                if not len(rays):
+                    break
+
+                t = kernel(obj, origins[rays], directions[rays])[0]
+
+                hit = t < max_distance[rays]
+                if exclude is not None:
+                    hit &= exclude[rays] != i
+
+                blocked[rays[hit]] = True
+                if occluder is not None:
+                    occluder[rays[hit]] = i
+                rays = rays[~hit]
+
+            return rays
+
+        rays = test(self.unbounded, np.arange(n))
+
+        if self.root is None:
+            return blocked
+
+        with np.errstate(divide = 'ignore'):
+            inverse = np.where(directions != 0, 1 / np.where(directions != 0, directions, 1), INFINITE)
+
+        stack = [(self.root, rays)]
+        while stack:
+            node, rays = stack.pop()
+            rays = rays[~blocked[rays]]
+
+            t1 = (np.asarray(node.boundsMin) - origins[rays]) * inverse[rays]
+            t2 = (np.asarray(node.boundsMax) - origins[rays]) * inverse[rays]
+            tnear = np.minimum(t1, t2).max(axis = 1)
+            tfar = np.maximum(t1, t2).min(axis = 1)
+
+            rays = rays[(tnear <= tfar) & (tfar >= 0) & (tnear < max_distance[rays])]
+            if len(rays) == 0:
+                continue
+
+            if node.items is not None:
+                test(node.items, rays)
+            else:
+                stack.append((node.right, rays))
+                stack.append((node.left, rays))
+
+        return blocked
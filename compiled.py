@@ -0,0 +1,354 @@
+import numpy as np
+from numpy import arccos, arctan2
+from gl import uvExtent
+from sphere import Sphere, Cube, Plane
+
+# cantidad maxima de pares (rayo, primitiva) que se prueban a la vez
+CHUNK = 1 << 18
+
+# tipos de primitiva en CompiledScene.kind
+SPHERE = 0
+CUBE = 1
+PLANE = 2
+OTHER = 3
+
+# (color) - bytes en BGR
+# color como arreglo RGB flotante
+def colorArray(c):
+    return np.frombuffer(c, dtype = np.uint8)[::-1] / 255
+
+# (origenes, direcciones, caras minimas, caras maximas, limites minimos, limites maximos)
+# metodo de slabs de Cube.ray_intersect_packet, los arreglos se pueden combinar con broadcasting
+# (por ejemplo rayos (N, 1, 3) contra cubos (C, 3)), el ultimo eje son las coordenadas
+# regresa distancias (inf si no hay interseccion), eje de la cara, rayos que empiezan dentro y puntos
+def slabPacket(orig, dir, faceMin, faceMax, boundsMin, boundsMax):
+    parallel = np.abs(dir) <= 0.0001
+    inverse = 1 / np.where(parallel, 1, dir)
+
+    t1 = (faceMin - orig) * inverse
+    t2 = (faceMax - orig) * inverse
+    entry = np.where(parallel, -np.inf, np.minimum(t1, t2))
+    exit = np.where(parallel, np.inf, np.maximum(t1, t2))
+
+    near_axis = entry.argmax(axis = -1)
+    far_axis = exit.argmin(axis = -1)
+    tnear = np.take_along_axis(entry, near_axis[..., None], axis = -1)[..., 0]
+    tfar = np.take_along_axis(exit, far_axis[..., None], axis = -1)[..., 0]
+
+    inside = tnear <= 0
+    t = np.where(inside, tfar, tnear)
+    axis = np.where(inside, far_axis, near_axis)
+
+    valid = (tfar > 0) & ~(parallel.all(axis = -1))
+    valid &= ~(parallel & ((orig < boundsMin) | (orig > boundsMax))).any(axis = -1)
+
+    point = orig + np.where(valid, t, 0)[..., None] * dir
+    valid &= np.all((point >= boundsMin) & (point <= boundsMax), axis = -1)
+
+    return np.where(valid, t, np.inf), axis, inside, point
+
+class CompiledScene(object):
+    # (render)
+    # copia de la escena en arreglos contiguos para los kernels por paquetes:
+    # esferas, cubos y planos por tipo, tabla de materiales y luces
+    # los objetos de otros tipos (por ejemplo VoxelGrid) se prueban con su propio kernel
+    def __init__(self, r):
+        scene = r.scene
+        n = len(scene)
+
+        self.kind = np.full(n, OTHER)
+        self.slot = np.zeros(n, dtype = int)
+
+        spheres = []
+        cubes = []
+        planes = []
+        self.others = []
+
+        for i, obj in enumerate(scene):
+            if type(obj) is Sphere:
+                group, self.kind[i] = spheres, SPHERE
+            elif type(obj) is Cube:
+                group, self.kind[i] = cubes, CUBE
+            elif type(obj) is Plane:
+                group, self.kind[i] = planes, PLANE
+            else:
+                self.others.append((i, obj))
+                continue
+
+            self.slot[i] = len(group)
+            group.append(i)
+
+        # esferas
+        self.sphere_index = np.array(spheres, dtype = int)
+        self.sphere_center = np.array([scene[i].center for i in spheres], dtype = float).reshape(-1, 3)
+        self.sphere_radius = np.array([scene[i].radius for i in spheres], dtype = float)
+
+        # cubos
+        self.cube_index = np.array(cubes, dtype = int)
+        self.cube_faceMin = np.array([scene[i].faceMin for i in cubes], dtype = float).reshape(-1, 3)
+        self.cube_faceMax = np.array([scene[i].faceMax for i in cubes], dtype = float).reshape(-1, 3)
+        self.cube_boundsMin = np.array([scene[i].boundsMin for i in cubes], dtype = float).reshape(-1, 3)
+        self.cube_boundsMax = np.array([scene[i].boundsMax for i in cubes], dtype = float).reshape(-1, 3)
+
+        # planos
+        self.plane_index = np.array(planes, dtype = int)
+        self.plane_position = np.array([scene[i].position for i in planes], dtype = float).reshape(-1, 3)
+        self.plane_normal = np.array([scene[i].normal for i in planes], dtype = float).reshape(-1, 3)
+
+        # materiales, cada objeto aporta su paleta (materials) o su unico material
+        materials = []
+        offsets = []
+        concave = []
+        for obj in scene:
+            offsets.append(len(materials))
+            materials.extend(getattr(obj, 'materials', None) or [obj.material])
+            concave.append(getattr(obj, 'concave', False))
+
+        self.offsets = np.array(offsets, dtype = int)
+        self.uv_extent = np.array([uvExtent(obj) for obj in scene], dtype = float)
+        self.concave = np.array(concave, dtype = bool)
+
+        self.textures = []
+        texture_index = []
+        for m in materials:
+            if m.texture is None:
+                texture_index.append(-1)
+                continue
+
+            for k, texture in enumerate(self.textures):
+                if texture is m.texture:
+                    texture_index.append(k)
+                    break
+            else:
+                texture_index.append(len(self.textures))
+                self.textures.append(m.texture)
+
+        self.diffuse = np.array([colorArray(m.diffuse) for m in materials], dtype = float).reshape(-1, 3)
+        self.spec = np.array([m.spec for m in materials], dtype = float)
+        self.ior = np.array([m.ior for m in materials], dtype = float)
+        self.type = np.array([m.type for m in materials], dtype = int)
+        self.texture = np.array(texture_index, dtype = int)
+
+        self.compileLights(r)
+
+    # (render)
+    # copia las luces, se puede llamar sola si solo cambiaron las luces
+    def compileLights(self, r):
+        self.ambient = None
+        if r.ambient_light:
+            self.ambient = r.ambient_light.strength * colorArray(r.ambient_light.color)
+
+        self.directional = None
+        if r.directional_light:
+            light = r.directional_light
+            self.directional = (-np.asarray(light.direction, dtype = float), colorArray(light.color), light.intensity)
+
+        self.point_position = np.array([l.position for l in r.point_lights], dtype = float).reshape(-1, 3)
+        self.point_color = np.array([colorArray(l.color) for l in r.point_lights], dtype = float).reshape(-1, 3)
+        self.point_intensity = np.array([l.intensity for l in r.point_lights], dtype = float)
+        self.point_falloff = np.array([l.falloff for l in r.point_lights], dtype = float)
+
+        # luces con superficie, sus muestras se calculan desde cada punto
+        self.area = [(light, colorArray(light.color), light.intensity) for light in r.area_lights]
+
+        # columnas de visibilidad: direccional, de punto y una por muestra de las luces con superficie
+        self.light_count = (self.directional is not None) + len(r.point_lights) + sum(light.samples for light in r.area_lights)
+
+    ## DISTANCIAS POR GRUPO ##
+
+    # (origenes, direcciones) - arreglos (N, 3)
+    # distancias de cada rayo a cada esfera (N, S)
+    def sphereDistances(self, orig, dir):
+        L = self.sphere_center[None, :, :] - orig[:, None, :]
+        tca = np.einsum('nsk,nk->ns', L, dir)
+        d2 = np.einsum('nsk,nsk->ns', L, L) - tca ** 2
+
+        radius2 = self.sphere_radius ** 2
+        hit = d2 <= radius2
+        thc = np.sqrt(np.maximum(radius2 - d2, 0))
+        t0 = tca - thc
+        t0 = np.where(t0 < 0, tca + thc, t0)
+        hit &= t0 >= 0
+
+        return np.where(hit, t0, np.inf)
+
+    # primero se calculan solo las distancias de entrada y salida de cada par (rayo, cubo),
+    # la prueba completa de slabPacket se hace unicamente con los pares que pueden chocar
+    def cubeDistances(self, orig, dir):
+        parallel = np.abs(dir) <= 0.0001
+        inverse = 1 / np.where(parallel, 1, dir)
+
+        # un eje a la vez, arreglos (N, C)
+        tnear = np.full((len(orig), len(self.cube_index)), -np.inf)
+        tfar = np.full((len(orig), len(self.cube_index)), np.inf)
+        for i in range(3):
+            t1 = (self.cube_faceMin[None, :, i] - orig[:, i, None]) * inverse[:, i, None]
+            t2 = (self.cube_faceMax[None, :, i] - orig[:, i, None]) * inverse[:, i, None]
+            skip = parallel[:, i, None]
+
+            np.maximum(tnear, np.where(skip, -np.inf, np.minimum(t1, t2)), out = tnear)
+            np.minimum(tfar, np.where(skip, np.inf, np.maximum(t1, t2)), out = tfar)
+
+        # el punto puede salirse de las caras hasta epsilon (0.001) y seguir siendo valido,
+        # fuera de esta tolerancia en t el punto de entrada ya esta fuera de los limites
+        tolerance = 0.0011 * np.abs(inverse).max(axis = 1)
+        rays, cubes = np.nonzero((tfar > 0) & (tnear <= tfar + tolerance[:, None]))
+
+        t = np.full(tnear.shape, np.inf)
+        t[rays, cubes] = slabPacket(
+            orig[rays], dir[rays],
+            self.cube_faceMin[cubes], self.cube_faceMax[cubes], self.cube_boundsMin[cubes], self.cube_boundsMax[cubes]
+        )[0]
+
+        return t
+
+    def planeDistances(self, orig, dir):
+        denom = dir @ self.plane_normal.T
+        valid = np.abs(denom) > 0.0001
+
+        t = np.einsum('npk,pk->np', self.plane_position[None, :, :] - orig[:, None, :], self.plane_normal) / np.where(valid, denom, 1)
+        return np.where(valid & (t > 0), t, np.inf)
+
+    # no tiene parámetros
+    # grupos de primitivas no vacios: (indices en la escena, funcion de distancias)
+    def groups(self):
+        groups = []
+        if len(self.sphere_index):
+            groups.append((self.sphere_index, self.sphereDistances))
+        if len(self.cube_index):
+            groups.append((self.cube_index, self.cubeDistances))
+        if len(self.plane_index):
+            groups.append((self.plane_index, self.planeDistances))
+
+        return groups
+
+    ## CONSULTAS ##
+
+    # (origenes, direcciones, indices de objetos a ignorar, kernel)
+    # igual que RayTracer.scene_intercept_packet, kernel es el de los objetos sin grupo
+    # regresa indices, distancias, normales, uvs e indices de material en la paleta
+    def intersect(self, origins, directions, exclude, kernel):
+        n = len(origins)
+        index = np.full(n, -1)
+        distance = np.full(n, np.inf)
+        normal = np.zeros((n, 3))
+        uvs = np.full((n, 2), np.nan)
+        local = np.zeros(n, dtype = int)
+
+        if not len(self.kind):
+            return index, distance, normal, uvs, local
+
+        for objects, distances in self.groups():
+            step = max(1, CHUNK // len(objects))
+
+            for start in range(0, n, step):
+                rays = slice(start, start + step)
+                t = distances(origins[rays], directions[rays])
+                if exclude is not None:
+                    t[objects[None, :] == exclude[rays, None]] = np.inf
+
+                # los objetos de cada grupo estan en orden de la escena, en un empate gana el primero
+                best = t.argmin(axis = 1)
+                t = t[np.arange(len(t)), best]
+                i = objects[best]
+
+                closer = (t < distance[rays]) | ((t == distance[rays]) & (i < index[rays]))
+                index[rays] = np.where(closer, i, index[rays])
+                distance[rays] = np.where(closer, t, distance[rays])
+
+        for i, obj in self.others:
+            t, norm, uv, mat = kernel(obj, origins, directions)
+
+            closer = (t < distance) | ((t == distance) & (i < index))
+            if exclude is not None:
+                closer &= exclude != i
+
+            if closer.any():
+                index[closer] = i
+                distance[closer] = t[closer]
+                normal[closer] = norm[closer]
+                uvs[closer] = uv[closer]
+                local[closer] = mat[closer]
+
+        # normales y uvs solamente para el objeto mas cercano de cada rayo
+        kind = np.where(index >= 0, self.kind[index], OTHER)
+        slot = self.slot[np.maximum(index, 0)]
+
+        rays = np.nonzero(kind == SPHERE)[0]
+        if len(rays):
+            point = origins[rays] + distance[rays, None] * directions[rays]
+            norm = point - self.sphere_center[slot[rays]]
+            norm /= np.maximum(np.linalg.norm(norm, axis = 1), 1e-12)[:, None]
+
+            normal[rays] = norm
+            uvs[rays, 0] = 1 - (arctan2(norm[:, 2], norm[:, 0]) / (2 * np.pi) + 0.5)
+            uvs[rays, 1] = arccos(np.clip(-norm[:, 1], -1, 1)) / np.pi
+
+        rays = np.nonzero(kind == CUBE)[0]
+        if len(rays):
+            c = slot[rays]
+            boundsMin = self.cube_boundsMin[c]
+            boundsMax = self.cube_boundsMax[c]
+            d = directions[rays]
+
+            t, axis, inside, point = slabPacket(origins[rays], d, self.cube_faceMin[c], self.cube_faceMax[c], boundsMin, boundsMax)
+
+            rows = np.arange(len(rays))
+            outward = d[rows, axis] > 0
+            norm = np.zeros((len(rays), 3))
+            norm[rows, axis] = np.where(inside == outward, 1, -1)
+            normal[rays] = norm
+
+            others = np.array([[1, 2], [0, 2], [0, 1]])[axis]
+            extent = boundsMax - boundsMin
+            for k in range(2):
+                a = others[:, k]
+                uvs[rays, k] = (point[rows, a] - boundsMin[rows, a]) / extent[rows, a]
+
+        rays = np.nonzero(kind == PLANE)[0]
+        if len(rays):
+            normal[rays] = self.plane_normal[slot[rays]]
+
+        return index, distance, normal, uvs, local
+
+    # (origenes, direcciones, indices de objetos a ignorar, distancias maximas, kernel, bloqueadores)
+    # igual que RayTracer.scene_occluded_packet, regresa verdadero para cada rayo bloqueado
+    def occluded(self, origins, directions, exclude, max_distance, kernel, occluder = None):
+        n = len(origins)
+        blocked = np.zeros(n, dtype = bool)
+
+        for objects, distances in self.groups():
+            step = max(1, CHUNK // len(objects))
+
+            for start in range(0, n, step):
+                rays = np.arange(start, min(start + step, n))
+                rays = rays[~blocked[rays]]
+                if not len(rays):
+                    continue
+
+                hit = distances(origins[rays], directions[rays]) < max_distance[rays, None]
+                if exclude is not None:
+                    hit &= objects[None, :] != exclude[rays, None]
+
+                found = hit.any(axis = 1)
+                blocked[rays[found]] = True
+                if occluder is not None:
+                    occluder[rays[found]] = objects[hit[found].argmax(axis = 1)]
+
+        rays = np.nonzero(~blocked)[0]
+        for i, obj in self.others:
+            if not len(rays):
+                break
+
+            t = kernel(obj, origins[rays], directions[rays])[0]
+
+            hit = t < max_distance[rays]
+            if exclude is not None:
+                hit &= exclude[rays] != i
+
+            blocked[rays[hit]] = True
+            if occluder is not None:
+                occluder[rays[hit]] = i
+            rays = rays[~hit]
+
+        return blocked
@@ -0,0 +1,156 @@
+import os
+import time
+import queue
+import pickle
+import threading
+from multiprocessing import Process, AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+# puerto por defecto del coordinador
+PORT = 6000
+
+# no tiene parámetros
+# clave aleatoria para un render, se escribe en hexadecimal para pasarla a worker.py --authkey
+def randomAuthkey():
+    return os.urandom(16).hex().encode()
+
+class Coordinator(object):
+    # (render, direccion, clave, tamaño del bloque, packet, tiempo maximo por bloque)
+    # reparte los bloques de la imagen entre los workers que se conectan por TCP
+    # la escena se serializa una sola vez y se envia a cada worker al conectarse
+    # si un worker se desconecta o tarda mas de timeout segundos, su bloque se reparte de nuevo
+    # los dos lados usan pickle, por eso solo escucha en localhost salvo que se pase otra direccion
+    # y sin clave se genera una aleatoria (authkey) que se imprime para los workers de otras maquinas
+    def __init__(self, r, address = ('localhost', PORT), authkey = None, tile_size = 32, packet = False, timeout = 600):
+        self.render = r
+        self.packet = packet
+        self.timeout = timeout
+
+        self.state = r.glSceneState()
+
+        self.jobs = queue.Queue()
+        for y in range(0, r.height, tile_size):
+            for x in range(0, r.width, tile_size):
+                self.jobs.put((x, y, min(x + tile_size, r.width), min(y + tile_size, r.height)))
+
+        self.pending = self.jobs.qsize()
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+
+        if authkey is None:
+            authkey = randomAuthkey()
+            print('clave de los workers: %s' % authkey.decode())
+        self.authkey = authkey
+
+        self.listener = Listener(address, authkey = authkey)
+        self.address = self.listener.address
+
+    # no tiene parámetros
+    # acepta workers hasta que todos los bloques esten listos
+    def run(self):
+        accept = threading.Thread(target = self.accept, daemon = True)
+        accept.start()
+
+        if self.pending:
+            self.finished.wait()
+
+        self.listener.close()
+
+    def accept(self):
+        while not self.finished.is_set():
+            try:
+                connection = self.listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                # el listener se cerro, la clave es incorrecta o se conecto otro programa
+                if self.finished.is_set():
+                    return
+                continue
+
+            threading.Thread(target = self.serve, args = (connection,), daemon = True).start()
+
+    # (conexion)
+    # envia la escena y luego un bloque a la vez al worker
+    def serve(self, connection):
+        tile = None
+
+        try:
+            connection.send_bytes(self.state)
+            connection.send(self.packet)
+
+            while not self.finished.is_set():
+                try:
+                    tile = self.jobs.get(timeout = 0.1)
+                except queue.Empty:
+                    continue
+
+                connection.send(tile)
+                if not connection.poll(self.timeout):
+                    raise TimeoutError(tile)
+
+                x0, y0, x1, y1 = tile
+                colors = connection.recv()
+
+                with self.lock:
+                    self.render.glWriteTile(x0, y0, x1, y1, colors)
+                    self.pending -= 1
+                    if self.pending == 0:
+                        self.finished.set()
+
+                tile = None
+
+            connection.send(None)
+        except (OSError, EOFError, TimeoutError, pickle.UnpicklingError):
+            # el worker murio, el bloque vuelve a la cola
+            if tile is not None:
+                self.jobs.put(tile)
+        finally:
+            connection.close()
+
+# (direccion, clave, reintentos)
+# se conecta al coordinador, recibe la escena y renderiza bloques hasta que ya no haya
+# si el coordinador todavia no esta escuchando se reintenta durante retry segundos
+def runWorker(address, authkey, retry = 0):
+    deadline = time.time() + retry
+    while True:
+        try:
+            connection = Client(address, authkey = authkey)
+            break
+        except ConnectionRefusedError:
+            if time.time() >= deadline:
+                raise
+            time.sleep(0.5)
+
+    try:
+        tracer = pickle.loads(connection.recv_bytes())
+        packet = connection.recv()
+
+        while True:
+            tile = connection.recv()
+            if tile is None:
+                break
+
+            connection.send(tracer.glRenderTile(*tile, packet = packet))
+    except (EOFError, OSError):
+        # el coordinador termino o cerro la conexion
+        pass
+    finally:
+        connection.close()
+
+# (direccion, clave, procesos, reintentos)
+# inicia varios workers locales, por ejemplo uno por nucleo
+def startWorkers(address, authkey, processes = 1, retry = 0):
+    workers = [Process(target = runWorker, args = (address, authkey, retry), daemon = True) for i in range(processes)]
+    for worker in workers:
+        worker.start()
+
+    return workers
+
+# (texto) - 'host:puerto' o 'puerto'
+# direccion para Listener o Client
+def parseAddress(text, host = 'localhost'):
+    if ':' in text:
+        host, port = text.rsplit(':', 1)
+    else:
+        port = text
+
+    return (host, int(port))
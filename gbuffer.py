@@ -0,0 +1,361 @@
+import numpy as np
+from gl import OPAQUE, quantize
+from sphere import Sphere, Cube, Plane
+from voxel import VoxelGrid
+from instance import Instance
+
+# margen alrededor de las cajas de los objetos que cambiaron
+PADDING = 0.01
+
+# (objeto)
+# datos de la geometria que se comparan entre renders
+# los objetos de tipos desconocidos solo cambian si se reemplazan
+def geometryKey(obj):
+    if type(obj) is Sphere:
+        return ('sphere', tuple(obj.center), obj.radius)
+    if type(obj) is Cube:
+        return ('cube', tuple(obj.faceMin), tuple(obj.faceMax))
+    if type(obj) is Plane:
+        return ('plane', tuple(obj.position), tuple(obj.normal))
+    if type(obj) is VoxelGrid:
+        return ('grid', tuple(obj.origin), obj.dimensions, obj.scale)
+    if type(obj) is Instance:
+        return ('instance', geometryKey(obj.geometry), tuple(obj.transform.ravel()))
+
+    return ('other', id(obj))
+
+# (objeto)
+# datos de los materiales del objeto (su paleta o su unico material)
+def materialKey(obj):
+    return tuple(
+        (m.diffuse, m.spec, m.ior, m.type, id(m.texture))
+        for m in getattr(obj, 'materials', None) or [obj.material]
+    )
+
+# (objeto)
+# caja (minimo, maximo) del objeto, infinita si no tiene bounds()
+def objectBox(obj):
+    bounds = obj.bounds() if hasattr(obj, 'bounds') else None
+    if bounds is None:
+        return (np.full(3, -np.inf), np.full(3, np.inf))
+
+    return (np.asarray(bounds[0], dtype = float), np.asarray(bounds[1], dtype = float))
+
+# (cuadricula, celdas anteriores)
+# caja de las celdas que cambiaron, None si ninguna cambio
+def cellsBox(grid, cells):
+    changed = np.argwhere(grid.cells != cells)
+    if not len(changed):
+        return None
+
+    origin = np.asarray(grid.origin)
+    return (origin + (changed.min(axis = 0) - 0.5) * grid.scale, origin + (changed.max(axis = 0) + 0.5) * grid.scale)
+
+# (origenes, direcciones, distancias maximas, minimo, maximo)
+# verdadero para los segmentos que tocan la caja (slab test)
+def segmentsHitBox(origins, directions, max_distance, boxMin, boxMax):
+    if np.isinf(boxMin).any() or np.isinf(boxMax).any():
+        return np.ones(len(origins), dtype = bool)
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        inverse = 1 / directions
+        t1 = (boxMin - PADDING - origins) * inverse
+        t2 = (boxMax + PADDING - origins) * inverse
+
+    # en los ejes paralelos el rayo esta dentro de la caja o no la toca
+    parallel = directions == 0
+    inside = (origins >= boxMin - PADDING) & (origins <= boxMax + PADDING)
+    t1 = np.where(parallel, np.where(inside, -np.inf, np.inf), t1)
+    t2 = np.where(parallel, np.where(inside, np.inf, -np.inf), t2)
+
+    tnear = np.minimum(t1, t2).max(axis = 1)
+    tfar = np.maximum(t1, t2).min(axis = 1)
+
+    return (tnear <= tfar) & (tfar >= 0) & (tnear <= max_distance)
+
+class GBuffer(object):
+    # (render)
+    # guarda por pixel el primer objeto que toca el rayo primario, el punto, la normal, el uv,
+    # el material y la visibilidad de cada luz. Los pixeles opacos se pueden sombrear de nuevo
+    # desde estos datos, los demas (reflectivos, transparentes y fondo) se trazan completos
+    def __init__(self, r):
+        self.render = r
+        self.view = None
+
+    ## ESTADO DE LA ESCENA ##
+
+    # no tiene parámetros
+    # todo lo que cambia los rayos primarios, si cambia se renderiza todo de nuevo
+    def viewKey(self):
+        r = self.render
+        rotation = None if r.cam_rotation is None else r.cam_rotation.tobytes()
+
+        return (r.width, r.height, tuple(r.cam_position), rotation, r.fov, r.max_depth, r.min_throughput, r.roulette, r.texture_filter)
+
+    # no tiene parámetros
+    # fondo de los rayos que no chocan (mapa de ambiente o color)
+    def backgroundKey(self):
+        r = self.render
+        return (id(r.env_map), r.clear_color)
+
+    # no tiene parámetros
+    # luces en el orden de RayTracer._packetLights: (posicion o direccion, color e intensidad)
+    # las luces con superficie aportan una entrada por muestra
+    def lightKeys(self):
+        r = self.render
+
+        lights = []
+        if r.directional_light:
+            light = r.directional_light
+            lights.append((tuple(light.direction), (light.color, light.intensity)))
+        for light in r.point_lights:
+            lights.append((tuple(light.position), (light.color, light.intensity, light.falloff)))
+        for light in r.area_lights:
+            lights.extend([(light.key(), (light.color, light.intensity))] * light.samples)
+
+        ambient = (r.ambient_light.strength, r.ambient_light.color) if r.ambient_light else None
+        return ambient, lights
+
+    # no tiene parámetros
+    # copia de lo necesario para comparar la escena en el siguiente render
+    def snapshot(self):
+        r = self.render
+
+        self.view = self.viewKey()
+        self.background = self.backgroundKey()
+        self.ambient, self.lights = self.lightKeys()
+        self.directional = r.directional_light is not None
+        self.selection = (r.light_threshold, r.light_samples)
+        self.objects = [
+            (geometryKey(obj), materialKey(obj), objectBox(obj), obj.cells.copy() if type(obj) is VoxelGrid else None)
+            for obj in r.scene
+        ]
+
+    ## RENDER ##
+
+    # no tiene parámetros
+    # renderiza lo que cambio desde el ultimo render, o todo la primera vez
+    # regresa {'traced': pixeles trazados, 'shaded': pixeles sombreados con los datos guardados}
+    def update(self):
+        r = self.render
+        n = r.width * r.height
+
+        if self.view is None or self.view != self.viewKey():
+            r.glCompileScene()
+            self.allocate(n)
+            self.trace(np.arange(n))
+            self.snapshot()
+            return {'traced': n, 'shaded': 0}
+
+        # objetos: los que se agregan al final son geometria nueva, si se quitan objetos
+        # cambian los indices y se renderiza todo de nuevo
+        scene = r.scene
+        old = self.objects
+        if len(scene) < len(old):
+            self.view = None
+            if r.bvh is not None:
+                r.glBuildBVH(r.bvh.leaf_size)
+            return self.update()
+
+        boxes = []
+        materials = []
+        for i, obj in enumerate(scene):
+            if i >= len(old):
+                boxes.append(objectBox(obj))
+                continue
+
+            geometry, material, box, cells = old[i]
+            if geometryKey(obj) != geometry:
+                boxes += [box, objectBox(obj)]
+            elif cells is not None:
+                changed = cellsBox(obj, cells)
+                if changed is not None:
+                    boxes.append(changed)
+
+            if materialKey(obj) != material:
+                materials.append(i)
+
+        # luces que se movieron (o todas si cambio la cantidad), solo sus rayos de sombra se repiten
+        ambient, lights = self.lightKeys()
+        if len(lights) != len(self.lights) or (r.directional_light is not None) != self.directional:
+            moved = list(range(len(lights)))
+        else:
+            moved = [k for k in range(len(lights)) if lights[k][0] != self.lights[k][0]]
+        # el umbral y la seleccion de luces solo cambian el sombreado, la visibilidad guardada es completa
+        relit = ambient != self.ambient or lights != self.lights or (r.light_threshold, r.light_samples) != self.selection
+
+        background = self.backgroundKey() != self.background
+
+        if not (boxes or materials or relit or background):
+            return {'traced': 0, 'shaded': 0}
+
+        if boxes and r.bvh is not None:
+            r.glBuildBVH(r.bvh.leaf_size)
+        r.glCompileScene()
+
+        # los reflectivos y transparentes dependen de toda la escena, el fondo solo del mapa de ambiente
+        trace = ~self.opaque & (self.index >= 0) if boxes or materials or relit else np.zeros(n, dtype = bool)
+        if background:
+            trace |= ~self.opaque
+
+        # pixeles cuyo rayo primario o rayos de sombra pasan por la geometria que cambio
+        if boxes:
+            origins, directions = self.primary(np.arange(n))
+            distance = np.where(self.index >= 0, self.distance, np.inf)
+            opaque = np.nonzero(self.opaque)[0]
+            shadow_lights = r._packetLights(self.point[opaque])
+
+            for boxMin, boxMax in boxes:
+                trace |= segmentsHitBox(origins, directions, distance, boxMin, boxMax)
+                for light_direction, light_distance in (light[:2] for light in shadow_lights):
+                    limit = np.inf if light_distance is None else light_distance
+                    trace[opaque] |= segmentsHitBox(self.point[opaque], light_direction, limit, boxMin, boxMax)
+
+        # con un material nuevo que no es opaco el pixel se traza completo
+        if materials:
+            changed = np.isin(self.index, materials) & self.opaque
+            mat_type = r.compiled.type[r.compiled.offsets[np.maximum(self.index, 0)] + self.local]
+            trace |= changed & (mat_type != OPAQUE)
+
+        traced = np.nonzero(trace)[0]
+        self.trace(traced)
+
+        # los demas pixeles opacos se sombrean con los datos guardados
+        shade = self.opaque & ~trace
+        if not relit:
+            shade &= np.isin(self.index, materials)
+        shaded = np.nonzero(shade)[0]
+
+        if len(shaded):
+            if moved:
+                self.visible[shaded] = self.visibility(shaded, moved, self.visible[shaded])
+            self.write(shaded, self.shade(shaded))
+
+        self.snapshot()
+        return {'traced': len(traced), 'shaded': len(shaded)}
+
+    # (pixeles)
+    # arreglos del G-buffer, un elemento por pixel (indice y * width + x)
+    def allocate(self, n):
+        self.index = np.full(n, -1)
+        self.distance = np.full(n, np.inf)
+        self.point = np.zeros((n, 3))
+        self.normal = np.zeros((n, 3))
+        self.uvs = np.full((n, 2), np.nan)
+        self.local = np.zeros(n, dtype = int)
+        self.opaque = np.zeros(n, dtype = bool)
+        self.visible = np.zeros((n, 0), dtype = bool)
+
+    # (pixeles)
+    # origenes y direcciones de los rayos primarios
+    def primary(self, pixels):
+        r = self.render
+        directions = r.glPrimaryDirectionPacket(pixels % r.width + 0.5, pixels // r.width + 0.5)
+        origins = np.broadcast_to(np.asarray(r.cam_position, dtype = float), directions.shape)
+
+        return origins, directions
+
+    # (pixeles)
+    # traza los rayos primarios de los pixeles, guarda sus datos y escribe su color
+    def trace(self, pixels):
+        r = self.render
+        scene = r.compiled
+
+        if self.visible.shape[1] != scene.light_count:
+            self.visible = np.zeros((len(self.index), scene.light_count), dtype = bool)
+
+        if not len(pixels):
+            return
+
+        origins, directions = self.primary(pixels)
+        colors = np.zeros((len(pixels), 3))
+
+        if r.max_depth > 0:
+            index, distance, normal, uvs, local = r.scene_intercept_packet(origins, directions)
+        else:
+            index = np.full(len(pixels), -1)
+            distance = np.full(len(pixels), np.inf)
+            normal = np.zeros((len(pixels), 3))
+            uvs = np.full((len(pixels), 2), np.nan)
+            local = np.zeros(len(pixels), dtype = int)
+
+        hit = index >= 0
+        opaque = hit.copy()
+        opaque[hit] = scene.type[scene.offsets[index[hit]] + local[hit]] == OPAQUE
+
+        self.index[pixels] = index
+        self.distance[pixels] = distance
+        self.point[pixels] = origins + np.where(hit, distance, 0)[:, None] * directions
+        self.normal[pixels] = normal
+        self.uvs[pixels] = uvs
+        self.local[pixels] = local
+        self.opaque[pixels] = opaque
+
+        # los pixeles opacos se sombrean desde el G-buffer, los demas con el arbol de rayos completo
+        if opaque.any():
+            selected = pixels[opaque]
+            self.visible[selected] = self.visibility(selected)
+            colors[opaque] = self.shade(selected)
+
+        if (~opaque).any():
+            colors[~opaque] = r.glCastRayPacket(origins[~opaque], directions[~opaque])
+
+        self.write(pixels, colors)
+
+    # (pixeles, luces, visibilidad anterior)
+    # rayos de sombra desde los puntos guardados, solo para las luces indicadas
+    def visibility(self, pixels, columns = None, visible = None):
+        r = self.render
+        point = self.point[pixels]
+        lights = r._packetLights(point)
+
+        result = r._visibilityPacket(point, self.exclude(pixels), lights, columns)
+        if visible is not None and columns is not None:
+            keep = np.ones(len(lights), dtype = bool)
+            keep[columns] = False
+            result[:, keep] = visible[:, keep]
+
+        return result
+
+    # (pixeles)
+    # objetos que ignoran los rayos de sombra, los concavos no se ignoran (igual que glShadePacket)
+    def exclude(self, pixels):
+        index = self.index[pixels]
+        return np.where(self.render.compiled.concave[index], -1, index)
+
+    # (pixeles) - solo pixeles opacos
+    # mismo sombreado que glShadePacket con la visibilidad guardada
+    def shade(self, pixels):
+        r = self.render
+        scene = r.compiled
+
+        mat_index = scene.offsets[self.index[pixels]] + self.local[pixels]
+        uvs = self.uvs[pixels]
+
+        final_color = r._shadePacket(self.point[pixels], self.normal[pixels], self.exclude(pixels), scene.spec[mat_index], self.visible[pixels])
+
+        textured = ~np.isnan(uvs[:, 0])
+        mat_texture = scene.texture[mat_index]
+        if textured.any() and r.texture_filter != 'nearest':
+            directions = self.primary(pixels)[1]
+        else:
+            directions = np.zeros((len(pixels), 3))
+
+        for k, texture in enumerate(scene.textures):
+            use = textured & (mat_texture == k)
+            if use.any():
+                selected = pixels[use]
+                final_color[use] *= r._texturePacket(
+                    texture, uvs[use], scene.uv_extent[self.index[selected]], self.distance[selected], directions[use], self.normal[selected]
+                )
+
+        return final_color * scene.diffuse[mat_index]
+
+    # (pixeles, colores RGB flotantes)
+    def write(self, pixels, colors):
+        r = self.render
+        ys = pixels // r.width
+        xs = pixels % r.width
+
+        r.radiance[ys, xs] = colors
+        r.pixels[ys, xs] = quantize(colors)
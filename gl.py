@@ -1,6 +1,14 @@
+import os
+import copy
+import time
 import struct
+import hashlib
+import pickle
 import random
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from bvh import BVH, rayOccluded, packetIntersect
+from lightgrid import LightGrid, selectLights, selectLightsArray
 from numpy import cos, sin, tan
 
 
@@ -16,6 +24,91 @@ def dword(d):
 def color(r, g, b):
     return bytes([round(b * 255), round(g * 255), round(r * 255)])
 
+# (color) - bytes en BGR
+# color como lista RGB flotante, el formato que usa glCastRay
+def colorRGB(c):
+    return [c[2] / 255, c[1] / 255, c[0] / 255]
+
+# (colores) - arreglo (..., 3) RGB flotante
+# unico punto donde los colores se limitan a [0, 1] y se convierten a bytes BGR del framebuffer
+def quantize(colors):
+    return np.round(np.clip(colors, 0, 1)[..., ::-1] * 255).astype(np.uint8)
+
+# (nombre del archivo, pixeles) - arreglo (alto, ancho, 3) en BGR
+# escribe un bmp de 24 bits con una sola escritura, cada fila se rellena a 4 bytes
+def writeBMP(filename, pixels):
+    height, width = pixels.shape[:2]
+    row_size = (width * 3 + 3) & ~3
+
+    data = np.zeros((height, row_size), dtype = np.uint8)
+    data[:, :width * 3] = pixels.reshape(height, width * 3)
+
+    header = b''.join([
+        # file header
+        char('B'),
+        char('M'),
+        dword(14 + 40 + row_size * height),
+        dword(0),
+        dword(14 + 40),
+
+        # image header
+        dword(40),
+        dword(width),
+        dword(height),
+        word(1),
+        word(24),
+        dword(0),
+        dword(row_size * height),
+        dword(0),
+        dword(0),
+        dword(0),
+        dword(0)
+    ])
+
+    with open(filename, 'wb') as file:
+        file.write(header + data.tobytes())
+
+# (nombre del archivo, colores) - arreglo (alto, ancho, 3) RGB flotante, la fila 0 es la de abajo
+# escribe una imagen Radiance .hdr (RGBE sin compresion), los valores pueden ser mayores a 1
+def writeHDR(filename, colors):
+    height, width = colors.shape[:2]
+
+    # las filas del archivo van de arriba hacia abajo
+    colors = np.maximum(colors[::-1].astype(float), 0)
+    brightest = colors.max(axis = 2)
+
+    mantissa, exponent = np.frexp(brightest)
+    visible = brightest > 1e-32
+    scale = np.where(visible, mantissa * 256 / np.where(visible, brightest, 1), 0)
+
+    data = np.zeros((height, width, 4), dtype = np.uint8)
+    data[:, :, :3] = np.minimum(colors * scale[:, :, None], 255)
+    data[:, :, 3] = np.where(visible, exponent + 128, 0)
+
+    header = '#?RADIANCE\nFORMAT=32-bit_rle_rgbe\n\n-Y %d +X %d\n' % (height, width)
+
+    with open(filename, 'wb') as file:
+        file.write(header.encode('ascii') + data.tobytes())
+
+# (objeto)
+# tamaño en el mundo que cubre el rango de uv [0, 1] de un objeto, para el nivel de detalle de las texturas
+def uvExtent(obj):
+    if hasattr(obj, 'radius'):
+        return 2 * np.pi * obj.radius
+    if hasattr(obj, 'size'):
+        return max(obj.size)
+    if hasattr(obj, 'scale'):
+        return obj.scale
+
+    return 1
+
+# (textura, tamaño del uv, distancias, cosenos, angulo de un pixel) - numeros o arreglos
+# nivel de detalle por distancia: log2 de los texeles que cubre el pixel en el punto de interseccion,
+# el ancho del pixel crece con la distancia y con la inclinacion de la superficie
+def textureLOD(texture, extent, distance, cosine, pixel_angle):
+    footprint = pixel_angle * distance / np.maximum(np.abs(cosine), 0.05) * texture.width / extent
+    return np.log2(np.maximum(footprint, 1e-12))
+
 # (a, b) - dos vectores de longitud 3
 # se calcula el producto cruz entre dos vectores a y b. (a x b)
 def mathCrossProduct(a, b):
@@ -186,12 +279,29 @@ def mathFresnel(N, I, ior):
     Rp = ((etai * cosi) - (etat * cost)) / ((etai * cosi) + (etat * cost))
     return (Rs * Rs + Rp * Rp) / 2
 
+# escena de cada proceso del render paralelo
+_tile_tracer = None
+
+# (estado) - escena serializada con glSceneState
+# se ejecuta una vez al iniciar cada proceso
+def _initTileWorker(state):
+    global _tile_tracer
+    _tile_tracer = pickle.loads(state)
+
+# (bloque) - (x0, y0, x1, y1, packet)
+def _renderTile(tile):
+    return _tile_tracer.glRenderTile(*tile)
+
 OPAQUE = 0
 REFLECTIVE = 1
 TRANSPARENT = 2
 BLACK = color(0, 0, 0)
 WHITE = color(1, 1, 1)
 
+# los rayos de sombra de las luces con superficie terminan un poco antes de cada muestra
+# para no chocar con el objeto que emite la luz (por ejemplo el cubo de un bloque de glowstone)
+SHADOW_BIAS = 0.001
+
 class RayTracer(object):
     def __init__(self, w, h):
         self.glInit(w, h)
@@ -212,6 +322,10 @@ class RayTracer(object):
         self.cam_position = [0, 0, 0]
         self.fov = 60
 
+        # orientacion de la cámara, matriz 3x3 con columnas derecha, arriba y atras
+        # None mira hacia -z, se calcula con glLookAt
+        self.cam_rotation = None
+
         # se almacenan los elementos de la escena (solamente se revisan los rays una vez)
         # ayuda a la optimizacion
         self.scene = []
@@ -221,9 +335,47 @@ class RayTracer(object):
         self.ambient_light = None
         self.directional_light = None
 
+        # luces con superficie (arealight.RectLight, SphereLight, BlockLight), sombras suaves
+        self.area_lights = []
+
+        # ultimo objeto que bloqueo cada luz, {id de la luz: (indice en la escena, objeto)}
+        # los rayos de sombra lo prueban primero antes de recorrer toda la escena
+        self.shadow_cache = {}
+
+        # seleccion de luces para escenas con muchas luces (antorchas, glowstone)
+        # con light_threshold las luces (o muestras) de espaldas al punto o con aporte menor al umbral
+        # se descartan antes de lanzar su rayo de sombra. Con light_samples las luces de punto que
+        # quedan se eligen al azar segun su aporte (light_samples por punto) y se escalan para que
+        # el promedio no cambie. light_grid (glBuildLightGrid) agrupa las luces por celdas
+        self.light_threshold = None
+        self.light_samples = None
+        self.light_grid = None
+
         # mapa de ambiente (opcional)
         self.env_map = None
 
+        # jerarquia de volumenes (opcional), se construye con glBuildBVH
+        self.bvh = None
+
+        # instrumentacion (opcional), se activa con glProfiler
+        self.profiler = None
+
+        # profundidad maxima de reflexiones y refracciones, los rayos que llegan a ella usan el
+        # mapa de ambiente. Los rayos con throughput menor a min_throughput se descartan,
+        # con roulette sobreviven algunos al azar con su peso aumentado (ruleta rusa)
+        self.max_depth = 3
+        self.min_throughput = 0
+        self.roulette = False
+
+        # escena en arreglos para el modo por paquetes, se construye con glCompileScene
+        self.compiled = None
+
+        # filtro de las texturas: 'nearest', 'bilinear' o 'trilinear' (mip-maps con nivel de detalle por distancia)
+        self.texture_filter = 'nearest'
+
+        # G-buffer del ultimo render incremental (gbuffer.GBuffer), glRayTracingRenderIncremental
+        self.gbuffer = None
+
     # (width, height)
     # se inicializa el framebuffer con la altura y ancho indicados
     def glCreateWindow(self, w, h):
@@ -242,10 +394,16 @@ class RayTracer(object):
     # no tiene parametros
     # se llena el mapa de bits con el color seleccionado
     def glClear(self):
-        self.pixels = [[self.clear_color for x in range(self.width)] for y in range(self.height)]
+        # framebuffer contiguo (alto, ancho, 3) en BGR
+        self.pixels = np.empty((self.height, self.width, 3), dtype = np.uint8)
+        self.pixels[:] = np.frombuffer(self.clear_color, dtype = np.uint8)
+
+        # colores RGB flotantes sin limitar de los modos de ray tracing (para glFinishHDR)
+        self.radiance = np.empty((self.height, self.width, 3), dtype = np.float32)
+        self.radiance[:] = colorRGB(self.clear_color)
 
         #Z - buffer, depthbuffer, buffer de profudidad
-        self.zbuffer = [ [ 10000 for x in range(self.width)] for y in range(self.height) ]
+        self.zbuffer = np.full((self.height, self.width), 10000, dtype = np.float32)
 
     # (r, g, b) - valores entre 0 y 1
     # define el color con el que se realiza el clear
@@ -306,12 +464,12 @@ class RayTracer(object):
     # dibuja el contorno del viewport 
     def glDrawViewPort(self):
         for x in range(self.vp_start_point_x, self.vp_start_point_x + self.vp_width):
-            self.pixels[self.vp_start_point_y][x] = color(255, 0, 251)
-            self.pixels[self.vp_start_point_y + self.vp_height][x] = color(255, 0, 251)
+            self.pixels[self.vp_start_point_y][x] = np.frombuffer(color(255, 0, 251), dtype = np.uint8)
+            self.pixels[self.vp_start_point_y + self.vp_height][x] = np.frombuffer(color(255, 0, 251), dtype = np.uint8)
         
         for y in range(self.vp_start_point_y, self.vp_start_point_y + self.vp_height):
-            self.pixels[y][self.vp_start_point_x] = color(255, 0, 251)
-            self.pixels[y][self.vp_start_point_x + self.vp_width] = color(255, 0, 251)
+            self.pixels[y][self.vp_start_point_x] = np.frombuffer(color(255, 0, 251), dtype = np.uint8)
+            self.pixels[y][self.vp_start_point_x + self.vp_width] = np.frombuffer(color(255, 0, 251), dtype = np.uint8)
 
     # (x, y) - valores entre -1 y 1
     # se crea un punto dentro del viewport
@@ -322,38 +480,280 @@ class RayTracer(object):
         else:
             new_x = (x + 1) * (self.vp_width / 2) + self.vp_start_point_x
             new_y = (y + 1) * (self.vp_height / 2) + self.vp_start_point_y
-            self.pixels[round(new_y - 1) if round(new_y) == self.vp_height else round(new_y)][round(new_x - 1) if round(new_x) == self.vp_width else round(new_x)] = self.point_color
+            self.pixels[round(new_y - 1) if round(new_y) == self.vp_height else round(new_y)][round(new_x - 1) if round(new_x) == self.vp_width else round(new_x)] = np.frombuffer(self.point_color, dtype = np.uint8)
 
             return True
 
     # (x, y) - coordenadas
     # recibe las coordenadas en pixeles para dibujar 
     def glVertexNDC(self, x, y, color = None):
-        self.pixels[(y - 1) if y == self.vp_height else y][(x - 1) if x == self.vp_width else x] = color or self.point_color
+        self.pixels[(y - 1) if y == self.vp_height else y, (x - 1) if x == self.vp_width else x] = np.frombuffer(color or self.point_color, dtype = np.uint8)
+
+    # (x, y, color) - coordenadas en pixeles y color RGB flotante
+    # guarda el color sin limitar en radiance y cuantizado en el framebuffer
+    def glVertexRadiance(self, x, y, rgb):
+        self.radiance[y, x] = rgb
+        self.pixels[y, x] = quantize(np.asarray(rgb))
     
     # no recibe parámetros
     # revisión de rayos para dibujar o no el pixel
     def glRayTracingRender(self):
         for y in range(self.height):
             for x in range(self.width):
+                direction = self.glPrimaryDirection(x + 0.5, y + 0.5)
+
+                self.glVertexRadiance(x, y, self.glCastRay(self.cam_position, direction))
+
+    # (x, y) - coordenadas del framebuffer, el centro del pixel es (x + 0.5, y + 0.5)
+    # calcula la direccion del rayo primario que sale de la cámara
+    def glPrimaryDirection(self, x, y):
+        # campo de vision
+        t = tan((self.fov * np.pi / 180) / 2)
+        r = t * self.width / self.height
+
+        # coordenadas NDC 
+        px = (2 * (x / self.width) - 1) * r
+        py = (2 * (y / self.height) - 1) * t
+
+        #  direccion de la cámara
+        direction = [px, py, -1]
+        if self.cam_rotation is not None:
+            direction = (self.cam_rotation @ direction).tolist()
+
+        return mathLinalgNormal(direction)
+
+    # (xs, ys) - arreglos de coordenadas del framebuffer
+    # version por paquetes de glPrimaryDirection, regresa un arreglo (N, 3)
+    def glPrimaryDirectionPacket(self, xs, ys):
+        t = tan((self.fov * np.pi / 180) / 2)
+        r = t * self.width / self.height
+
+        directions = np.empty((len(xs), 3))
+        directions[:, 0] = (2 * (xs / self.width) - 1) * r
+        directions[:, 1] = (2 * (ys / self.height) - 1) * t
+        directions[:, 2] = -1
+        if self.cam_rotation is not None:
+            directions = directions @ self.cam_rotation.T
+        directions /= np.linalg.norm(directions, axis = 1)[:, None]
+
+        return directions
+
+    # (posicion, objetivo, arriba)
+    # coloca la cámara en posicion mirando hacia objetivo
+    # si la cámara mira en la direccion de arriba (por ejemplo una toma desde arriba) se usa otro vector
+    def glLookAt(self, eye, target, up = [0, 1, 0]):
+        forward = np.asarray(target, dtype = float) - np.asarray(eye, dtype = float)
+        length = np.linalg.norm(forward)
+        if length == 0:
+            raise ValueError('glLookAt: la posicion y el objetivo son el mismo punto')
+        forward /= length
+
+        for axis in (up, [0, 0, 1], [1, 0, 0]):
+            right = np.cross(forward, np.asarray(axis, dtype = float))
+            length = np.linalg.norm(right)
+            if length > 1e-9 * np.linalg.norm(axis):
+                break
+        right /= length
+
+        self.cam_position = [float(x) for x in eye]
+        self.cam_rotation = np.column_stack([right, np.cross(right, forward), -forward])
+
+    # (x0, y0, x1, y1) - esquinas del bloque, (packet) - usar el modo por paquetes
+    # renderiza un bloque del framebuffer y regresa un arreglo (alto, ancho, 3) RGB flotante
+    def glRenderTile(self, x0, y0, x1, y1, packet = False):
+        tile = np.empty((y1 - y0, x1 - x0, 3), dtype = np.float32)
+
+        if packet:
+            ys, xs = np.mgrid[y0:y1, x0:x1]
+            directions = self.glPrimaryDirectionPacket(xs.ravel() + 0.5, ys.ravel() + 0.5)
+            origins = np.broadcast_to(np.asarray(self.cam_position, dtype = float), directions.shape)
+
+            tile[:] = self.glCastRayPacket(origins, directions).reshape(tile.shape)
+
+            return tile
+
+        for y in range(y0, y1):
+            for x in range(x0, x1):
+                direction = self.glPrimaryDirection(x + 0.5, y + 0.5)
+                tile[y - y0, x - x0] = self.glCastRay(self.cam_position, direction)
+
+        return tile
+
+    # (x0, y0, x1, y1, colores) - esquinas del bloque y arreglo (alto, ancho, 3) RGB flotante
+    # copia un bloque a radiance y al framebuffer
+    def glWriteTile(self, x0, y0, x1, y1, tile):
+        self.radiance[y0:y1, x0:x1] = tile
+        self.pixels[y0:y1, x0:x1] = quantize(tile)
+
+    # (workers, tamaño del bloque, packet)
+    # renderiza la escena repartiendo bloques entre varios procesos
+    # la escena se envia una sola vez a cada proceso
+    def glRayTracingRenderParallel(self, workers = None, tile_size = 32, packet = False):
+        tiles = [
+            (x, y, min(x + tile_size, self.width), min(y + tile_size, self.height), packet)
+            for y in range(0, self.height, tile_size)
+            for x in range(0, self.width, tile_size)
+        ]
+
+        with ProcessPoolExecutor(max_workers = workers or os.cpu_count(), initializer = _initTileWorker, initargs = (self.glSceneState(),)) as executor:
+            for (x0, y0, x1, y1, _), tile in zip(tiles, executor.map(_renderTile, tiles)):
+                self.glWriteTile(x0, y0, x1, y1, tile)
+
+    # (direccion, clave, tamaño del bloque, packet, workers locales, tiempo maximo por bloque)
+    # modo granja: un coordinador reparte bloques por TCP a workers en esta u otras maquinas
+    # (python worker.py host:puerto), si un worker muere sus bloques se reparten de nuevo
+    # workers inicia esa cantidad de workers locales ademas de los que se conecten
+    # por defecto solo escucha en localhost, para otras maquinas se pasa address = ('', 6000)
+    # sin authkey se genera una clave aleatoria y se imprime para worker.py --authkey
+    def glRayTracingRenderFarm(self, address = ('localhost', 6000), authkey = None, tile_size = 32, packet = False, workers = 0, timeout = 600):
+        from farm import Coordinator, startWorkers
+
+        coordinator = Coordinator(self, address, authkey, tile_size, packet, timeout)
+
+        local = startWorkers(('localhost', coordinator.address[1]), coordinator.authkey, workers) if workers else []
+        coordinator.run()
+
+        for worker in local:
+            worker.join()
+
+    # no tiene parámetros
+    # serializa la escena sin el framebuffer para enviarla a otros procesos
+    def glSceneState(self):
+        state = copy.copy(self)
+        state.pixels = None
+        state.radiance = None
+        state.zbuffer = None
+
+        # cada proceso vuelve a compilar la escena si la necesita
+        state.compiled = None
+        state.gbuffer = None
+        state.shadow_cache = {}
+
+        return pickle.dumps(state, protocol = pickle.HIGHEST_PROTOCOL)
+
+    # (xs, ys, packet) - coordenadas continuas del framebuffer
+    # lanza un rayo primario por cada coordenada y regresa colores RGB flotantes (N, 3)
+    def glSample(self, xs, ys, packet = False):
+        if packet:
+            directions = self.glPrimaryDirectionPacket(xs, ys)
+            origins = np.broadcast_to(np.asarray(self.cam_position, dtype = float), directions.shape)
+            return self.glCastRayPacket(origins, directions)
+
+        colors = np.empty((len(xs), 3))
+        for i in range(len(xs)):
+            colors[i] = self.glCastRay(self.cam_position, self.glPrimaryDirection(xs[i], ys[i]))
+
+        return colors
+
+    # (muestras maximas, umbral, packet, semilla)
+    # anti-aliasing adaptativo, primero se lanza un rayo por pixel y solo en los pixeles
+    # cuyo color difiere de algun vecino mas que el umbral se lanzan muestras extra
+    # estratificadas con jitter, hasta max_samples por pixel
+    def glRayTracingRenderAA(self, max_samples = 16, threshold = 0.1, packet = False, seed = None):
+        rng = np.random.default_rng(seed)
+        if packet:
+            self.glCompileScene()
+
+        ys, xs = np.mgrid[0:self.height, 0:self.width]
+        image = self.glSample(xs.ravel() + 0.5, ys.ravel() + 0.5, packet).reshape(self.height, self.width, 3)
+
+        # diferencia maxima con los 8 vecinos
+        padded = np.pad(image, ((1, 1), (1, 1), (0, 0)), mode = 'edge')
+        contrast = np.zeros((self.height, self.width))
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                neighbour = padded[1 + dy:1 + dy + self.height, 1 + dx:1 + dx + self.width]
+                contrast = np.maximum(contrast, np.abs(neighbour - image).max(axis = 2))
+
+        py, px = np.nonzero(contrast > threshold)
+
+        # cuadricula de k x k estratos, la muestra del centro cuenta como una mas
+        k = int((max_samples - 1) ** 0.5)
+        if len(px) and k > 0:
+            sy, sx = np.mgrid[0:k, 0:k]
+            sx = sx.ravel()
+            sy = sy.ravel()
+
+            # todas las muestras extra (pixel, estrato) en un solo arreglo
+            jitter = rng.random((len(px), k * k, 2))
+            sample_x = (px[:, None] + (sx[None, :] + jitter[:, :, 0]) / k).ravel()
+            sample_y = (py[:, None] + (sy[None, :] + jitter[:, :, 1]) / k).ravel()
+
+            samples = self.glSample(sample_x, sample_y, packet).reshape(len(px), k * k, 3)
+            image[py, px] = (image[py, px] + samples.sum(axis = 1)) / (1 + k * k)
+
+        self.glWriteTile(0, 0, self.width, self.height, image)
+
+        return len(px)
+
+    # (nombre del archivo, checkpoint, tamaño del bloque, paso de la vista previa, intervalo, packet)
+    # render progresivo, primero una vista previa con un rayo cada coarse pixeles y luego
+    # cada bloque a resolucion completa. Cada interval segundos se escribe el bmp parcial
+    # y un checkpoint con los bloques terminados, si el proceso muere el render continua
+    # desde el checkpoint la siguiente vez que se llama con los mismos parametros
+    def glRayTracingRenderProgressive(self, filename, checkpoint = None, tile_size = 32, coarse = 8, interval = 30, packet = False):
+        checkpoint = checkpoint or filename + '.ckpt'
+        fingerprint = hashlib.sha1(self.glSceneState()).hexdigest()
+        if packet:
+            self.glCompileScene()
+
+        tiles = [
+            (x, y, min(x + tile_size, self.width), min(y + tile_size, self.height))
+            for y in range(0, self.height, tile_size)
+            for x in range(0, self.width, tile_size)
+        ]
+        done = np.zeros(len(tiles), dtype = bool)
+        preview = False
+
+        if os.path.exists(checkpoint):
+            with np.load(checkpoint) as data:
+                if (str(data['fingerprint']) == fingerprint and data['radiance'].shape == self.radiance.shape
+                    and len(data['done']) == len(tiles)):
+                    self.glWriteTile(0, 0, self.width, self.height, data['radiance'])
+                    done = data['done'].copy()
+                    preview = True
+
+        # vista previa, un rayo por bloque de coarse x coarse pixeles
+        if not preview:
+            ys, xs = np.mgrid[0:self.height:coarse, 0:self.width:coarse]
+            colors = self.glSample(xs.ravel() + coarse / 2, ys.ravel() + coarse / 2, packet)
+            colors = colors.reshape(xs.shape + (3,))
+
+            self.glWriteTile(0, 0, self.width, self.height, np.repeat(np.repeat(colors, coarse, axis = 0), coarse, axis = 1)[:self.height, :self.width])
+            self._saveProgress(filename, checkpoint, fingerprint, done)
 
-                # campo de vision
-                t = tan((self.fov * np.pi / 180) / 2)
-                r = t * self.width / self.height
+        last_save = time.time()
+        for i, (x0, y0, x1, y1) in enumerate(tiles):
+            if done[i]:
+                continue
 
-                # coordenadas NDC 
-                px = (2 * ((x + 0.5) / self.width) - 1) * r
-                py = (2 * ((y + 0.5) / self.height) - 1) * t
+            self.glWriteTile(x0, y0, x1, y1, self.glRenderTile(x0, y0, x1, y1, packet))
+            done[i] = True
 
-                #  direccion de la cámara
-                direction = [px, py, -1]
-                direction = mathLinalgNormal(direction)
+            if time.time() - last_save >= interval:
+                self._saveProgress(filename, checkpoint, fingerprint, done)
+                last_save = time.time()
 
-                self.glVertexNDC(x, y, self.glCastRay(self.cam_position, direction))
+        self.glFinish(filename)
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+    # (nombre del archivo, checkpoint, huella de la escena, bloques terminados)
+    # escribe el bmp parcial y reemplaza el checkpoint de forma atomica
+    def _saveProgress(self, filename, checkpoint, fingerprint, done):
+        self.glFinish(filename)
+
+        with open(checkpoint + '.tmp', 'wb') as file:
+            np.savez(file, radiance = self.radiance, done = done, fingerprint = fingerprint)
+
+        os.replace(checkpoint + '.tmp', checkpoint)
 
     # (origen, direccion, objeto de origen)
     # calcula las intercepciones de los rayos con otros objetos de la escena
     def scene_intercept(self, origin, direction, origin_object = None):
+        if self.bvh is not None:
+            return self.bvh.intersect(origin, direction, origin_object)
+
         tempZbuffer = float('inf')
         material = None
         intersect = None
@@ -365,27 +765,126 @@ class RayTracer(object):
                 if hit is not None:
                     if hit.distance < tempZbuffer:
                         tempZbuffer = hit.distance
-                        material = obj.material
+                        material = hit.material or obj.material
                         intersect = hit
 
         return material, intersect
 
+    # (origen, direccion, distancia maxima, objeto de origen, luz)
+    # revisa si algun objeto bloquea el rayo antes de max_distance (rayos de sombra)
+    # termina con el primer objeto que lo bloquea y no calcula datos de sombreado
+    # con light el ultimo objeto que bloqueo esa luz se prueba primero (shadow_cache),
+    # los puntos vecinos suelen tener el mismo bloqueador y se resuelven con una sola prueba
+    def scene_occluded(self, origin, direction, max_distance = float('inf'), origin_object = None, light = None):
+        if light is not None:
+            cached = self.shadow_cache.get(id(light))
+            if cached is not None:
+                index, obj = cached
+                # el objeto guardado solo se usa si sigue en la escena
+                if index < len(self.scene) and self.scene[index] is obj and obj is not origin_object and rayOccluded(obj, origin, direction, max_distance):
+                    return True
+
+        if self.bvh is not None:
+            occluder = self.bvh.occluder(origin, direction, max_distance, origin_object)
+        else:
+            occluder = None
+            for index, obj in enumerate(self.scene):
+                if obj is not origin_object and rayOccluded(obj, origin, direction, max_distance):
+                    occluder = (index, obj)
+                    break
+
+        if occluder is None:
+            return False
+
+        if light is not None:
+            self.shadow_cache[id(light)] = occluder
+        return True
+
+    # (origen, direccion, objeto de origen, profundidad inicial)
+    # color RGB flotante del rayo, sin limitar a 1 (se cuantiza al escribir el framebuffer)
+    # el arbol de reflexiones y refracciones se recorre con una pila en lugar de recursion,
+    # cada rayo lleva su throughput (aporte maximo al color final) y los rayos hijos con
+    # throughput menor a min_throughput se descartan o pasan por ruleta rusa (roulette)
     def glCastRay(self, origin, direction, origin_object = None, recursion = 0):
-        
-        material, intersect = self.scene_intercept(origin, direction, origin_object)
+        # nodos del arbol: [color propio, tintes, padre, peso, suma de los hijos]
+        nodes = []
+        stack = [(origin, direction, origin_object, recursion, 1, -1, 1)]
+
+        while stack:
+            origin, direction, origin_object, depth, throughput, parent, weight = stack.pop()
+            color, tints, children = self.glShadeRay(origin, direction, origin_object, depth)
+
+            index = len(nodes)
+            nodes.append([color, tints, parent, weight, None])
+
+            if not children:
+                continue
+
+            tint = [1, 1, 1]
+            for t in tints:
+                tint = mathVectorMultiplication(tint, t)
+            factor = throughput * max(tint)
+
+            for k, child_origin, child_direction, child_object in children:
+                child_throughput = factor * k
+
+                if child_throughput < self.min_throughput:
+                    # ruleta rusa: sobrevive con probabilidad child_throughput / min_throughput
+                    if not self.roulette or random.random() * self.min_throughput >= child_throughput:
+                        continue
+
+                    k = k * self.min_throughput / child_throughput
+                    child_throughput = self.min_throughput
+
+                stack.append((child_origin, child_direction, child_object, depth + 1, child_throughput, index, k))
+
+        # los hijos siempre estan despues de su padre, se combinan de atras hacia adelante
+        for index in range(len(nodes) - 1, -1, -1):
+            color, tints, parent, weight, total = nodes[index]
+
+            if tints is not None:
+                total = total or [0, 0, 0]
+                for t in tints:
+                    total = mathVectorMultiplication(total, t)
+                color = mathVectorAdd(color, total)
+
+            if parent < 0:
+                return color
+
+            # igual que antes, el color de cada rayo secundario se limita a 1
+            contribution = mathVectorTimesScalar(weight, [min(1, c) for c in color])
+            nodes[parent][4] = contribution if nodes[parent][4] is None else mathVectorAdd(nodes[parent][4], contribution)
+
+    # (textura, interseccion, direccion del rayo)
+    # color de la textura en el uv de la interseccion con el filtro texture_filter, en bytes BGR
+    def _textureColor(self, texture, intersect, direction):
+        if self.texture_filter == 'nearest':
+            return texture.getColor(intersect.texture[0], intersect.texture[1])
+
+        color = self._texturePacket(
+            texture, np.array([intersect.texture], dtype = float), np.array([uvExtent(intersect.scene_object)]),
+            np.array([intersect.distance]), np.array([direction], dtype = float), np.array([intersect.normal], dtype = float)
+        )
+        return bytes(np.round(color[0, ::-1] * 255).astype(np.uint8))
+
+    # (origen, direccion, objeto de origen, profundidad)
+    # sombrea un solo rayo, regresa (color propio, tintes, rayos hijos)
+    # el color final es color + (suma de peso * hijo) multiplicada por cada tinte
+    # los rayos hijos son (peso, origen, direccion, objeto de origen)
+    def glShadeRay(self, origin, direction, origin_object = None, depth = 0):
+        if depth >= self.max_depth:
+            material = None
+        else:
+            material, intersect = self.scene_intercept(origin, direction, origin_object)
 
-        if material is None or recursion >= 3:
+        if material is None:
             if self.env_map:
-                return self.env_map.getColor(direction)
-            return self.clear_color
+                return colorRGB(self.env_map.getColor(direction)), None, []
+            return colorRGB(self.clear_color), None, []
 
-        object_color = [
-            material.diffuse[2] / 255,
-            material.diffuse[1] / 255,
-            material.diffuse[0] / 255,
-        ]
+        object_color = colorRGB(material.diffuse)
 
-        ambient_color = directional_light_color = point_light_color = reflect_color = refract_color = final_color = [0, 0, 0]
+        ambient_color = directional_light_color = point_light_color = final_color = [0, 0, 0]
 
         view_direction = mathLinalgNormal(mathVectorSubstraction(self.cam_position, intersect.point))
 
@@ -422,15 +921,16 @@ class RayTracer(object):
                 spec_intensity * self.directional_light.color[0] / 255,
             ]
 
-            shadow_material, shadow_intercept = self.scene_intercept(intersect.point, light_direction, intersect.scene_object)
-            if shadow_intercept is not None:
+            if self.scene_occluded(intersect.point, light_direction, origin_object = intersect.scene_object, light = self.directional_light):
                 shadow_intensity = 1
 
             directional_light_color = mathVectorTimesScalar((1 - shadow_intensity), mathVectorAdd(diffuse_color, spec_color))
 
-        for point_light in self.point_lights:
+        # primero se calcula el aporte de cada luz de punto sin sombra, solo las que quedan despues
+        # de _selectLights lanzan su rayo de sombra
+        candidates = []
+        for point_light in self.point_lights if self.light_grid is None else self.light_grid.query(intersect.point):
             diffuse_color = spec_color = [0, 0, 0]
-            shadow_intensity = 0
 
             light_direction = mathVectorSubstraction(point_light.position, intersect.point)
             light_direction = mathLinalgNormal(light_direction)
@@ -454,52 +954,63 @@ class RayTracer(object):
                 spec_intensity * point_light.color[0] / 255,
             ]
 
-            shadow_material, shadow_intercept = self.scene_intercept(intersect.point, light_direction, intersect.scene_object)
+            light_distance = mathFrobenius(mathVectorSubstraction(point_light.position, intersect.point))
 
-            if shadow_intercept is not None and shadow_intercept.distance < mathFrobenius(mathVectorSubstraction(point_light.position, intersect.point)):
-                shadow_intensity = 1
+            light_sum = mathVectorAdd(diffuse_color, spec_color)
+            if point_light.falloff:
+                light_sum = mathVectorTimesScalar(1 / (1 + point_light.falloff * light_distance ** 2), light_sum)
 
-            to_add = mathVectorTimesScalar((1 - shadow_intensity), mathVectorAdd(diffuse_color, spec_color))
-            point_light_color = mathVectorAdd(point_light_color, to_add)
+            candidates.append((point_light, light_direction, light_distance, light_sum, dot))
+
+        for (point_light, light_direction, light_distance, light_sum, dot), scale in zip(candidates, self._selectLights(intersect.point, candidates)):
+            if scale and not self.scene_occluded(intersect.point, light_direction, light_distance, intersect.scene_object, point_light):
+                point_light_color = mathVectorAdd(point_light_color, mathVectorTimesScalar(scale, light_sum))
+
+        # cada muestra de una luz con superficie es una luz de punto con parte de la intensidad
+        for area_light in self.area_lights:
+            positions, weights = area_light.points(np.array([intersect.point], dtype = float))
+            light_color = colorRGB(area_light.color)
+
+            for position, weight in zip(positions[0].tolist(), weights[0].tolist()):
+                light_direction = mathVectorSubstraction(position, intersect.point)
+                light_distance = mathFrobenius(light_direction)
+                light_direction = mathLinalgNormal(light_direction)
+
+                dot = mathDotProduct(light_direction, intersect.normal)
+                intensity = 0 if dot < 0 else dot
+
+                reflect = mathReflectVector(intersect.normal, light_direction)
+                spec_intensity = max(0, mathDotProduct(view_direction, reflect)) ** material.spec
+
+                coefficient = weight * area_light.intensity * (intensity + spec_intensity)
+                if not self._lightActive(coefficient * max(light_color), dot):
+                    continue
+
+                if not self.scene_occluded(intersect.point, light_direction, light_distance - SHADOW_BIAS, intersect.scene_object, area_light):
+                    point_light_color = mathVectorAdd(point_light_color, mathVectorTimesScalar(coefficient, light_color))
 
         if material.type == OPAQUE:
             final_color = mathVectorAdd(ambient_color, mathVectorAdd(directional_light_color, point_light_color))
 
             if material.texture and intersect.texture:
 
-                texture_color = material.texture.getColor(intersect.texture[0], intersect.texture[1])
-
-                texture_color = [
-                    texture_color[2] / 255,
-                    texture_color[1] / 255,
-                    texture_color[0] / 255
-                ]
+                texture_color = colorRGB(self._textureColor(material.texture, intersect, direction))
 
                 final_color = mathVectorMultiplication(final_color, texture_color)
 
+            return mathVectorMultiplication(final_color, object_color), None, []
+
         elif material.type == REFLECTIVE:
             reflect = mathReflectVector(intersect.normal, mathVectorTimesScalar(-1, direction))
-            reflect_color = self.glCastRay(intersect.point, reflect, intersect.scene_object, recursion + 1)
-            reflect_color = [
-                reflect_color[2] / 255,
-                reflect_color[1] / 255,
-                reflect_color[0] / 255
-            ]
+            tints = [object_color]
 
             if material.texture and intersect.texture:
 
-                texture_color = material.texture.getColor(intersect.texture[0], intersect.texture[1])
+                texture_color = colorRGB(self._textureColor(material.texture, intersect, direction))
 
-                texture_color = [
-                    texture_color[2] / 255,
-                    texture_color[1] / 255,
-                    texture_color[0] / 255
-                ]
+                tints = [texture_color, object_color]
 
-                final_color = mathVectorMultiplication(reflect_color, texture_color)
-            
-            else: 
-                final_color = reflect_color
+            return final_color, tints, [(1, intersect.point, reflect, intersect.scene_object)]
 
         elif material.type == TRANSPARENT:
             
@@ -509,110 +1020,566 @@ class RayTracer(object):
 
             reflect = mathReflectVector(intersect.normal, mathVectorTimesScalar(-1, direction))
             reflect_origin = mathVectorAdd(intersect.point, bias) if outside else mathVectorSubstraction(intersect.point, bias)
-            reflect_color = self.glCastRay(reflect_origin, reflect, None, recursion + 1)
-            reflect_color = [
-                reflect_color[2] / 255,
-                reflect_color[1] / 255,
-                reflect_color[0] / 255
-            ]
+            children = [(kr, reflect_origin, reflect, None)]
 
             if kr < 1:
                 refract = mathRefractVector(intersect.normal, direction, material.ior)
                 refract_origin = mathVectorSubstraction(intersect.point, bias) if outside else mathVectorAdd(intersect.point, bias)
-                refract_color = self.glCastRay(refract_origin, refract, None, recursion + 1)
-                refract_color = [
-                    refract_color[2] / 255,
-                    refract_color[1] / 255,
-                    refract_color[0] / 255
-                ]
+                children.append(((1 - kr), refract_origin, refract, None))
+
+            return final_color, [object_color], children
 
-            final_color = mathVectorAdd(mathVectorTimesScalar(kr, reflect_color), mathVectorTimesScalar((1 - kr), refract_color))
+        return mathVectorMultiplication(final_color, object_color), None, []
 
-        final_color = mathVectorMultiplication(final_color, object_color)
+    # (tamaño del paquete, compilar) - cantidad de rayos que se procesan juntos
+    # version vectorizada de glRayTracingRender, los rayos primarios se
+    # generan como arreglos (N, 3) y se intersectan y sombrean por paquetes
+    # con compile = False se usa la escena compilada existente (por ejemplo entre cuadros)
+    def glRayTracingRenderPacket(self, packet_size = 65536, compile = True):
+        ys, xs = np.mgrid[0:self.height, 0:self.width]
+        xs = xs.ravel()
+        ys = ys.ravel()
 
-        r = min(1, final_color[0])
-        g = min(1, final_color[1])
-        b = min(1, final_color[2])
+        directions = self.glPrimaryDirectionPacket(xs + 0.5, ys + 0.5)
+        if compile or self.compiled is None:
+            self.glCompileScene()
 
-        return color(r, g, b)
+        for start in range(0, len(xs), packet_size):
+            end = start + packet_size
+            origins = np.broadcast_to(np.asarray(self.cam_position, dtype = float), directions[start:end].shape)
+
+            colors = self.glCastRayPacket(origins, directions[start:end])
+            self.radiance[ys[start:end], xs[start:end]] = colors
+            self.pixels[ys[start:end], xs[start:end]] = quantize(colors)
 
     # no tiene parámetros
-    # renderiza el mapa de bits
-    def glFinish(self, filename):
-        file = open(filename, 'wb')
+    # render por paquetes que guarda un G-buffer (gbuffer.GBuffer) con el primer objeto de cada pixel
+    # y la visibilidad de cada luz. En las siguientes llamadas solo se vuelve a calcular lo que cambio:
+    # si solo cambian luces o materiales opacos se sombrea de nuevo sin lanzar rayos, y si cambia la
+    # geometria se lanzan de nuevo los pixeles cuyo rayo o rayos de sombra pasan por el objeto
+    # regresa un diccionario {'traced': pixeles trazados, 'shaded': pixeles sombreados sin lanzar rayos}
+    def glRayTracingRenderIncremental(self):
+        from gbuffer import GBuffer
+
+        if self.gbuffer is None:
+            self.gbuffer = GBuffer(self)
+
+        return self.gbuffer.update()
+
+    # (aporte maximo, producto punto con la normal)
+    # una luz sin aporte nunca lanza su rayo de sombra, con light_threshold tampoco
+    # las que estan de espaldas al punto o aportan menos del umbral
+    def _lightActive(self, bound, dot):
+        if self.light_threshold is None:
+            return bound != 0
+        return dot > 0 and bound >= self.light_threshold and bound != 0
+
+    # (punto, candidatos) - candidatos (luz, direccion, distancia, color sin sombra, producto punto)
+    # escala de cada luz de punto: 1 si se usa, 0 si se descarta y con light_samples
+    # el peso de las luces elegidas al azar (lightgrid.selectLights)
+    def _selectLights(self, point, candidates):
+        bounds = [max(light_sum) for _, _, _, light_sum, _ in candidates]
+        scale = [1.0 if self._lightActive(bound, dot) else 0 for bound, (_, _, _, _, dot) in zip(bounds, candidates)]
+
+        chosen = [k for k in range(len(candidates)) if scale[k]]
+        if self.light_samples is not None and len(chosen) > self.light_samples:
+            weights = selectLights(point, [bounds[k] for k in chosen], self.light_samples)
+            for k, weight in zip(chosen, weights):
+                scale[k] = weight
+
+        return scale
+
+    # (tamaño de celda)
+    # agrupa las luces de punto en celdas segun la distancia a la que su aporte baja de light_threshold
+    # (necesita falloff), el modo original solo revisa las luces de la celda de cada punto
+    # se debe llamar de nuevo si cambian las luces o el umbral
+    def glBuildLightGrid(self, cell_size = 4):
+        self.light_grid = LightGrid(self.point_lights, self.light_threshold, cell_size)
+        return self.light_grid
 
-        # file header
-        file.write(bytes('B'.encode('ascii')))
-        file.write(bytes('M'.encode('ascii')))
-                   
-        file.write(dword(14 + 40 + self.width * self.height * 3))
-        file.write(dword(0))
-        file.write(dword(14 + 40))
+    # no tiene parámetros
+    # construye la jerarquia de volumenes sobre los objetos de la escena
+    # se debe llamar de nuevo si la escena cambia
+    def glBuildBVH(self, leaf_size = 4):
+        self.bvh = BVH(self.scene, leaf_size)
 
-        # image header
-        file.write(dword(40))
-        file.write(dword(self.width))
-        file.write(dword(self.height))
-        file.write(word(1))
-        file.write(word(24))
-        file.write(dword(0))
-        file.write(dword(self.width * self.height * 3))
-        file.write(dword(0))
-        file.write(dword(0))
-        file.write(dword(0))
-        file.write(dword(0))
-
-        # pixels, 3 bytes each
-        for x in range(self.height):
-            for y in range(self.width):
-                file.write(self.pixels[x][y])
-
-        file.close()
+    # no tiene parámetros
+    # copia la escena, los materiales y las luces a arreglos de NumPy (compiled.CompiledScene)
+    # que usan los kernels por paquetes. Los modos por paquetes la construyen al empezar,
+    # si la escena cambia despues se debe llamar de nuevo
+    def glCompileScene(self):
+        from compiled import CompiledScene
+
+        self.compiled = CompiledScene(self)
+        return self.compiled
+
+    # (activo)
+    # activa o desactiva la instrumentacion de profiler.Profiler y la regresa
+    # desactivada no agrega trabajo a los rayos, los metodos originales se restauran
+    # se debe activar despues de armar la escena, los objetos agregados despues no se cuentan
+    def glProfiler(self, enabled = True):
+        from profiler import Profiler
+
+        if enabled and self.profiler is None:
+            self.profiler = Profiler(self).attach()
+        elif not enabled and self.profiler is not None:
+            self.profiler.detach()
+            self.profiler = None
+
+        return self.profiler
+
+    # (origenes, direcciones, indices de objetos a ignorar)
+    # version por paquetes de scene_intercept
+    # regresa el indice del objeto mas cercano (-1 si no hay), distancias, normales, uvs
+    # y el indice del material dentro de la paleta del objeto (0 si solo tiene uno)
+    def scene_intercept_packet(self, origins, directions, exclude = None):
+        if self.bvh is not None:
+            return self.bvh.intersect_packet(origins, directions, exclude, self._packetKernel)
+
+        if self.compiled is not None:
+            return self.compiled.intersect(origins, directions, exclude, self._packetKernel)
+
+        n = len(origins)
+        index = np.full(n, -1)
+        distance = np.full(n, np.inf)
+        normal = np.zeros((n, 3))
+        uvs = np.full((n, 2), np.nan)
+        local = np.zeros(n, dtype = int)
+
+        for i, obj in enumerate(self.scene):
+            t, norm, uv, mat = self._packetKernel(obj, origins, directions)
+
+            closer = t < distance
+            if exclude is not None:
+                closer &= exclude != i
+
+            if closer.any():
+                index[closer] = i
+                distance[closer] = t[closer]
+                normal[closer] = norm[closer]
+                uvs[closer] = uv[closer]
+                local[closer] = mat[closer]
+
+        return index, distance, normal, uvs, local
+
+    # (objeto, origenes, direcciones)
+    # interseccion de un paquete con un objeto, ver bvh.packetIntersect
+    def _packetKernel(self, obj, origins, directions):
+        return packetIntersect(obj, origins, directions)
+
+    # (origenes, direcciones, indices de objetos a ignorar, distancias maximas, bloqueadores)
+    # version por paquetes de scene_occluded, regresa verdadero para cada rayo bloqueado
+    # los rayos bloqueados ya no se prueban con los objetos siguientes
+    # occluder (opcional, arreglo de enteros) recibe el indice del objeto que bloqueo cada rayo
+    def scene_occluded_packet(self, origins, directions, exclude = None, max_distance = None, occluder = None):
+        n = len(origins)
+        if max_distance is None:
+            max_distance = np.full(n, np.inf)
+
+        if self.bvh is not None:
+            return self.bvh.occluded_packet(origins, directions, exclude, max_distance, self._packetKernel, occluder)
+
+        if self.compiled is not None:
+            return self.compiled.occluded(origins, directions, exclude, max_distance, self._packetKernel, occluder)
+
+        blocked = np.zeros(n, dtype = bool)
+        rays = np.arange(n)
+
+        for i, obj in enumerate(self.scene):
+            if not len(rays):
+                break
+
+            t = self._packetKernel(obj, origins[rays], directions[rays])[0]
+
+            hit = t < max_distance[rays]
+            if exclude is not None:
+                hit &= exclude[rays] != i
+
+            blocked[rays[hit]] = True
+            if occluder is not None:
+                occluder[rays[hit]] = i
+            rays = rays[~hit]
+
+        return blocked
+
+    # (origenes, direcciones, indices de objetos de origen, profundidad inicial)
+    # version por paquetes de glCastRay, regresa colores RGB flotantes (N, 3)
+    # el arbol de rayos se evalua por frentes de onda: todos los rayos de una misma
+    # profundidad forman un paquete, y al final los colores se combinan de la ultima
+    # profundidad hacia la primera con el mismo descarte por throughput que glCastRay
+    def glCastRayPacket(self, origins, directions, exclude = None, recursion = 0):
+        if self.compiled is None:
+            self.glCompileScene()
+
+        levels = []
+        throughput = np.ones(len(origins))
+        depth = recursion
+
+        while len(origins):
+            color, secondary, tints, children = self.glShadePacket(origins, directions, exclude, depth)
+            parent, weight, origins, directions, exclude = children
+
+            child_throughput = (throughput * (tints[0] * tints[1]).max(axis = 1))[parent] * weight
+            keep = child_throughput >= self.min_throughput
+
+            if self.roulette:
+                # ruleta rusa: sobrevive con probabilidad child_throughput / min_throughput
+                survive = ~keep & (np.random.random(len(parent)) * self.min_throughput < child_throughput)
+                weight = np.where(survive, weight * self.min_throughput / np.maximum(child_throughput, 1e-300), weight)
+                child_throughput = np.where(survive, self.min_throughput, child_throughput)
+                keep |= survive
+
+            parent, weight, origins, directions, exclude = parent[keep], weight[keep], origins[keep], directions[keep], exclude[keep]
+            levels.append((color, secondary, tints, parent, weight))
+
+            throughput = child_throughput[keep]
+            depth += 1
+
+        value = None
+        for color, secondary, tints, parent, weight in reversed(levels):
+            total = np.zeros(color.shape)
+
+            # igual que antes, el color de cada rayo secundario se limita a 1
+            if value is not None and len(parent):
+                np.add.at(total, parent, weight[:, None] * np.minimum(value, 1))
+
+            value = color
+            value[secondary] += total[secondary] * tints[0][secondary] * tints[1][secondary]
+
+        return value
+
+    # (origenes, direcciones, indices de objetos de origen, profundidad)
+    # version por paquetes de glShadeRay, regresa el color propio de cada rayo, los rayos
+    # que combinan hijos (reflectivos y transparentes), sus dos tintes (textura y material)
+    # y los rayos hijos (indice del padre, peso, origenes, direcciones, objetos a ignorar)
+    def glShadePacket(self, origins, directions, exclude = None, depth = 0):
+        n = len(origins)
+        scene = self.compiled
+
+        result = np.zeros((n, 3))
+        secondary = np.zeros(n, dtype = bool)
+        texture_tint = np.ones((n, 3))
+        object_tint = np.ones((n, 3))
+        no_children = (np.zeros(0, dtype = int), np.zeros(0), np.zeros((0, 3)), np.zeros((0, 3)), np.zeros(0, dtype = int))
+
+        if depth >= self.max_depth:
+            index = np.full(n, -1)
+        else:
+            index, distance, normal, uvs, local = self.scene_intercept_packet(origins, directions, exclude)
+
+        missed = index < 0
+        if missed.any():
+            if self.env_map:
+                result[missed] = self.env_map.getColorArray(directions[missed])[:, ::-1] / 255
+            else:
+                result[missed] = np.frombuffer(self.clear_color, dtype = np.uint8)[::-1] / 255
+
+        hit = np.nonzero(~missed)[0]
+        if not len(hit):
+            return result, secondary, (texture_tint, object_tint), no_children
+
+        # informacion de los materiales por rayo
+        obj_index = index[hit]
+        mat_index = scene.offsets[obj_index] + local[hit]
+        direction = directions[hit]
+        normal = normal[hit]
+        uvs = uvs[hit]
+        point = origins[hit] + distance[hit][:, None] * direction
+
+        # los objetos concavos (por ejemplo VoxelGrid) no se ignoran en los rayos secundarios
+        obj_index = np.where(scene.concave[obj_index], -1, obj_index)
+
+        mat_type = scene.type[mat_index]
+        object_tint[hit] = scene.diffuse[mat_index]
+
+        final_color = np.zeros((len(hit), 3))
+        children = [no_children]
+
+        opaque = mat_type == OPAQUE
+        if opaque.any():
+            final_color[opaque] = self._shadePacket(
+                point[opaque], normal[opaque], obj_index[opaque], scene.spec[mat_index[opaque]]
+            )
+
+        reflective = mat_type == REFLECTIVE
+        if reflective.any():
+            d = direction[reflective]
+            N = normal[reflective]
+            reflect = 2 * np.einsum('ij,ij->i', N, -d)[:, None] * N + d
+            reflect /= np.maximum(np.linalg.norm(reflect, axis = 1), 1e-12)[:, None]
+
+            children.append((hit[reflective], np.ones(len(d)), point[reflective], reflect, obj_index[reflective]))
+
+        transparent = mat_type == TRANSPARENT
+        if transparent.any():
+            children.extend(self._transparentPacket(
+                hit[transparent], point[transparent], direction[transparent], normal[transparent],
+                scene.ior[mat_index[transparent]]
+            ))
+
+        # texturas, solo para materiales opacos y reflectivos
+        textured = (mat_type != TRANSPARENT) & ~np.isnan(uvs[:, 0])
+        mat_texture = scene.texture[mat_index]
+        for k, texture in enumerate(scene.textures):
+            use = textured & (mat_texture == k)
+            if use.any():
+                texture_color = self._texturePacket(texture, uvs[use], scene.uv_extent[index[hit[use]]], distance[hit[use]], direction[use], normal[use])
+                final_color[use & opaque] *= texture_color[opaque[use]]
+                texture_tint[hit[use & reflective]] = texture_color[reflective[use]]
+
+        result[hit[opaque]] = final_color[opaque] * object_tint[hit[opaque]]
+        secondary[hit[reflective | transparent]] = True
+
+        children = tuple(np.concatenate([c[i] for c in children]) for i in range(5))
+
+        return result, secondary, (texture_tint, object_tint), children
+
+    # (textura, uvs, tamaño del uv, distancias, direcciones, normales) - un elemento por rayo
+    # colores RGB flotantes de la textura con el filtro texture_filter
+    def _texturePacket(self, texture, uvs, extent, distance, direction, normal):
+        if self.texture_filter == 'nearest':
+            return texture.getColorArray(uvs[:, 0], uvs[:, 1])[:, ::-1] / 255
+
+        pixel_angle = 2 * tan((self.fov * np.pi / 180) / 2) / self.height
+        lod = textureLOD(texture, extent, distance, np.einsum('ij,ij->i', direction, normal), pixel_angle)
+
+        return texture.getColorArray(uvs[:, 0], uvs[:, 1], self.texture_filter, lod)[:, ::-1] / 255
+
+    # (puntos)
+    # luces de la escena compilada vistas desde cada punto, primero la direccional, luego las de punto
+    # y al final una por cada muestra de las luces con superficie
+    # regresa una lista de (direccion hacia la luz, distancia o None, color, intensidad, peso, luz con superficie)
+    # el peso y la luz con superficie son None en la direccional y las de punto
+    def _packetLights(self, point):
+        scene = self.compiled
+
+        lights = []
+        if scene.directional is not None:
+            direction, light_color, light_intensity = scene.directional
+            lights.append((np.broadcast_to(direction, point.shape), None, light_color, light_intensity, None, None))
+
+        for k in range(len(scene.point_intensity)):
+            light_direction = scene.point_position[k] - point
+            light_distance = np.linalg.norm(light_direction, axis = 1)
+            light_direction /= np.maximum(light_distance, 1e-12)[:, None]
+            lights.append((light_direction, light_distance, scene.point_color[k], scene.point_intensity[k], None, None))
+
+        for light, light_color, light_intensity in scene.area:
+            positions, weights = light.points(point)
+            for s in range(weights.shape[1]):
+                light_direction = positions[:, s] - point
+                light_distance = np.linalg.norm(light_direction, axis = 1)
+                light_direction /= np.maximum(light_distance, 1e-12)[:, None]
+                lights.append((light_direction, light_distance - SHADOW_BIAS, light_color, light_intensity, weights[:, s], light))
+
+        return lights
+
+    # (puntos, indices de objetos, luces de _packetLights, columnas, activas)
+    # rayos de sombra, regresa un arreglo (N, luces) verdadero donde la luz es visible
+    # con columns solo se calculan esas luces y las demas quedan en falso
+    # con active (N, luces) solo lanzan rayo los puntos activos de cada luz, los demas quedan en falso
+    # con BVH, en las muestras de una misma luz con superficie cada rayo prueba primero el objeto que
+    # bloqueo su muestra anterior (cache de sombras) y solo los que no quedan bloqueados recorren la escena
+    def _visibilityPacket(self, point, obj_index, lights, columns = None, active = None):
+        n = len(point)
+        visible = np.zeros((n, len(lights)), dtype = bool)
+        point = np.ascontiguousarray(point)
+
+        # ultimo bloqueador de cada punto por luz con superficie
+        occluders = {}
+
+        for k in range(len(lights)) if columns is None else columns:
+            light_direction, light_distance = lights[k][:2]
+            # sin BVH la escena compilada prueba todos los grupos de una vez y el cache no ahorra nada
+            light = lights[k][5] if self.bvh is not None else None
+
+            # puntos que lanzan el rayo de sombra de esta luz
+            if active is None:
+                rays = np.arange(n)
+            else:
+                rays = np.nonzero(active[:, k])[0]
+                if not len(rays):
+                    continue
+
+            origins = point[rays]
+            light_direction = np.ascontiguousarray(light_direction[rays])
+            if light_distance is not None:
+                light_distance = light_distance[rays]
+            exclude = None if obj_index is None else obj_index[rays]
+
+            if light is None:
+                visible[rays, k] = ~self.scene_occluded_packet(origins, light_direction, exclude, light_distance)
+                continue
+
+            occluder = occluders.setdefault(id(light), np.full(n, -1))
+            last = occluder[rays]
+            blocked = np.zeros(len(rays), dtype = bool)
+
+            cached = np.nonzero(last >= 0)[0]
+            for i in np.unique(last[cached]):
+                selected = cached[last[cached] == i]
+                t = self._packetKernel(self.scene[i], origins[selected], light_direction[selected])[0]
+                blocked[selected[t < light_distance[selected]]] = True
+
+            search = np.nonzero(~blocked)[0]
+            found = np.full(len(search), -1)
+            blocked[search] = self.scene_occluded_packet(origins[search], light_direction[search], None if exclude is None else exclude[search], light_distance[search], found)
+            occluder[rays[search]] = np.where(found >= 0, found, last[search])
+
+            visible[rays, k] = ~blocked
+
+        return visible
+
+    # (puntos, normales, indices de objetos, exponentes especulares, visibilidad)
+    # iluminacion ambiente, direccional, de puntos y de las luces con superficie para materiales opacos
+    # visible (de _visibilityPacket) permite sombrear de nuevo sin lanzar los rayos de sombra
+    def _shadePacket(self, point, normal, obj_index, spec, visible = None):
+        n = len(point)
+        final_color = np.zeros((n, 3))
+
+        view_direction = np.asarray(self.cam_position, dtype = float) - point
+        view_direction /= np.maximum(np.linalg.norm(view_direction, axis = 1), 1e-12)[:, None]
+
+        scene = self.compiled
+        if scene.ambient is not None:
+            final_color += scene.ambient
+
+        lights = self._packetLights(point)
+
+        # aporte de cada luz sin sombra, solo las luces con escala lanzan rayos de sombra
+        coefficients = []
+        dots = []
+        for k, (light_direction, light_distance, light_color, light_intensity, weight, _) in enumerate(lights):
+            dot = np.einsum('ij,ij->i', light_direction, normal)
+            intensity = np.where(dot < 0, 0, dot)
+
+            reflect = 2 * dot[:, None] * normal - light_direction
+            reflect /= np.maximum(np.linalg.norm(reflect, axis = 1), 1e-12)[:, None]
+            spec_dot = np.einsum('ij,ij->i', view_direction, reflect)
+
+            if weight is not None:
+                # muestra de una luz con superficie, su parte de la intensidad aplica a difusa y especular
+                spec_intensity = np.power(np.maximum(0, spec_dot), spec)
+                coefficient = weight * light_intensity * (intensity + spec_intensity)
+            elif light_distance is None:
+                # igual que en glCastRay, la luz direccional no se limita a cero antes del exponente
+                spec_intensity = np.power(spec_dot, spec)
+                spec_intensity = np.where(spec_intensity < 0, 0, spec_intensity)
+                coefficient = intensity + spec_intensity
+            else:
+                spec_intensity = light_intensity * np.power(np.maximum(0, spec_dot), spec)
+                coefficient = intensity + spec_intensity
+
+                falloff = scene.point_falloff[k - (scene.directional is not None)]
+                if falloff:
+                    coefficient = coefficient * (1 / (1 + falloff * light_distance ** 2))
+
+            coefficients.append(coefficient)
+            dots.append(dot)
+
+        scale = self._selectLightsPacket(point, lights, coefficients, dots)
+        if visible is None:
+            visible = self._visibilityPacket(point, obj_index, lights, active = scale != 0)
+
+        for k, light in enumerate(lights):
+            final_color += ((visible[:, k] * scale[:, k]) * coefficients[k])[:, None] * light[2]
+
+        return final_color
+
+    # (puntos, luces de _packetLights, coeficientes, productos punto)
+    # version por paquetes de _selectLights, regresa la escala (N, luces)
+    # la direccional solo se descarta si no aporta nada
+    def _selectLightsPacket(self, point, lights, coefficients, dots):
+        n = len(point)
+        if not lights:
+            return np.zeros((n, 0))
+
+        bound = np.stack([coefficient * light[2].max() for coefficient, light in zip(coefficients, lights)], axis = 1)
+        active = bound != 0
+
+        if self.light_threshold is not None:
+            culled = [k for k, light in enumerate(lights) if light[1] is not None]
+            active[:, culled] &= (np.stack([dots[k] for k in culled], axis = 1) > 0) & (bound[:, culled] >= self.light_threshold)
+
+        scale = active.astype(float)
+
+        if self.light_samples is not None:
+            points = [k for k, light in enumerate(lights) if light[1] is not None and light[4] is None]
+            if len(points) > self.light_samples:
+                scale[:, points] = selectLightsArray(point, np.where(active[:, points], bound[:, points], 0), self.light_samples)
+
+        return scale
+
+    # (rayos padre, puntos, direcciones, normales, indices de refraccion)
+    # rayos hijos de los materiales transparentes: la reflexion con peso kr (fresnel)
+    # y la refraccion con peso 1 - kr, solo si kr < 1
+    def _transparentPacket(self, parent, point, direction, normal, ior):
+        cos_dn = np.einsum('ij,ij->i', direction, normal)
+        outside = (cos_dn < 0)[:, None]
+        bias = 0.001 * normal
+
+        # coeficiente de fresnel
+        cosi = np.clip(cos_dn, -1, 1)
+        etai = np.where(cosi > 0, ior, 1)
+        etat = np.where(cosi > 0, 1, ior)
+        sint = etai / etat * np.sqrt(np.maximum(0, 1 - cosi * cosi))
+        cost = np.sqrt(np.maximum(0, 1 - sint * sint))
+        cosi = np.abs(cosi)
+        Rs = ((etat * cosi) - (etai * cost)) / ((etat * cosi) + (etai * cost))
+        Rp = ((etai * cosi) - (etat * cost)) / ((etai * cosi) + (etat * cost))
+        kr = np.where(sint >= 1, 1, (Rs * Rs + Rp * Rp) / 2)
+
+        reflect = 2 * np.einsum('ij,ij->i', normal, -direction)[:, None] * normal + direction
+        reflect /= np.maximum(np.linalg.norm(reflect, axis = 1), 1e-12)[:, None]
+        reflect_origin = np.where(outside, point + bias, point - bias)
+
+        children = [(parent, kr, reflect_origin, reflect, np.full(len(parent), -1))]
+
+        refracting = kr < 1
+        if refracting.any():
+            I = direction[refracting]
+            N = normal[refracting]
+            cosi = np.clip(cos_dn[refracting], -1, 1)
+            entering = cosi < 0
+
+            eta = np.where(entering, 1 / ior[refracting], ior[refracting])
+            N = np.where(entering[:, None], N, -N)
+            cosi = np.abs(cosi)
+            k = 1 - eta * eta * (1 - cosi * cosi)
+
+            refract = eta[:, None] * I + (eta * cosi - np.sqrt(np.maximum(k, 0)))[:, None] * N
+            refract /= np.maximum(np.linalg.norm(refract, axis = 1), 1e-12)[:, None]
+            refract_origin = np.where(outside[refracting], point[refracting] - bias[refracting], point[refracting] + bias[refracting])
+
+            children.append((parent[refracting], 1 - kr[refracting], refract_origin, refract, np.full(refracting.sum(), -1)))
+
+        return children
+
+    # (nombre del archivo)
+    # renderiza el mapa de bits
+    def glFinish(self, filename):
+        writeBMP(filename, self.pixels)
+
+    # (nombre del archivo)
+    # guarda los colores sin limitar de radiance, .npy como arreglo flotante (fila 0 abajo)
+    # y cualquier otra extension como imagen Radiance .hdr
+    def glFinishHDR(self, filename):
+        if filename.endswith('.npy'):
+            np.save(filename, self.radiance)
+        else:
+            writeHDR(filename, self.radiance)
 
+    # (nombre del archivo)
     # función para exportar los valores del zbuffer en un archivo bmp
-    def glZBuffer(self):
-        file = open('zbuffer.bmp', 'wb')
-
-        # File header 14 bytes
-        file.write(bytes('B'.encode('ascii')))
-        file.write(bytes('M'.encode('ascii')))
-        file.write(dword(14 + 40 + self.width * self.height * 3))
-        file.write(dword(0))
-        file.write(dword(14 + 40))
-
-        # Image Header 40 bytes
-        file.write(dword(40))
-        file.write(dword(self.width))
-        file.write(dword(self.height))
-        file.write(word(1))
-        file.write(word(24))
-        file.write(dword(0))
-        file.write(dword(self.width * self.height * 3))
-        file.write(dword(0))
-        file.write(dword(0))
-        file.write(dword(0))
-        file.write(dword(0))
+    def glZBuffer(self, filename = 'zbuffer.bmp'):
+        zbuffer = self.zbuffer.astype(float)
 
         # max y min valores para z
-        minZ = 10000
-        maxZ = -10000
-
-        for x in range(self.height):
-            for y in range(self.width):
-                if self.zbuffer[x][y] == -10000:
-                    pass
-                else:
-                    if minZ > self.zbuffer[x][y]:
-                        minZ = self.zbuffer[x][y]
-                    if maxZ < self.zbuffer[x][y]:
-                        maxZ = self.zbuffer[x][y]
-
-        for x in range(self.height):
-            for y in range(self.width):
-                depth = self.zbuffer[x][y]
-                if depth == -10000:
-                    depth = minZ
-                depth = (depth - minZ) / (maxZ - minZ)
-                file.write(color(depth, depth, depth))
-
-        file.close()
+        valid = zbuffer != -10000
+        minZ = zbuffer[valid].min() if valid.any() else 10000
+        maxZ = zbuffer[valid].max() if valid.any() else -10000
+
+        depth = np.where(valid, zbuffer, minZ)
+        depth = (depth - minZ) / ((maxZ - minZ) or 1)
+
+        writeBMP(filename, np.repeat(np.round(depth * 255).astype(np.uint8)[:, :, None], 3, axis = 2))
@@ -0,0 +1,184 @@
+import numpy as np
+from bvh import BVH, packetIntersect
+from sphere import Intersect
+
+# los rayos dentro de un grupo empiezan un poco adelante para no chocar con la superficie de donde salen
+EPSILON = 0.0001
+
+# (x, y, z)
+# matriz 4x4 de traslacion
+def translation(x, y, z):
+    matrix = np.identity(4)
+    matrix[:3, 3] = [x, y, z]
+    return matrix
+
+# (x, y, z) - un solo numero escala igual en los tres ejes
+# matriz 4x4 de escala
+def scaling(x, y = None, z = None):
+    return np.diag([x, x if y is None else y, x if z is None else z, 1.0])
+
+# (eje, grados)
+# matriz 4x4 de rotacion alrededor de un eje que pasa por el origen (formula de Rodrigues)
+def rotation(axis, degrees):
+    axis = np.asarray(axis, dtype = float)
+    x, y, z = axis / np.linalg.norm(axis)
+    c = np.cos(np.radians(degrees))
+    s = np.sin(np.radians(degrees))
+
+    matrix = np.identity(4)
+    matrix[:3, :3] = [
+        [c + x * x * (1 - c), x * y * (1 - c) - z * s, x * z * (1 - c) + y * s],
+        [y * x * (1 - c) + z * s, c + y * y * (1 - c), y * z * (1 - c) - x * s],
+        [z * x * (1 - c) - y * s, z * y * (1 - c) + x * s, c + z * z * (1 - c)]
+    ]
+    return matrix
+
+# (matriz 3x3, vectores (N, 3))
+# producto de la matriz por cada vector, las sumas se hacen en el mismo orden para cualquier N
+# asi un rayo solo y el mismo rayo dentro de un paquete dan exactamente el mismo resultado
+def transformVectors(matrix, vectors):
+    return vectors[:, 0:1] * matrix[:, 0] + vectors[:, 1:2] * matrix[:, 1] + vectors[:, 2:3] * matrix[:, 2]
+
+# (objeto)
+# paleta de materiales de un objeto (su paleta o su unico material)
+def palette(obj):
+    return getattr(obj, 'materials', None) or [obj.material]
+
+class Group(object):
+    # (objetos)
+    # sub-escena con su propio BVH, por ejemplo un mob armado con varios cubos
+    # se agrega a la escena directamente o dentro de varias Instance que comparten los mismos objetos
+    def __init__(self, objects):
+        self.objects = list(objects)
+        self.material = None
+
+        # un rayo que sale de un objeto del grupo puede chocar con otro del mismo grupo
+        self.concave = True
+
+        # paleta del grupo, cada objeto aporta sus materiales una sola vez
+        self.materials = []
+        table = []
+        offsets = []
+        for obj in self.objects:
+            offsets.append(len(table))
+            for m in palette(obj):
+                for i, other in enumerate(self.materials):
+                    if other is m:
+                        break
+                else:
+                    i = len(self.materials)
+                    self.materials.append(m)
+                table.append(i)
+
+        self.table = np.array(table, dtype = int)
+        self.offsets = np.array(offsets, dtype = int)
+
+        self.bvh = BVH(self.objects)
+
+    # no tiene parámetros
+    # union de las cajas de los objetos, None si alguno no tiene caja (por ejemplo un plano)
+    def bounds(self):
+        boxes = [obj.bounds() if hasattr(obj, 'bounds') else None for obj in self.objects]
+        if not boxes or any(box is None for box in boxes):
+            return None
+
+        return (
+            [min(box[0][i] for box in boxes) for i in range(3)],
+            [max(box[1][i] for box in boxes) for i in range(3)]
+        )
+
+    # (origen, direccion)
+    def ray_intersect(self, orig, dir):
+        start = [orig[i] + EPSILON * dir[i] for i in range(3)]
+        material, hit = self.bvh.intersect(start, dir)
+        if hit is None:
+            return None
+
+        distance = hit.distance + EPSILON
+        return Intersect(
+            distance = distance,
+            point = [orig[i] + distance * dir[i] for i in range(3)],
+            normal = hit.normal,
+            texture = hit.texture,
+            obj = None,
+            material = material
+        )
+
+    # (origenes, direcciones) - arreglos (N, 3)
+    # regresa distancias, normales, uvs e indices en la paleta del grupo
+    def ray_intersect_packet(self, orig, dir):
+        index, distance, normal, uvs, local = self.bvh.intersect_packet(orig + EPSILON * dir, dir, None, packetIntersect)
+
+        hit = index >= 0
+        local = np.where(hit, self.table[self.offsets[np.maximum(index, 0)] + local], 0)
+        return distance + EPSILON, normal, uvs, local
+
+class Instance(object):
+    # (geometria, transformacion, material)
+    # coloca una geometria compartida (Cube, Sphere, Mesh, VoxelGrid o Group) con una matriz 4x4
+    # de coordenadas del objeto a coordenadas del mundo. Los rayos se llevan al espacio del objeto,
+    # asi miles de copias usan la misma geometria y la misma estructura de aceleracion
+    # con material todas las superficies de la instancia usan ese material
+    def __init__(self, geometry, transform = None, material = None):
+        self.geometry = geometry
+        self.transform = np.identity(4) if transform is None else np.array(transform, dtype = float).reshape(4, 4)
+        self.inverse = np.linalg.inv(self.transform)
+
+        self.concave = getattr(geometry, 'concave', False)
+
+        self.override = material is not None
+        if self.override:
+            self.material = material
+            self.materials = None
+        else:
+            self.material = geometry.material
+            self.materials = getattr(geometry, 'materials', None)
+
+    # no tiene parámetros
+    # caja del mundo que contiene las 8 esquinas de la caja de la geometria transformadas
+    def bounds(self):
+        bounds = self.geometry.bounds() if hasattr(self.geometry, 'bounds') else None
+        if bounds is None:
+            return None
+
+        corners = np.array([[x, y, z, 1] for x in (bounds[0][0], bounds[1][0]) for y in (bounds[0][1], bounds[1][1]) for z in (bounds[0][2], bounds[1][2])])
+        corners = corners @ self.transform.T
+
+        return (corners[:, :3].min(axis = 0).tolist(), corners[:, :3].max(axis = 0).tolist())
+
+    # (origenes, direcciones) - arreglos (N, 3)
+    # transforma los rayos al espacio del objeto, las distancias se escalan de regreso al mundo
+    # las normales se transforman con la inversa transpuesta
+    def ray_intersect_packet(self, orig, dir):
+        rotation = self.inverse[:3, :3]
+        local_orig = transformVectors(rotation, orig) + self.inverse[:3, 3]
+        local_dir = transformVectors(rotation, dir)
+
+        length = np.linalg.norm(local_dir, axis = 1)
+        t, norm, uvs, local = packetIntersect(self.geometry, local_orig, local_dir / length[:, None])
+
+        norm = transformVectors(rotation.T, norm)
+        norm /= np.maximum(np.linalg.norm(norm, axis = 1), 1e-12)[:, None]
+
+        if self.override:
+            local = np.zeros(len(orig), dtype = int)
+
+        return t / length, norm, uvs, local
+
+    # (origen, direccion)
+    # un solo rayo, usa el mismo calculo que el paquete
+    def ray_intersect(self, orig, dir):
+        t, norm, uvs, local = self.ray_intersect_packet(np.array([orig], dtype = float), np.array([dir], dtype = float))
+        if t[0] == np.inf:
+            return None
+
+        distance = float(t[0])
+        return Intersect(
+            distance = distance,
+            point = [orig[i] + distance * dir[i] for i in range(3)],
+            normal = norm[0].tolist(),
+            texture = None if np.isnan(uvs[0, 0]) else uvs[0].tolist(),
+            # las geometrias concavas se revisan tambien con los rayos que salen de ellas
+            obj = None if self.concave else self,
+            material = palette(self)[local[0]]
+        )
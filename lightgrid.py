@@ -0,0 +1,135 @@
+import math
+import numpy as np
+
+MASK = (1 << 64) - 1
+
+# los puntos se redondean a esta fraccion de unidad antes de mezclar sus coordenadas, asi el modo
+# original y el de paquetes eligen las mismas luces aunque el punto difiera en el ultimo bit
+QUANTUM = 2 ** 16
+
+# celdas maximas que puede ocupar una luz, las luces mas grandes se revisan en todas las celdas
+MAX_CELLS = 4096
+
+# (entero de 64 bits)
+# mezcla de bits de splitmix64
+def mix(h):
+    h ^= h >> 30
+    h = (h * 0xbf58476d1ce4e5b9) & MASK
+    h ^= h >> 27
+    h = (h * 0x94d049bb133111eb) & MASK
+    return h ^ (h >> 31)
+
+def mixArray(h):
+    with np.errstate(over = 'ignore'):
+        h ^= h >> np.uint64(30)
+        h *= np.uint64(0xbf58476d1ce4e5b9)
+        h ^= h >> np.uint64(27)
+        h *= np.uint64(0x94d049bb133111eb)
+        return h ^ (h >> np.uint64(31))
+
+# (punto, numero de muestra)
+# numero en [0, 1) que depende solo del punto y de la muestra,
+# el mismo punto elige las mismas luces en cada render y en cada modo
+def hashUniform(point, sample):
+    x, y, z = [math.floor(c * QUANTUM) & MASK for c in point]
+    h = mix(z ^ mix(y ^ mix(x ^ mix(sample))))
+    return (h >> 11) * 2.0 ** -53
+
+# (puntos, numero de muestra) - arreglo (N, 3)
+def hashUniformArray(point, sample):
+    cells = np.floor(np.asarray(point, dtype = float) * QUANTUM).astype(np.int64).view(np.uint64)
+    h = mixArray(cells[:, 2] ^ mixArray(cells[:, 1] ^ mixArray(cells[:, 0] ^ np.uint64(mix(sample)))))
+    return (h >> np.uint64(11)).astype(float) * 2.0 ** -53
+
+# (punto, pesos, muestras) - pesos positivos de las luces candidatas
+# elige muestras luces con probabilidad proporcional a su peso (con repeticion)
+# regresa la escala de cada luz: veces elegida / (muestras * probabilidad), 0 si no se eligio
+# el promedio de la suma escalada es la suma de todas las luces
+def selectLights(point, weights, samples):
+    cdf = []
+    total = 0
+    for w in weights:
+        total += w
+        cdf.append(total)
+
+    counts = [0] * len(weights)
+    for j in range(samples):
+        u = hashUniform(point, j) * total
+        i = min(sum(1 for c in cdf if u >= c), len(weights) - 1)
+        counts[i] += 1
+
+    return [counts[i] / (samples * (weights[i] / total)) if counts[i] else 0 for i in range(len(weights))]
+
+# (puntos, pesos, muestras) - pesos (N, luces), cero en las luces descartadas
+# version por paquetes de selectLights, las filas con pocas luces las usan todas
+def selectLightsArray(point, weights, samples):
+    active = weights > 0
+    scale = active.astype(float)
+
+    rows = np.nonzero(active.sum(axis = 1) > samples)[0]
+    if not len(rows):
+        return scale
+
+    w = weights[rows]
+    cdf = np.cumsum(w, axis = 1)
+    total = cdf[:, -1]
+
+    counts = np.zeros(w.shape)
+    for j in range(samples):
+        u = hashUniformArray(point[rows], j) * total
+        i = np.minimum((u[:, None] >= cdf).sum(axis = 1), w.shape[1] - 1)
+        counts[np.arange(len(rows)), i] += 1
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        scale[rows] = np.where(counts > 0, counts / (samples * (w / total[:, None])), 0)
+    return scale
+
+# (luz, umbral)
+# distancia desde la que el aporte de una luz de punto ya es menor al umbral, None si no tiene limite
+# el aporte maximo es (1 + intensidad) * canal mas alto del color (difusa mas especular) por la atenuacion
+def lightRadius(light, threshold):
+    if not threshold or threshold <= 0 or not light.falloff:
+        return None
+
+    bound = (1 + light.intensity) * max(light.color) / 255
+    return (max(0, bound / threshold - 1) / light.falloff) ** 0.5
+
+class LightGrid(object):
+    # (luces, umbral, tamaño de celda)
+    # cuadricula del espacio donde cada celda guarda las luces de punto que pueden aportar mas del umbral
+    # dentro de ella, cada punto solo revisa las luces de su celda y las que no tienen limite
+    def __init__(self, lights, threshold, cell_size = 4):
+        self.lights = list(lights)
+        self.threshold = threshold
+        self.cell_size = cell_size
+
+        self.always = []
+        self.cells = {}
+
+        for i, light in enumerate(self.lights):
+            radius = lightRadius(light, threshold)
+            if radius is None:
+                self.always.append(i)
+                continue
+
+            low = self.cell([x - radius for x in light.position])
+            high = self.cell([x + radius for x in light.position])
+            if np.prod([high[k] - low[k] + 1 for k in range(3)]) > MAX_CELLS:
+                self.always.append(i)
+                continue
+
+            for x in range(low[0], high[0] + 1):
+                for y in range(low[1], high[1] + 1):
+                    for z in range(low[2], high[2] + 1):
+                        self.cells.setdefault((x, y, z), []).append(i)
+
+    # (punto)
+    # celda que contiene al punto
+    def cell(self, point):
+        return tuple(int(np.floor(x / self.cell_size)) for x in point)
+
+    # (punto)
+    # luces que pueden iluminar el punto, en el orden de la escena
+    def query(self, point):
+        indices = sorted(self.always + self.cells.get(self.cell(point), []))
+        return [self.lights[i] for i in indices]
@@ -0,0 +1,333 @@
+import numpy as np
+from array import array
+from sphere import Intersect
+
+# distancia minima de una interseccion, evita que los rayos secundarios choquen con su propio triangulo
+EPSILON = 0.0001
+
+# (ruta, material, tamaño de las hojas)
+# lee un archivo Wavefront .obj linea por linea hacia arreglos compactos y regresa un Mesh
+# soporta v, vt, vn y caras f con cualquier cantidad de vertices (se dividen en triangulos),
+# indices negativos y los formatos v, v/vt, v//vn y v/vt/vn. Las demas lineas se ignoran
+def loadOBJ(path, material, leaf_size = 8):
+    vertices = array('d')
+    texcoords = array('d')
+    normals = array('d')
+
+    faces = array('q')
+    face_texcoords = array('q')
+    face_normals = array('q')
+
+    with open(path) as file:
+        for line in file:
+            parts = line.split()
+            if not parts:
+                continue
+
+            kind = parts[0]
+            if kind == 'v':
+                vertices.extend(float(x) for x in parts[1:4])
+            elif kind == 'vt':
+                texcoords.extend(float(x) for x in parts[1:3])
+            elif kind == 'vn':
+                normals.extend(float(x) for x in parts[1:4])
+            elif kind == 'f':
+                counts = (len(vertices) // 3, len(texcoords) // 2, len(normals) // 3)
+                corners = []
+                for corner in parts[1:]:
+                    values = corner.split('/')
+                    index = []
+                    for k in range(3):
+                        if k < len(values) and values[k]:
+                            i = int(values[k])
+                            index.append(i - 1 if i > 0 else counts[k] + i)
+                        else:
+                            index.append(-1)
+                    corners.append(index)
+
+                # abanico desde el primer vertice
+                for k in range(1, len(corners) - 1):
+                    for corner in (corners[0], corners[k], corners[k + 1]):
+                        faces.append(corner[0])
+                        face_texcoords.append(corner[1])
+                        face_normals.append(corner[2])
+
+    faces = np.frombuffer(faces, dtype = np.int64).reshape(-1, 3)
+    face_texcoords = np.frombuffer(face_texcoords, dtype = np.int64).reshape(-1, 3)
+    face_normals = np.frombuffer(face_normals, dtype = np.int64).reshape(-1, 3)
+
+    # solo se usan las uvs y normales si todas las caras las tienen
+    has_texcoords = len(texcoords) and (face_texcoords >= 0).all()
+    has_normals = len(normals) and (face_normals >= 0).all()
+
+    mesh = Mesh(
+        np.frombuffer(vertices, dtype = float).reshape(-1, 3),
+        faces,
+        material,
+        np.frombuffer(texcoords, dtype = float).reshape(-1, 2) if has_texcoords else None,
+        face_texcoords if has_texcoords else None,
+        np.frombuffer(normals, dtype = float).reshape(-1, 3) if has_normals else None,
+        face_normals if has_normals else None,
+        leaf_size
+    )
+    mesh.path = path
+
+    return mesh
+
+class Mesh(object):
+    # (vertices, caras, material, uvs, indices de uvs por cara, normales, indices de normales por cara, tamaño de las hojas)
+    # malla de triangulos con su propio BVH en arreglos. Los triangulos se guardan empacados
+    # (F, 3, 3) en el orden de las hojas, cada nodo del BVH es una caja y un rango de triangulos
+    # sin normales por vertice se usa la normal geometrica (regla de la mano derecha)
+    def __init__(self, vertices, faces, material, texcoords = None, face_texcoords = None, normals = None, face_normals = None, leaf_size = 8):
+        self.material = material
+        self.leaf_size = leaf_size
+
+        # archivo .obj de origen, para guardar la escena
+        self.path = None
+
+        # un rayo que sale de la malla puede chocar con otro triangulo de la misma malla
+        self.concave = True
+
+        faces = np.asarray(faces, dtype = int).reshape(-1, 3)
+        triangles = np.asarray(vertices, dtype = float)[faces]
+
+        order = self.build(triangles)
+        self.triangles = np.ascontiguousarray(triangles[order])
+
+        self.texcoords = None
+        if texcoords is not None:
+            self.texcoords = np.asarray(texcoords, dtype = float)[np.asarray(face_texcoords)[order]]
+
+        self.normals = None
+        if normals is not None:
+            normals = np.asarray(normals, dtype = float)
+            normals = normals / np.maximum(np.linalg.norm(normals, axis = 1), 1e-12)[:, None]
+            self.normals = normals[np.asarray(face_normals)[order]]
+
+    def __len__(self):
+        return len(self.triangles)
+
+    # (triangulos) - arreglo (F, 3, 3)
+    # construye el BVH dividiendo por la mediana de los centros en el eje mas largo
+    # regresa el orden de los triangulos, cada hoja es un rango continuo de ese orden
+    def build(self, triangles):
+        lower = triangles.min(axis = 1)
+        upper = triangles.max(axis = 1)
+        centers = (lower + upper) / 2
+
+        order = np.arange(len(triangles))
+        boundsMin = []
+        boundsMax = []
+        # hijo izquierdo (el derecho es el siguiente nodo del hijo izquierdo) o -1 en las hojas
+        left = []
+        right = []
+        start = []
+        count = []
+
+        if not len(triangles):
+            self.setNodes(boundsMin, boundsMax, left, right, start, count)
+            return order
+
+        stack = [(None, 0, len(triangles))]
+        while stack:
+            parent, begin, end = stack.pop()
+            node = len(left)
+            if parent is not None:
+                parent[0][parent[1]] = node
+
+            items = order[begin:end]
+            boundsMin.append(lower[items].min(axis = 0))
+            boundsMax.append(upper[items].max(axis = 0))
+            left.append(-1)
+            right.append(-1)
+            start.append(begin)
+            count.append(end - begin)
+
+            if end - begin <= self.leaf_size:
+                continue
+
+            extent = centers[items].max(axis = 0) - centers[items].min(axis = 0)
+            axis = int(extent.argmax())
+            half = (end - begin) // 2
+            order[begin:end] = items[np.argpartition(centers[items, axis], half)]
+
+            count[node] = 0
+            stack.append(((right, node), begin + half, end))
+            stack.append(((left, node), begin, begin + half))
+
+        self.setNodes(boundsMin, boundsMax, left, right, start, count)
+        return order
+
+    def setNodes(self, boundsMin, boundsMax, left, right, start, count):
+        self.node_min = np.array(boundsMin, dtype = float).reshape(-1, 3)
+        self.node_max = np.array(boundsMax, dtype = float).reshape(-1, 3)
+        self.node_left = np.array(left, dtype = int)
+        self.node_right = np.array(right, dtype = int)
+        self.node_start = np.array(start, dtype = int)
+        self.node_count = np.array(count, dtype = int)
+
+    # no tiene parámetros
+    # caja alineada a los ejes que contiene a la malla (minimo, maximo)
+    def bounds(self):
+        if not len(self.triangles):
+            return None
+
+        return (self.node_min[0].tolist(), self.node_max[0].tolist())
+
+    # (origenes, direcciones, triangulos) - los rayos con la misma permutacion de ejes
+    # prueba watertight (Woop, Benthin y Wald 2013) de cada rayo con cada triangulo
+    # los ejes se permutan para que z sea el eje mayor de la direccion y se proyecta sobre xy,
+    # las aristas compartidas no dejan huecos ni cuentan dos veces
+    # regresa distancias (R, T) y coordenadas baricentricas (R, T, 3)
+    def watertight(self, orig, dir, shear, perm, triangles):
+        vertices = triangles[None, :, :, :][..., perm] - orig[:, None, None, perm]
+
+        # transformacion de corte para que el rayo sea el eje z
+        x = vertices[..., 0] - shear[:, None, None, 0] * vertices[..., 2]
+        y = vertices[..., 1] - shear[:, None, None, 1] * vertices[..., 2]
+        z = shear[:, None, None, 2] * vertices[..., 2]
+
+        # coordenadas baricentricas sin normalizar (area con signo de cada arista)
+        U = x[..., 2] * y[..., 1] - y[..., 2] * x[..., 1]
+        V = x[..., 0] * y[..., 2] - y[..., 0] * x[..., 2]
+        W = x[..., 1] * y[..., 0] - y[..., 1] * x[..., 0]
+
+        inside = ((U >= 0) & (V >= 0) & (W >= 0)) | ((U <= 0) & (V <= 0) & (W <= 0))
+        det = U + V + W
+        inside &= det != 0
+
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            t = (U * z[..., 0] + V * z[..., 1] + W * z[..., 2]) / det
+            bary = np.stack([U, V, W], axis = 2) / det[..., None]
+
+        return np.where(inside & (t > EPSILON), t, np.inf), bary
+
+    # (origenes, direcciones, distancias maximas, cualquiera)
+    # recorre el BVH con todos los rayos a la vez, cada nodo recibe solo los rayos que tocan su caja
+    # regresa distancias, indices de triangulo y baricentricas; con any_hit basta un triangulo antes de max_distance
+    def traverse(self, orig, dir, max_distance, any_hit = False):
+        n = len(orig)
+        distance = np.array(max_distance, dtype = float)
+        triangle = np.full(n, -1)
+        bary = np.zeros((n, 3))
+
+        if not len(self.triangles) or not n:
+            return distance, triangle, bary
+
+        # permutacion de ejes por rayo: z es el eje mayor y se conserva la orientacion
+        rows = np.arange(n)
+        kz = np.abs(dir).argmax(axis = 1)
+        kx = (kz + 1) % 3
+        ky = (kx + 1) % 3
+        swap = dir[rows, kz] < 0
+        kx, ky = np.where(swap, ky, kx), np.where(swap, kx, ky)
+        perms = np.stack([kx, ky, kz], axis = 1)
+
+        dz = dir[rows, kz]
+        shear = np.stack([dir[rows, kx] / dz, dir[rows, ky] / dz, 1 / dz], axis = 1)
+
+        # los rayos se ordenan por permutacion, en cada hoja los grupos quedan contiguos
+        group = kz * 2 + swap
+        order = np.argsort(group, kind = 'stable')
+
+        # direcciones con componentes cero usan un inverso finito para no calcular 0 * inf en los bordes de las cajas
+        tiny = np.abs(dir) < 1e-300
+        inverse = 1 / np.where(tiny, np.copysign(1e-300, dir), dir)
+
+        # rayos que tocan la caja de cada hijo (R, 2) y su distancia de entrada
+        def children(node, rays):
+            pair = [self.node_left[node], self.node_right[node]]
+            t1 = (self.node_min[pair][None] - orig[rays, None]) * inverse[rays, None]
+            t2 = (self.node_max[pair][None] - orig[rays, None]) * inverse[rays, None]
+            tnear = np.minimum(t1, t2).max(axis = 2)
+            tfar = np.maximum(t1, t2).min(axis = 2)
+            return pair, (tnear <= tfar) & (tfar >= 0) & (tnear <= distance[rays, None]), tnear
+
+        stack = [(0, order)]
+        while stack:
+            node, rays = stack.pop()
+            if any_hit:
+                rays = rays[triangle[rays] < 0]
+                if not len(rays):
+                    continue
+
+            if self.node_left[node] >= 0:
+                pair, hit, tnear = children(node, rays)
+
+                # primero el hijo mas cercano en promedio, el otro queda abajo en la pila
+                near = np.where(hit, tnear, 0).sum(axis = 0) / np.maximum(hit.sum(axis = 0), 1)
+                for k in ((1, 0) if near[0] <= near[1] else (0, 1)):
+                    if hit[:, k].any():
+                        stack.append((pair[k], rays[hit[:, k]]))
+                continue
+
+            begin = self.node_start[node]
+            triangles = self.triangles[begin:begin + self.node_count[node]]
+
+            for selected in np.split(rays, np.flatnonzero(np.diff(group[rays])) + 1):
+                t, b = self.watertight(orig[selected], dir[selected], shear[selected], perms[selected[0]], triangles)
+
+                best = t.argmin(axis = 1)
+                rows = np.arange(len(selected))
+                t = t[rows, best]
+
+                # en un empate gana el triangulo con menor indice, el resultado no depende del orden del recorrido
+                closer = (t < distance[selected]) | ((t == distance[selected]) & (begin + best < triangle[selected]))
+                selected = selected[closer]
+                distance[selected] = t[closer]
+                triangle[selected] = begin + best[closer]
+                bary[selected] = b[rows[closer], best[closer]]
+
+        return distance, triangle, bary
+
+    # (origenes, direcciones) - arreglos (N, 3)
+    # interseccion de un paquete de rayos con la malla, regresa distancias, normales y uvs
+    def ray_intersect_packet(self, orig, dir):
+        n = len(orig)
+        t, triangle, bary = self.traverse(orig, dir, np.full(n, np.inf))
+
+        norm = np.zeros((n, 3))
+        uvs = np.full((n, 2), np.nan)
+
+        hit = np.nonzero(triangle >= 0)[0]
+        if not len(hit):
+            return t, norm, uvs
+
+        k = triangle[hit]
+        b = bary[hit]
+
+        # las baricentricas (U, V, W) son los pesos de los vertices 0, 1 y 2
+        if self.normals is not None:
+            normal = np.einsum('nk,nkj->nj', b, self.normals[k])
+        else:
+            triangles = self.triangles[k]
+            normal = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+        norm[hit] = normal / np.maximum(np.linalg.norm(normal, axis = 1), 1e-12)[:, None]
+
+        if self.texcoords is not None:
+            uvs[hit] = np.einsum('nk,nkj->nj', b, self.texcoords[k])
+
+        return t, norm, uvs
+
+    # (origen, direccion)
+    # interseccion de un solo rayo, usa el mismo recorrido que el paquete
+    def ray_intersect(self, orig, dir):
+        t, norm, uvs = self.ray_intersect_packet(np.array([orig], dtype = float), np.array([dir], dtype = float))
+        if t[0] == np.inf:
+            return None
+
+        # scene_object es None para que los rayos secundarios revisen la misma malla
+        return Intersect(
+            distance = float(t[0]),
+            point = [orig[i] + t[0] * dir[i] for i in range(3)],
+            normal = norm[0].tolist(),
+            texture = None if np.isnan(uvs[0, 0]) else uvs[0].tolist(),
+            obj = None
+        )
+
+    # (origen, direccion, distancia maxima)
+    # regresa verdadero si algun triangulo bloquea el rayo antes de max_distance
+    def ray_occluded(self, orig, dir, max_distance = float('inf')):
+        triangle = self.traverse(np.array([orig], dtype = float), np.array([dir], dtype = float), np.array([max_distance]), any_hit = True)[1]
+        return triangle[0] >= 0
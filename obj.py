@@ -1,45 +1,261 @@
+import os
 import struct
+from math import floor
 import numpy as np
 from numpy import arccos, arctan2 
 
 def color(r, g, b):
     return bytes([int(b * 255), int(g * 255), int(r * 255)])
 
+# imagenes ya cargadas, compartidas por todas las texturas del proceso
+_bmp_cache = {}
+
+# (ruta)
+# carga los pixeles de un bmp de 24 o 32 bits como arreglo (alto, ancho, 3) en BGR
+# la fila 0 es la de abajo, igual que en los archivos bmp normales
+# el resultado se guarda por ruta y no se debe modificar
+def readBMP(path):
+    key = os.path.abspath(path)
+    if key in _bmp_cache:
+        return _bmp_cache[key]
+
+    with open(path, 'rb') as image:
+        header = image.read(54)
+
+    offset = struct.unpack('=l', header[10:14])[0]
+    width, height = struct.unpack('=ll', header[18:26])
+    bpp = struct.unpack('=h', header[28:30])[0]
+
+    if bpp not in (24, 32):
+        raise ValueError('%s: solo se soportan bmp de 24 o 32 bits, no %d' % (path, bpp))
+
+    channels = bpp // 8
+    rows = abs(height)
+    row_size = (width * channels + 3) & ~3
+
+    data = np.memmap(path, dtype = np.uint8, mode = 'r', offset = offset, shape = (rows, row_size))
+    pixels = data[:, :width * channels].reshape(rows, width, channels)[:, :, :3]
+
+    # altura negativa: las filas vienen de arriba hacia abajo
+    if height < 0:
+        pixels = pixels[::-1]
+
+    pixels = np.ascontiguousarray(pixels)
+    pixels.flags.writeable = False
+    del data
+
+    _bmp_cache[key] = pixels
+    return pixels
+
+# niveles de mip-map ya calculados, por ruta igual que _bmp_cache
+_mip_cache = {}
+
+# (pixeles) - arreglo (alto, ancho, 3)
+# niveles de mip-map en flotante, cada nivel es el promedio de bloques de 2x2 del anterior hasta 1x1
+# en los tamaños impares se repite la ultima fila o columna
+def buildMipmaps(pixels):
+    levels = [pixels.astype(np.float32)]
+
+    while max(levels[-1].shape[:2]) > 1:
+        level = levels[-1]
+        if level.shape[0] % 2:
+            level = np.concatenate([level, level[-1:]], axis = 0)
+        if level.shape[1] % 2:
+            level = np.concatenate([level, level[:, -1:]], axis = 1)
+
+        levels.append((level[0::2, 0::2] + level[1::2, 0::2] + level[0::2, 1::2] + level[1::2, 1::2]) / 4)
+
+    return levels
+
+# (ruta)
+# mip-maps de un bmp, se calculan una sola vez por proceso
+def readMipmaps(path):
+    key = os.path.abspath(path)
+    if key not in _mip_cache:
+        _mip_cache[key] = buildMipmaps(readBMP(path))
+
+    return _mip_cache[key]
+
+# (nivel, tx, ty) - nivel de mip-map y arreglos de coordenadas entre 0 y 1
+# interpolacion bilineal entre los cuatro texeles mas cercanos, los bordes se repiten
+def bilinear(level, tx, ty):
+    height, width = level.shape[:2]
+
+    x = tx * width - 0.5
+    y = ty * height - 0.5
+    x0 = np.floor(x)
+    y0 = np.floor(y)
+    fx = (x - x0)[:, None]
+    fy = (y - y0)[:, None]
+
+    x0 = x0.astype(int)
+    y0 = y0.astype(int)
+    x1 = np.clip(x0 + 1, 0, width - 1)
+    y1 = np.clip(y0 + 1, 0, height - 1)
+    x0 = np.clip(x0, 0, width - 1)
+    y0 = np.clip(y0, 0, height - 1)
+
+    top = level[y1, x0] * (1 - fx) + level[y1, x1] * fx
+    bottom = level[y0, x0] * (1 - fx) + level[y0, x1] * fx
+
+    return bottom * (1 - fy) + top * fy
+
+# tablas octaedricas ya calculadas, por (ruta, tamaño)
+_lut_cache = {}
+
+# (direcciones) - arreglo (N, 3), no necesitan estar normalizadas
+# coordenadas octaedricas entre 0 y 1: la direccion se divide entre la suma de sus componentes
+# (norma L1) y el hemisferio de abajo (y < 0) se dobla sobre las esquinas del cuadrado
+def octahedralEncode(directions):
+    x, y, z = directions[:, 0], directions[:, 1], directions[:, 2]
+    total = np.abs(x) + np.abs(y) + np.abs(z)
+    u = x / total
+    v = z / total
+
+    below = np.nonzero(y < 0)[0]
+    if len(below):
+        bu = u[below]
+        bv = v[below]
+        u[below] = (1 - np.abs(bv)) * np.where(bu >= 0, 1, -1)
+        v[below] = (1 - np.abs(bu)) * np.where(bv >= 0, 1, -1)
+
+    return u * 0.5 + 0.5, v * 0.5 + 0.5
+
+# (u, v) - arreglos de coordenadas octaedricas entre 0 y 1
+# direcciones normalizadas, inverso de octahedralEncode
+def octahedralDecode(u, v):
+    u = u * 2 - 1
+    v = v * 2 - 1
+    y = 1 - np.abs(u) - np.abs(v)
+
+    below = y < 0
+    fold_u = (1 - np.abs(v)) * np.where(u >= 0, 1, -1)
+    fold_v = (1 - np.abs(u)) * np.where(v >= 0, 1, -1)
+    u = np.where(below, fold_u, u)
+    v = np.where(below, fold_v, v)
+
+    directions = np.stack([u, y, v], axis = 1)
+    return directions / np.linalg.norm(directions, axis = 1)[:, None]
+
 class Envmap(object):
-    def __init__(self, path):
+    # (ruta, tamaño de la tabla, bilineal)
+    # con lut se calcula al cargar una tabla octaedrica de lut x lut con el color de cada direccion
+    # (True usa el ancho de la imagen), asi cada rayo solo hace sumas y divisiones en lugar de
+    # arctan2 y arccos. Sin tabla las lecturas son exactamente las de la imagen equirectangular
+    def __init__(self, path, lut = 0, bilinear = False):
         self.path = path
+        self.lut_size = lut
+        self.bilinear = bilinear
         self.read()
-        
+
     def read(self):
-        image = open(self.path, 'rb')
-        image.seek(10)
-        headerSize = struct.unpack('=l', image.read(4))[0]
+        self.pixels = readBMP(self.path)
+        self.height, self.width = self.pixels.shape[:2]
+
+        self.lut = self.lut_bytes = None
+        if self.lut_size:
+            size = self.width if self.lut_size is True else int(self.lut_size)
+            key = (os.path.abspath(self.path), size)
+            if key not in _lut_cache:
+                _lut_cache[key] = self.buildLUT(size)
+            self.lut, self.lut_bytes = _lut_cache[key]
+
+    # (tamaño)
+    # tabla octaedrica en flotante (BGR), cada texel es la lectura bilineal de la imagen en su direccion
+    # regresa la tabla y la misma tabla redondeada a bytes para las lecturas sin filtro
+    def buildLUT(self, size):
+        v, u = np.mgrid[0:size, 0:size]
+        directions = octahedralDecode((u.ravel() + 0.5) / size, (v.ravel() + 0.5) / size)
 
-        image.seek(14 + 4)
-        self.width = struct.unpack('=l', image.read(4))[0]
-        self.height = struct.unpack('=l', image.read(4))[0]
-        image.seek(headerSize)
+        tx = arctan2(directions[:, 2], directions[:, 0]) / (2 * np.pi) + 0.5
+        ty = arccos(np.clip(-directions[:, 1], -1, 1)) / np.pi
 
-        self.pixels = []
+        lut = bilinear(self.pixels.astype(np.float32), tx, ty).astype(np.float32).reshape(size, size, 3)
+        return lut, np.round(lut).astype(np.uint8)
 
-        for y in range(self.height):
-            self.pixels.append([])
-            for x in range(self.width):
-                b = ord(image.read(1)) / 255
-                g = ord(image.read(1)) / 255
-                r = ord(image.read(1)) / 255
-                self.pixels[y].append(color(r,g,b))
+    # la tabla no se envia a otros procesos, se calcula de nuevo desde los pixeles
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['lut'] = state['lut_bytes'] = None
+        return state
 
-        image.close()
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.lut_size:
+            size = self.width if self.lut_size is True else int(self.lut_size)
+            self.lut, self.lut_bytes = self.buildLUT(size)
 
     def getColor(self, direction):
+        if self.lut is not None:
+            # mismas operaciones que octahedralEncode y lookupLUT con numeros de python
+            x, y, z = direction
+            total = abs(x) + abs(y) + abs(z)
+            u = x / total
+            v = z / total
+            if y < 0:
+                u, v = (1 - abs(v)) * (1 if u >= 0 else -1), (1 - abs(u)) * (1 if v >= 0 else -1)
+            u = u * 0.5 + 0.5
+            v = v * 0.5 + 0.5
+
+            size = len(self.lut)
+            if not self.bilinear:
+                return self.lut_bytes[min(int(v * size), size - 1), min(int(u * size), size - 1)].tobytes()
+
+            x = u * size - 0.5
+            y = v * size - 0.5
+            x0 = floor(x)
+            y0 = floor(y)
+            fx = x - x0
+            fy = y - y0
+            x1 = min(max(x0 + 1, 0), size - 1)
+            y1 = min(max(y0 + 1, 0), size - 1)
+            x0 = min(max(x0, 0), size - 1)
+            y0 = min(max(y0, 0), size - 1)
+
+            lut = self.lut
+            result = []
+            for a, b, c, d in zip(lut[y1, x0].tolist(), lut[y1, x1].tolist(), lut[y0, x0].tolist(), lut[y0, x1].tolist()):
+                top = a * (1 - fx) + b * fx
+                bottom = c * (1 - fx) + d * fx
+                result.append(round(bottom * (1 - fy) + top * fy))
+
+            return bytes(result)
 
         direction = direction / np.linalg.norm(direction)
 
         x = int( (arctan2( direction[2], direction[0]) / (2 * np.pi) + 0.5) * self.width)
         y = int( arccos(-direction[1]) / np.pi * self.height )
 
-        return self.pixels[y][x]
+        return self.pixels[y, x].tobytes()
+
+    # (direcciones) - arreglo (N, 3)
+    # version por paquetes de getColor, regresa un arreglo (N, 3) en BGR
+    def getColorArray(self, directions):
+        if self.lut is not None:
+            return self.lookupLUT(directions)
+
+        pixels = self.pixels
+
+        directions = directions / np.linalg.norm(directions, axis = 1)[:, None]
+
+        x = ((arctan2(directions[:, 2], directions[:, 0]) / (2 * np.pi) + 0.5) * self.width).astype(int)
+        y = (arccos(np.clip(-directions[:, 1], -1, 1)) / np.pi * self.height).astype(int)
+
+        return pixels[np.minimum(y, self.height - 1), np.minimum(x, self.width - 1)]
+
+    # (direcciones) - arreglo (N, 3)
+    # lectura de la tabla octaedrica, el texel mas cercano o bilineal
+    def lookupLUT(self, directions):
+        u, v = octahedralEncode(directions)
+
+        if self.bilinear:
+            return np.round(bilinear(self.lut, u, v)).astype(np.uint8)
+
+        size = len(self.lut)
+        x = np.minimum((u * size).astype(int), size - 1)
+        y = np.minimum((v * size).astype(int), size - 1)
+
+        return self.lut_bytes[y, x]
 
 class Texture(object):
     def __init__(self, path):
@@ -47,32 +263,75 @@ class Texture(object):
         self.read()
         
     def read(self):
-        image = open(self.path, 'rb')
-        image.seek(10)
-        headerSize = struct.unpack('=l', image.read(4))[0]
+        self.pixels = readBMP(self.path)
+        self.height, self.width = self.pixels.shape[:2]
+        self.mipmaps = readMipmaps(self.path)
 
-        image.seek(14 + 4)
-        self.width = struct.unpack('=l', image.read(4))[0]
-        self.height = struct.unpack('=l', image.read(4))[0]
-        image.seek(headerSize)
+    # los mip-maps no se envian a otros procesos, se calculan de nuevo desde los pixeles
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['mipmaps']
+        return state
 
-        self.pixels = []
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.mipmaps = buildMipmaps(self.pixels)
 
-        for y in range(self.height):
-            self.pixels.append([])
-            for x in range(self.width):
-                b = ord(image.read(1)) / 255
-                g = ord(image.read(1)) / 255
-                r = ord(image.read(1)) / 255
-                self.pixels[y].append(color(r,g,b))
+    # (tx, ty, filtro, nivel de detalle)
+    # filtro 'nearest' (el texel mas cercano), 'bilinear' o 'trilinear' (entre dos niveles de mip-map)
+    def getColor(self, tx, ty, filter = 'nearest', lod = 0):
+        if filter != 'nearest':
+            return self.getColorArray(np.array([tx]), np.array([ty]), filter, np.array([lod]))[0].tobytes()
 
-        image.close()
-
-    def getColor(self, tx, ty):
         if tx >= 0 and tx <= 1 and ty >= 0 and ty <= 1:
             x = int(tx * self.width - 1)
             y = int(ty * self.height - 1)
 
-            return self.pixels[y][x]
+            return self.pixels[y, x].tobytes()
+        else:
+            return color(0,0,0)
+
+    # (tx, ty, filtro, nivel de detalle) - arreglos de coordenadas y de niveles
+    # version por paquetes de getColor, regresa un arreglo (N, 3) en BGR
+    # lod es log2 de los texeles que cubre un pixel, 0 es el nivel de mayor resolucion
+    def getColorArray(self, tx, ty, filter = 'nearest', lod = 0):
+        if filter != 'nearest':
+            return self.filtered(tx, ty, filter, lod)
+
+        pixels = self.pixels
+
+        inside = (tx >= 0) & (tx <= 1) & (ty >= 0) & (ty <= 1)
+        x = np.where(inside, tx * self.width - 1, 0).astype(int)
+        y = np.where(inside, ty * self.height - 1, 0).astype(int)
+
+        result = pixels[y, x]
+        result[~inside] = 0
+
+        return result
+
+    # (tx, ty, filtro, nivel de detalle)
+    # lecturas filtradas, el resultado se redondea a bytes igual que los texeles
+    def filtered(self, tx, ty, filter, lod):
+        inside = (tx >= 0) & (tx <= 1) & (ty >= 0) & (ty <= 1)
+        tx = np.where(inside, tx, 0)
+        ty = np.where(inside, ty, 0)
+
+        if filter == 'bilinear':
+            result = bilinear(self.mipmaps[0], tx, ty)
         else:
-            return color(0,0,0)
\ No newline at end of file
+            lod = np.clip(np.broadcast_to(lod, tx.shape), 0, len(self.mipmaps) - 1)
+            base = np.floor(lod).astype(int)
+            blend = (lod - base)[:, None]
+
+            result = np.zeros((len(tx), 3))
+            for level in np.unique(base):
+                rows = base == level
+                color = bilinear(self.mipmaps[level], tx[rows], ty[rows])
+                if level + 1 < len(self.mipmaps):
+                    color = color * (1 - blend[rows]) + bilinear(self.mipmaps[level + 1], tx[rows], ty[rows]) * blend[rows]
+                result[rows] = color
+
+        result = np.round(result).astype(np.uint8)
+        result[~inside] = 0
+
+        return result
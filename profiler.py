@@ -0,0 +1,281 @@
+import time
+import numpy as np
+from gl import writeBMP, OPAQUE, REFLECTIVE, TRANSPARENT
+
+# nombres de las ramas de sombreado de glCastRay
+BRANCHES = {OPAQUE: 'opaque', REFLECTIVE: 'reflective', TRANSPARENT: 'transparent', None: 'miss'}
+
+class Profiler(object):
+    # (render)
+    # instrumentacion de un RayTracer: llamadas a scene_intercept, pruebas de interseccion
+    # por tipo de objeto, histograma de profundidad de recursion, tiempo por rama de sombreado,
+    # texturas y rayos de sombra, y costo por pixel
+    # envuelve los metodos de las instancias al activarse, desactivado no agrega trabajo
+    def __init__(self, r):
+        self.render = r
+        self.wrapped = []
+        self.reset()
+
+    # no tiene parámetros
+    # reinicia los contadores
+    def reset(self):
+        self.intercepts = 0
+        self.occlusions = 0
+        self.tests = {}
+        self.depths = {}
+        self.branch_time = dict.fromkeys(BRANCHES.values(), 0.0)
+        self.branch_rays = dict.fromkeys(BRANCHES.values(), 0)
+        self.shadow_time = 0.0
+        self.texture_lookups = 0
+        self.texture_time = 0.0
+        self.heat = np.zeros((self.render.height, self.render.width))
+
+        # rayo en curso: [tipo de material] o None
+        self.frame = None
+        self.last_cost = 0.0
+
+    # (objeto, nombre del metodo, funcion que recibe el metodo original)
+    # reemplaza el metodo solamente en la instancia, se guarda lo necesario para restaurarlo
+    def wrap(self, target, name, wrapper):
+        original = getattr(target, name)
+        self.wrapped.append((target, name, name in target.__dict__, target.__dict__.get(name)))
+        setattr(target, name, wrapper(original))
+
+    # no tiene parámetros
+    # instala los contadores en el render, sus objetos y texturas
+    def attach(self):
+        if self.wrapped:
+            return self
+
+        r = self.render
+        self.wrap(r, 'glCastRay', self.castRay)
+        self.wrap(r, 'glShadeRay', self.shadeRay)
+        self.wrap(r, 'scene_intercept', self.intercept)
+        self.wrap(r, 'scene_occluded', self.occluded)
+        self.wrap(r, 'glVertexRadiance', self.vertex)
+        self.wrap(r, 'scene_intercept_packet', self.interceptPacket)
+        self.wrap(r, 'glShadePacket', self.shadePacket)
+        self.wrap(r, '_packetKernel', self.packetKernel)
+
+        # en el modo por paquetes las esferas, cubos y planos se prueban por grupo en la escena compilada
+        self.wrap(r, 'glCompileScene', self.compileScene)
+        if r.compiled is not None:
+            self.wrapCompiled(r.compiled)
+
+        for obj in r.scene:
+            kind = type(obj).__name__
+            for name in ('ray_intersect', 'ray_occluded'):
+                if hasattr(obj, name):
+                    self.wrap(obj, name, self.test(kind))
+
+        textures = []
+        for obj in r.scene:
+            for material in getattr(obj, 'materials', None) or [obj.material]:
+                texture = getattr(material, 'texture', None)
+                if texture is not None and all(texture is not t for t in textures):
+                    textures.append(texture)
+        if r.env_map is not None:
+            textures.append(r.env_map)
+
+        for texture in textures:
+            self.wrap(texture, 'getColor', self.lookup)
+
+        return self
+
+    # no tiene parámetros
+    # restaura los metodos originales
+    def detach(self):
+        for target, name, had, previous in reversed(self.wrapped):
+            if had:
+                setattr(target, name, previous)
+            else:
+                delattr(target, name)
+
+        self.wrapped = []
+        return self
+
+    ## ENVOLTURAS ##
+
+    # costo total del arbol de rayos de cada rayo primario
+    def castRay(self, original):
+        def glCastRay(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.last_cost = time.perf_counter() - start
+
+        return glCastRay
+
+    # tiempo de cada rayo (sus hijos se sombrean aparte) agrupado por la rama de sombreado
+    def shadeRay(self, original):
+        def glShadeRay(origin, direction, origin_object = None, depth = 0):
+            self.depths[depth] = self.depths.get(depth, 0) + 1
+
+            self.frame = [None]
+            start = time.perf_counter()
+            try:
+                return original(origin, direction, origin_object, depth)
+            finally:
+                branch = BRANCHES[self.frame[0]]
+                self.branch_time[branch] += time.perf_counter() - start
+                self.branch_rays[branch] += 1
+                self.frame = None
+
+        return glShadeRay
+
+    def intercept(self, original):
+        def scene_intercept(origin, direction, origin_object = None):
+            self.intercepts += 1
+            material, intersect = original(origin, direction, origin_object)
+
+            if self.frame is not None and material is not None:
+                self.frame[0] = material.type
+
+            return material, intersect
+
+        return scene_intercept
+
+    def occluded(self, original):
+        def scene_occluded(*args, **kwargs):
+            self.occlusions += 1
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.shadow_time += time.perf_counter() - start
+
+        return scene_occluded
+
+    # el costo del ultimo rayo primario se asigna al pixel que se dibuja con su color
+    def vertex(self, original):
+        def glVertexRadiance(x, y, rgb):
+            self.heat[min(y, self.render.height - 1), min(x, self.render.width - 1)] += self.last_cost
+            self.last_cost = 0.0
+            return original(x, y, rgb)
+
+        return glVertexRadiance
+
+    def interceptPacket(self, original):
+        def scene_intercept_packet(origins, *args, **kwargs):
+            self.intercepts += len(origins)
+            return original(origins, *args, **kwargs)
+
+        return scene_intercept_packet
+
+    def shadePacket(self, original):
+        def glShadePacket(origins, directions, exclude = None, depth = 0):
+            self.depths[depth] = self.depths.get(depth, 0) + len(origins)
+            return original(origins, directions, exclude, depth)
+
+        return glShadePacket
+
+    def packetKernel(self, original):
+        def _packetKernel(obj, origins, directions):
+            kind = type(obj).__name__
+            self.tests[kind] = self.tests.get(kind, 0) + len(origins)
+            return original(obj, origins, directions)
+
+        return _packetKernel
+
+    # cada escena compilada nueva cuenta las pruebas de sus grupos
+    def compileScene(self, original):
+        def glCompileScene():
+            compiled = original()
+            self.wrapCompiled(compiled)
+            return compiled
+
+        return glCompileScene
+
+    # (escena compilada)
+    # cuenta las pruebas de cada grupo de primitivas: un rayo contra cada objeto del grupo
+    def wrapCompiled(self, compiled):
+        for name, kind, index in (
+            ('sphereDistances', 'Sphere', compiled.sphere_index),
+            ('cubeDistances', 'Cube', compiled.cube_index),
+            ('planeDistances', 'Plane', compiled.plane_index)
+        ):
+            self.wrap(compiled, name, self.groupTest(kind, len(index)))
+
+    # (tipo de objeto, objetos en el grupo)
+    def groupTest(self, kind, count):
+        def wrapper(original):
+            def distances(orig, dir):
+                self.tests[kind] = self.tests.get(kind, 0) + len(orig) * count
+                return original(orig, dir)
+
+            return distances
+
+        return wrapper
+
+    # (tipo de objeto)
+    # cuenta las pruebas de interseccion del objeto
+    def test(self, kind):
+        def wrapper(original):
+            def method(*args, **kwargs):
+                self.tests[kind] = self.tests.get(kind, 0) + 1
+                return original(*args, **kwargs)
+
+            return method
+
+        return wrapper
+
+    def lookup(self, original):
+        def getColor(*args):
+            self.texture_lookups += 1
+            start = time.perf_counter()
+            try:
+                return original(*args)
+            finally:
+                self.texture_time += time.perf_counter() - start
+
+        return getColor
+
+    ## RESULTADOS ##
+
+    # no tiene parámetros
+    # resultados como diccionario
+    def report(self):
+        return {
+            'scene_intercept': self.intercepts,
+            'scene_occluded': self.occlusions,
+            'tests': dict(self.tests),
+            'depth': dict(sorted(self.depths.items())),
+            'branch_time': dict(self.branch_time),
+            'branch_rays': dict(self.branch_rays),
+            'shadow_time': self.shadow_time,
+            'texture_lookups': self.texture_lookups,
+            'texture_time': self.texture_time,
+        }
+
+    # no tiene parámetros
+    # resumen en texto de report()
+    def summary(self):
+        lines = [
+            'scene_intercept: %d' % self.intercepts,
+            'scene_occluded:  %d (%.3fs)' % (self.occlusions, self.shadow_time),
+            'texturas:        %d (%.3fs)' % (self.texture_lookups, self.texture_time),
+            'pruebas de interseccion:'
+        ]
+        lines += ['  %-12s %d' % (kind, count) for kind, count in sorted(self.tests.items())]
+
+        lines.append('profundidad de recursion:')
+        lines += ['  %-12d %d' % (depth, count) for depth, count in sorted(self.depths.items())]
+
+        lines.append('tiempo por rama:')
+        lines += ['  %-12s %.3fs  %d rayos' % (branch, self.branch_time[branch], self.branch_rays[branch]) for branch in BRANCHES.values()]
+
+        return '\n'.join(lines)
+
+    # (nombre del archivo)
+    # mapa de calor del costo por pixel: negro (barato), rojo, amarillo, blanco (caro)
+    # solo glRayTracingRender dibuja con glVertexRadiance, los otros modos dejan el mapa vacio
+    def heatmap(self, filename):
+        peak = self.heat.max()
+        cost = self.heat / peak if peak > 0 else self.heat
+
+        red = np.clip(cost * 3, 0, 1)
+        green = np.clip(cost * 3 - 1, 0, 1)
+        blue = np.clip(cost * 3 - 2, 0, 1)
+
+        writeBMP(filename, np.round(np.stack([blue, green, red], axis = 2) * 255).astype(np.uint8))
@@ -0,0 +1,51 @@
+import sys
+import time
+import argparse
+from scenefile import loadScene
+
+# renderiza un archivo de escena (scenefile.py)
+# python render.py scenes/mobsatnight.json -o out.bmp --size 256x256 --mode packet --bvh
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'renderiza una escena .json, .toml o .npz')
+    parser.add_argument('scene', help = 'archivo de la escena')
+    parser.add_argument('-o', '--output', default = 'out.bmp', help = 'imagen bmp')
+    parser.add_argument('--size', default = None, help = 'ANCHOxALTO, reemplaza el de la escena')
+    parser.add_argument('--mode', choices = ['scalar', 'packet', 'parallel', 'aa', 'progressive'], default = 'scalar')
+    parser.add_argument('--bvh', action = 'store_true', help = 'construir el BVH antes de renderizar')
+    parser.add_argument('--workers', type = int, default = None, help = 'procesos del modo parallel')
+    parser.add_argument('--hdr', default = None, help = 'archivo .hdr o .npy con la radiancia sin limitar')
+    args = parser.parse_args(argv)
+
+    width = height = None
+    if args.size:
+        width, height = (int(x) for x in args.size.lower().split('x'))
+
+    start = time.perf_counter()
+    r = loadScene(args.scene, width, height)
+    loaded = time.perf_counter() - start
+
+    if args.bvh:
+        r.glBuildBVH()
+
+    start = time.perf_counter()
+    if args.mode == 'packet':
+        r.glRayTracingRenderPacket()
+    elif args.mode == 'parallel':
+        r.glRayTracingRenderParallel(workers = args.workers)
+    elif args.mode == 'aa':
+        r.glRayTracingRenderAA()
+    elif args.mode == 'progressive':
+        r.glRayTracingRenderProgressive(args.output)
+    else:
+        r.glRayTracingRender()
+    rendered = time.perf_counter() - start
+
+    r.glFinish(args.output)
+    if args.hdr:
+        r.glFinishHDR(args.hdr)
+
+    print('%s: %d objetos, carga %.3fs, render %.2fs -> %s' % (args.scene, len(r.scene), loaded, rendered, args.output))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
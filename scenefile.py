@@ -0,0 +1,530 @@
+import os
+import json
+import numpy as np
+
+from gl import RayTracer, color
+from sphere import Material, Sphere, Cube, Plane, AmbientLight, PointLight, DirectionalLight, OPAQUE, REFLECTIVE, TRANSPARENT
+from obj import Envmap, Texture
+from voxel import VoxelGrid
+from mesh import Mesh, loadOBJ
+from instance import Instance, Group, translation, rotation, scaling
+from arealight import RectLight, SphereLight, BlockLight
+
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
+
+# formato de escenas
+#
+# {
+#   "width": 512, "height": 512,
+#   "camera": {"position": [0, 0, 0], "fov": 60, "target": [0, 0, -1], "up": [0, 1, 0]},
+#   "background": [0, 0, 0],
+#   "envmap": "envmaps/nolamps.bmp",        o {"path": "envmaps/nolamps.bmp", "lut": 512, "bilinear": true}
+#   "ambient": {"strength": 0.2, "color": [1, 1, 1]},
+#   "directional": {"direction": [0, -1, 0], "intensity": 1, "color": [1, 1, 1]},
+#   "point_lights": [{"position": [2, 3, -9], "intensity": 0.7, "color": [1, 1, 1], "falloff": 0.1}],
+#   "area_lights": [{"type": "block", "position": [0, 2, -6], "size": [1, 1, 1], "intensity": 0.8, "samples": 16},
+#                   {"type": "rect", "corner": [-1, 4, -8], "edge1": [2, 0, 0], "edge2": [0, 0, 2]},
+#                   {"type": "sphere", "center": [2, 3, -5], "radius": 0.5, "color": [1, 0.8, 0.6], "seed": 3}],
+#   "materials": {"stone": {"texture": "textures/stone.bmp"}, "glass": {"type": "transparent", "spec": 64, "ior": 1.5}},
+#   "objects": [
+#     {"type": "cube", "position": [0, 0, -5], "size": [1, 1, 1], "material": "stone"},
+#     {"type": "sphere", "center": [0, 1, -5], "radius": 0.5, "material": "glass"},
+#     {"type": "plane", "position": [0, -1, 0], "normal": [0, 1, 0], "material": {"diffuse": [0.5, 0.5, 0.5]}},
+#     {"type": "grid", "origin": [0, 0, -9], "dimensions": [4, 4, 4], "scale": 1,
+#      "palette": ["stone", "dirt"], "blocks": [[0, 0, 0, 1], [1, 0, 0, 2]]},
+#     {"type": "mesh", "path": "models/teapot.obj", "material": "stone", "leaf_size": 8},
+#     {"type": "group", "objects": [{"type": "cube", ...}, {"type": "sphere", ...}]},
+#     {"type": "instance", "geometry": "slime", "translate": [2, 0, -6], "rotate": [0, 1, 0, 45], "scale": 0.5},
+#     {"type": "instance", "geometry": "block", "transform": [16 numeros por filas], "material": "dirt"}
+#   ],
+#   "models": {"block": {"type": "cube", "position": [0, 0, 0], "material": "stone"}, "slime": {"type": "group", ...}}
+# }
+#
+# los colores son RGB entre 0 y 1 y las rutas son relativas al archivo de la escena
+# los materiales pueden tener nombre (en "materials") o escribirse dentro del objeto
+# la version binaria (.npz) guarda el mismo diccionario como texto y los objetos como
+# arreglos: kind, material y params por objeto, y las celdas de cada cuadricula
+# las mallas se guardan como la ruta de su archivo .obj
+# los modelos con nombre se construyen una sola vez y todas sus instancias comparten la geometria,
+# en una instancia la transformacion es "transform" o translate * rotate * scale
+
+TYPES = {'opaque': OPAQUE, 'reflective': REFLECTIVE, 'transparent': TRANSPARENT}
+TYPE_NAMES = {value: key for key, value in TYPES.items()}
+KINDS = ['cube', 'sphere', 'plane', 'grid', 'mesh', 'instance']
+
+# (color) - bytes en BGR
+# color RGB entre 0 y 1 para el archivo, color() lo convierte de regreso sin perdida
+def colorList(c):
+    return [c[2] / 255, c[1] / 255, c[0] / 255]
+
+class SceneLoader(object):
+    # (carpeta base)
+    # construye los objetos de una escena, los materiales y las texturas se crean una sola vez
+    def __init__(self, base):
+        self.base = base
+        self.textures = {}
+        self.materials = {}
+        self.named = {}
+
+        # modelos con nombre (diccionarios) y los ya construidos
+        self.model_data = {}
+        self.models = {}
+
+    # (ruta) - relativa al archivo de la escena
+    def path(self, path):
+        return os.path.normpath(os.path.join(self.base, path))
+
+    def texture(self, path):
+        path = self.path(path)
+        if path not in self.textures:
+            self.textures[path] = Texture(path)
+
+        return self.textures[path]
+
+    # (material) - nombre o diccionario
+    # los materiales iguales escritos dentro de varios objetos se comparten
+    def material(self, value):
+        if isinstance(value, str):
+            if value not in self.named:
+                raise ValueError('material %r no esta definido en "materials"' % value)
+            return self.named[value]
+
+        key = json.dumps(value, sort_keys = True)
+        if key not in self.materials:
+            self.materials[key] = Material(
+                diffuse = color(*value.get('diffuse', [1, 1, 1])),
+                spec = value.get('spec', 0),
+                ior = value.get('ior', 1),
+                texture = self.texture(value['texture']) if value.get('texture') else None,
+                t = TYPES[value.get('type', 'opaque')]
+            )
+
+        return self.materials[key]
+
+    # (diccionario de la escena, arreglos del archivo binario, width, height)
+    # regresa el RayTracer con la escena
+    def build(self, data, arrays = None, width = None, height = None):
+        r = RayTracer(width or data.get('width', 512), height or data.get('height', 512))
+
+        camera = data.get('camera', {})
+        r.cam_position = list(camera.get('position', [0, 0, 0]))
+        r.fov = camera.get('fov', 60)
+        if 'target' in camera:
+            r.glLookAt(r.cam_position, camera['target'], camera.get('up', [0, 1, 0]))
+        elif 'rotation' in camera:
+            r.cam_rotation = np.array(camera['rotation'], dtype = float)
+
+        if 'background' in data:
+            r.glClearColor(*data['background'])
+            r.glClear()
+
+        envmap = data.get('envmap')
+        if isinstance(envmap, str):
+            r.env_map = Envmap(self.path(envmap))
+        elif envmap:
+            r.env_map = Envmap(self.path(envmap['path']), envmap.get('lut', 0), envmap.get('bilinear', False))
+
+        if 'ambient' in data:
+            light = data['ambient']
+            r.ambient_light = AmbientLight(strength = light.get('strength', 0), _color_ = color(*light.get('color', [1, 1, 1])))
+
+        if 'directional' in data:
+            light = data['directional']
+            r.directional_light = DirectionalLight(
+                direction = light.get('direction', [0, -1, 0]),
+                intensity = light.get('intensity', 1),
+                _color_ = color(*light.get('color', [1, 1, 1]))
+            )
+
+        for light in data.get('point_lights', []):
+            r.point_lights.append(PointLight(
+                position = list(light.get('position', [0, 0, 0])),
+                intensity = light.get('intensity', 1),
+                _color_ = color(*light.get('color', [1, 1, 1])),
+                falloff = light.get('falloff', 0)
+            ))
+
+        for light in data.get('area_lights', []):
+            r.area_lights.append(self.areaLight(light))
+
+        for name, value in data.get('materials', {}).items():
+            self.named[name] = self.material(value)
+
+        self.model_data = data.get('models', {})
+
+        for obj in data.get('objects', []):
+            r.scene.append(self.object(obj, arrays))
+
+        if arrays is not None and 'kind' in arrays:
+            r.scene.extend(self.objects(data, arrays))
+
+        return r
+
+    # (luz) - diccionario de una luz con superficie
+    def areaLight(self, light):
+        options = {
+            'intensity': light.get('intensity', 1),
+            '_color_': color(*light.get('color', [1, 1, 1])),
+            'samples': light.get('samples', 16),
+            'seed': light.get('seed', 0),
+        }
+
+        kind = light.get('type')
+        if kind == 'rect':
+            return RectLight(list(light['corner']), list(light['edge1']), list(light['edge2']), **options)
+        if kind == 'sphere':
+            return SphereLight(list(light['center']), light['radius'], **options)
+        if kind == 'block':
+            return BlockLight(list(light['position']), list(light.get('size', [1, 1, 1])), **options)
+
+        raise ValueError('tipo de luz desconocido: %r' % kind)
+
+    # (objeto, arreglos) - diccionario de un objeto
+    def object(self, obj, arrays = None):
+        kind = obj.get('type')
+
+        if kind == 'cube':
+            return Cube(list(obj['position']), list(obj.get('size', [1, 1, 1])), self.material(obj['material']))
+        if kind == 'sphere':
+            return Sphere(list(obj['center']), obj['radius'], self.material(obj['material']))
+        if kind == 'plane':
+            return Plane(list(obj['position']), list(obj.get('normal', [0, 1, 0])), self.material(obj['material']))
+        if kind == 'grid':
+            grid = VoxelGrid(obj['origin'], obj['dimensions'], obj.get('scale', 1))
+            grid.materials = [self.material(m) for m in obj['palette']]
+
+            if isinstance(obj.get('cells'), str):
+                # celdas guardadas como arreglo en el archivo binario
+                grid.cells[:] = arrays[obj['cells']]
+            else:
+                blocks = np.asarray(obj.get('blocks', []), dtype = int).reshape(-1, 4)
+                grid.cells[blocks[:, 0], blocks[:, 1], blocks[:, 2]] = blocks[:, 3]
+
+            return grid
+        if kind == 'mesh':
+            return loadOBJ(self.path(obj['path']), self.material(obj['material']), obj.get('leaf_size', 8))
+        if kind == 'group':
+            return Group([self.object(o, arrays) for o in obj['objects']])
+        if kind == 'instance':
+            material = self.material(obj['material']) if 'material' in obj else None
+            return Instance(self.model(obj['geometry'], arrays), self.transform(obj), material)
+
+        raise ValueError('tipo de objeto desconocido: %r' % kind)
+
+    # (modelo, arreglos) - nombre en "models" o diccionario de un objeto
+    # los modelos con nombre se construyen la primera vez que se usan
+    def model(self, value, arrays = None):
+        if not isinstance(value, str):
+            return self.object(value, arrays)
+
+        if value not in self.models:
+            if value not in self.model_data:
+                raise ValueError('modelo %r no esta definido en "models"' % value)
+            self.models[value] = self.object(self.model_data[value], arrays)
+
+        return self.models[value]
+
+    # (instancia) - diccionario
+    # matriz 4x4 de la instancia, "transform" por filas o translate * rotate * scale
+    def transform(self, obj):
+        if 'transform' in obj:
+            return np.array(obj['transform'], dtype = float).reshape(4, 4)
+
+        matrix = np.identity(4)
+        if 'translate' in obj:
+            matrix = matrix @ translation(*obj['translate'])
+        if 'rotate' in obj:
+            matrix = matrix @ rotation(obj['rotate'][:3], obj['rotate'][3])
+        if 'scale' in obj:
+            scale = obj['scale']
+            matrix = matrix @ (scaling(*scale) if isinstance(scale, list) else scaling(scale))
+
+        return matrix
+
+    # (diccionario, arreglos)
+    # objetos de la version binaria, una fila de params por objeto
+    def objects(self, data, arrays):
+        materials = [self.material(m) for m in data['material_table']]
+        grids = data.get('grids', [])
+        meshes = data.get('meshes', [])
+        composites = data.get('composites', [])
+
+        objects = []
+        for kind, material, params in zip(arrays['kind'].tolist(), arrays['material'].tolist(), arrays['params'].tolist()):
+            if kind == 0:
+                objects.append(Cube(params[0:3], params[3:6], materials[material]))
+            elif kind == 1:
+                objects.append(Sphere(params[0:3], params[3], materials[material]))
+            elif kind == 2:
+                objects.append(Plane(params[0:3], params[3:6], materials[material]))
+            elif kind == 3:
+                objects.append(self.object(grids[int(params[0])], arrays))
+            elif kind == 4:
+                objects.append(self.object(meshes[int(params[0])]))
+            else:
+                objects.append(self.object(composites[int(params[0])], arrays))
+
+        return objects
+
+# (ruta, width, height)
+# carga una escena .json, .toml o .npz y regresa el RayTracer
+def loadScene(path, width = None, height = None):
+    loader = SceneLoader(os.path.dirname(os.path.abspath(path)))
+
+    if path.endswith('.npz'):
+        with np.load(path, allow_pickle = False) as data:
+            arrays = {key: data[key] for key in data.files}
+        return loader.build(json.loads(str(arrays.pop('scene'))), arrays, width, height)
+
+    if path.endswith('.toml'):
+        if tomllib is None:
+            raise ImportError('se necesita python 3.11 (tomllib) para leer escenas .toml')
+        with open(path, 'rb') as file:
+            return loader.build(tomllib.load(file), None, width, height)
+
+    with open(path) as file:
+        return loader.build(json.load(file), None, width, height)
+
+class SceneWriter(object):
+    # (carpeta base)
+    # convierte un RayTracer al formato de escenas
+    def __init__(self, base):
+        self.base = base
+        self.materials = []
+
+        # geometrias compartidas por instancias, se guardan una vez en "models"
+        self.models = []
+        self.model_dicts = []
+
+    def path(self, path):
+        return os.path.relpath(os.path.abspath(path), self.base).replace(os.sep, '/')
+
+    # (material)
+    # indice del material en la tabla, los materiales se comparan por identidad
+    def material(self, material):
+        for i, m in enumerate(self.materials):
+            if m is material:
+                return i
+
+        self.materials.append(material)
+        return len(self.materials) - 1
+
+    def materialDict(self, m):
+        value = {'diffuse': colorList(m.diffuse), 'spec': m.spec, 'ior': m.ior, 'type': TYPE_NAMES[m.type]}
+        if m.texture is not None:
+            value['texture'] = self.path(m.texture.path)
+
+        return value
+
+    # (render)
+    # diccionario sin los objetos
+    def header(self, r):
+        data = {
+            'width': r.width,
+            'height': r.height,
+            'camera': {'position': list(r.cam_position), 'fov': r.fov},
+            'background': colorList(r.clear_color),
+            'point_lights': [self.pointLight(l) for l in r.point_lights]
+        }
+
+        if r.cam_rotation is not None:
+            data['camera']['rotation'] = r.cam_rotation.tolist()
+        if r.env_map is not None:
+            data['envmap'] = self.path(r.env_map.path)
+            if r.env_map.lut_size or r.env_map.bilinear:
+                data['envmap'] = {'path': data['envmap'], 'lut': r.env_map.lut_size, 'bilinear': r.env_map.bilinear}
+        if r.ambient_light:
+            data['ambient'] = {'strength': r.ambient_light.strength, 'color': colorList(r.ambient_light.color)}
+        if r.directional_light:
+            light = r.directional_light
+            data['directional'] = {'direction': list(light.direction), 'intensity': light.intensity, 'color': colorList(light.color)}
+        if r.area_lights:
+            data['area_lights'] = [self.areaLight(light) for light in r.area_lights]
+
+        return data
+
+    # (luz de punto) - falloff solo se escribe si la luz se atenua
+    def pointLight(self, light):
+        value = {'position': list(light.position), 'intensity': light.intensity, 'color': colorList(light.color)}
+        if light.falloff:
+            value['falloff'] = light.falloff
+        return value
+
+    # (luz con superficie)
+    def areaLight(self, light):
+        if isinstance(light, RectLight):
+            value = {'type': 'rect', 'corner': list(light.corner), 'edge1': list(light.edge1), 'edge2': list(light.edge2)}
+        elif isinstance(light, SphereLight):
+            value = {'type': 'sphere', 'center': list(light.center), 'radius': light.radius}
+        else:
+            value = {'type': 'block', 'position': list(light.position), 'size': list(light.size)}
+
+        value.update(intensity = light.intensity, color = colorList(light.color), samples = light.samples, seed = light.seed)
+        return value
+
+    # (cuadricula, arreglos)
+    # diccionario de una cuadricula, con arrays las celdas se guardan como arreglo
+    def grid(self, grid, arrays = None):
+        value = {
+            'type': 'grid',
+            'origin': list(grid.origin),
+            'dimensions': list(grid.dimensions),
+            'scale': grid.scale,
+            'palette': ['m%d' % self.material(m) for m in grid.materials],
+        }
+
+        if arrays is None:
+            cells = np.argwhere(grid.cells)
+            value['blocks'] = np.column_stack([cells, grid.cells[tuple(cells.T)]]).tolist()
+        else:
+            value['cells'] = 'grid%d' % len([k for k in arrays if k.startswith('grid')])
+            arrays[value['cells']] = grid.cells
+
+        return value
+
+    # (malla)
+    # solo las mallas cargadas de un archivo .obj se pueden guardar
+    def mesh(self, mesh):
+        if mesh.path is None:
+            raise ValueError('solo se pueden guardar mallas cargadas con loadOBJ')
+
+        return {
+            'type': 'mesh',
+            'path': self.path(mesh.path),
+            'material': 'm%d' % self.material(mesh.material),
+            'leaf_size': mesh.leaf_size,
+        }
+
+    # (geometria)
+    # nombre del modelo, las geometrias se comparan por identidad
+    def model(self, geometry):
+        for i, m in enumerate(self.models):
+            if m is geometry:
+                return 'g%d' % i
+
+        self.models.append(geometry)
+        self.model_dicts.append(self.object(geometry))
+        return 'g%d' % (len(self.models) - 1)
+
+    # (objeto)
+    # diccionario de un objeto para la version de texto
+    def object(self, obj):
+        if isinstance(obj, VoxelGrid):
+            return self.grid(obj)
+        if isinstance(obj, Mesh):
+            return self.mesh(obj)
+        if isinstance(obj, Group):
+            return {'type': 'group', 'objects': [self.object(o) for o in obj.objects]}
+        if isinstance(obj, Instance):
+            value = {'type': 'instance', 'geometry': self.model(obj.geometry), 'transform': obj.transform.ravel().tolist()}
+            if obj.override:
+                value['material'] = 'm%d' % self.material(obj.material)
+            return value
+
+        if isinstance(obj, Cube):
+            value = {'type': 'cube', 'position': list(obj.position), 'size': list(obj.size)}
+        elif isinstance(obj, Sphere):
+            value = {'type': 'sphere', 'center': list(obj.center), 'radius': obj.radius}
+        elif isinstance(obj, Plane):
+            value = {'type': 'plane', 'position': list(obj.position), 'normal': list(obj.normal)}
+        else:
+            raise ValueError('no se puede guardar un objeto de tipo %s' % type(obj).__name__)
+
+        value['material'] = 'm%d' % self.material(obj.material)
+        return value
+
+    def named(self):
+        return {'m%d' % i: self.materialDict(m) for i, m in enumerate(self.materials)}
+
+    # (render)
+    # version de texto, todos los objetos en "objects"
+    def toDict(self, r):
+        data = self.header(r)
+        objects = [self.object(obj) for obj in r.scene]
+        data['materials'] = self.named()
+        data['objects'] = objects
+        if self.models:
+            data['models'] = {'g%d' % i: value for i, value in enumerate(self.model_dicts)}
+
+        return data
+
+    # (render)
+    # version binaria, regresa el diccionario y los arreglos (kind, material, params, celdas)
+    def toArrays(self, r):
+        data = self.header(r)
+        arrays = {}
+        grids = []
+        meshes = []
+        composites = []
+
+        n = len(r.scene)
+        kind = np.zeros(n, dtype = np.uint8)
+        material = np.zeros(n, dtype = np.int32)
+        params = np.zeros((n, 6))
+
+        for i, obj in enumerate(r.scene):
+            if isinstance(obj, VoxelGrid):
+                kind[i] = 3
+                params[i, 0] = len(grids)
+                grids.append(self.grid(obj, arrays))
+                continue
+            if isinstance(obj, Mesh):
+                kind[i] = 4
+                params[i, 0] = len(meshes)
+                meshes.append(self.mesh(obj))
+                continue
+            if isinstance(obj, (Group, Instance)):
+                kind[i] = 5
+                params[i, 0] = len(composites)
+                composites.append(self.object(obj))
+                continue
+
+            material[i] = self.material(obj.material)
+            if isinstance(obj, Cube):
+                kind[i] = 0
+                params[i] = list(obj.position) + list(obj.size)
+            elif isinstance(obj, Sphere):
+                kind[i] = 1
+                params[i, :4] = list(obj.center) + [obj.radius]
+            elif isinstance(obj, Plane):
+                kind[i] = 2
+                params[i] = list(obj.position) + list(obj.normal)
+            else:
+                raise ValueError('no se puede guardar un objeto de tipo %s' % type(obj).__name__)
+
+        data['materials'] = self.named()
+        data['material_table'] = ['m%d' % i for i in range(len(self.materials))]
+        data['grids'] = grids
+        data['meshes'] = meshes
+        data['composites'] = composites
+        data['models'] = {'g%d' % i: value for i, value in enumerate(self.model_dicts)}
+
+        arrays.update(kind = kind, material = material, params = params)
+        return data, arrays
+
+# (render, ruta)
+# guarda la escena como .json o .npz (binaria)
+def saveScene(r, path):
+    writer = SceneWriter(os.path.dirname(os.path.abspath(path)))
+
+    if path.endswith('.npz'):
+        data, arrays = writer.toArrays(r)
+        np.savez_compressed(path, scene = np.array(json.dumps(data)), **arrays)
+    else:
+        # una linea por objeto y por material para que el archivo se pueda leer y comparar
+        data = writer.toDict(r)
+        lines = []
+        for key, value in data.items():
+            if key in ('objects', 'point_lights', 'area_lights'):
+                text = '[\n' + ',\n'.join('  ' + json.dumps(v) for v in value) + '\n ]' if value else '[]'
+            elif key in ('materials', 'models'):
+                text = '{\n' + ',\n'.join('  %s: %s' % (json.dumps(k), json.dumps(v)) for k, v in value.items()) + '\n }'
+            else:
+                text = json.dumps(value)
+            lines.append(' %s: %s' % (json.dumps(key), text))
+
+        with open(path, 'w') as file:
+            file.write('{\n' + ',\n'.join(lines) + '\n}\n')
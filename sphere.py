@@ -25,13 +25,16 @@ class Material(object):
 
 class Intersect(object):
     # inicialización
-    def __init__(self, distance, point, normal, texture, obj):
+    def __init__(self, distance, point, normal, texture, obj, material = None):
         self.distance = distance
         self.point = point
         self.normal = normal
         self.texture = texture
         self.scene_object = obj
 
+        # material del punto, solo si es distinto al material del objeto
+        self.material = material
+
 class AmbientLight(object):
     # inicialización
     def __init__(self, strength = 0, _color_ = WHITE):
@@ -40,10 +43,12 @@ class AmbientLight(object):
 
 class PointLight(object):
     # inicialización
-    def __init__(self, position = [0, 0, 0], intensity = 1, _color_ = WHITE):
+    # falloff atenua la luz con la distancia: 1 / (1 + falloff * distancia^2), 0 no se atenua
+    def __init__(self, position = [0, 0, 0], intensity = 1, _color_ = WHITE, falloff = 0):
         self.position = position
         self.intensity = intensity
         self.color = _color_
+        self.falloff = falloff
 
 class DirectionalLight(object):
     # inicialización
@@ -59,6 +64,14 @@ class Sphere(object):
         self.radius = radius
         self.material = material
 
+    # no tiene parámetros
+    # caja alineada a los ejes que contiene a la esfera (minimo, maximo)
+    def bounds(self):
+        return (
+            [c - self.radius for c in self.center],
+            [c + self.radius for c in self.center]
+        )
+
     def ray_intersect(self, orig, dir):
         # Regresa falso o verdadero si hace interseccion con una esfera
 
@@ -97,9 +110,53 @@ class Sphere(object):
             point = hit,
             normal = norm,
             texture = uvs,
-            object = self
+            obj = self
         )
 
+    # (origen, direccion, distancia maxima)
+    # regresa verdadero si el rayo choca con la esfera antes de max_distance
+    # no calcula punto, normal ni uvs
+    def ray_occluded(self, orig, dir, max_distance = float('inf')):
+        L = [self.center[0] - orig[0], self.center[1] - orig[1], self.center[2] - orig[2]]
+        tca = L[0] * dir[0] + L[1] * dir[1] + L[2] * dir[2]
+        d2 = L[0] * L[0] + L[1] * L[1] + L[2] * L[2] - tca * tca
+
+        if d2 > self.radius ** 2:
+            return False
+
+        thc = (self.radius ** 2 - d2) ** 0.5
+        t0 = tca - thc
+        if t0 < 0:
+            t0 = tca + thc
+
+        return 0 <= t0 < max_distance
+
+    # (origenes, direcciones) - arreglos (N, 3)
+    # interseccion de un paquete de rayos con la esfera
+    # regresa distancias (inf si no hay interseccion), normales y uvs
+    def ray_intersect_packet(self, orig, dir):
+        L = np.asarray(self.center, dtype = float) - orig
+        tca = np.einsum('ij,ij->i', L, dir)
+        d2 = np.einsum('ij,ij->i', L, L) - tca ** 2
+
+        hit = d2 <= self.radius ** 2
+        thc = np.sqrt(np.maximum(self.radius ** 2 - d2, 0))
+        t0 = tca - thc
+        t0 = np.where(t0 < 0, tca + thc, t0)
+        hit &= t0 >= 0
+
+        t = np.where(hit, t0, np.inf)
+
+        norm = orig + np.where(hit, t0, 0)[:, None] * dir - self.center
+        norm /= np.maximum(np.linalg.norm(norm, axis = 1), 1e-12)[:, None]
+
+        uvs = np.empty((len(t), 2))
+        uvs[:, 0] = 1 - (arctan2(norm[:, 2], norm[:, 0]) / (2 * np.pi) + 0.5)
+        uvs[:, 1] = arccos(np.clip(-norm[:, 1], -1, 1)) / np.pi
+
+        return t, norm, uvs
+
+
 class Plane(object):
     def __init__(self, position, normal, material):
         self.position = position
@@ -124,78 +181,189 @@ class Plane(object):
 
         return None
 
+    # (origen, direccion, distancia maxima)
+    # regresa verdadero si el rayo choca con el plano antes de max_distance
+    def ray_occluded(self, orig, dir, max_distance = float('inf')):
+        denom = mathDotProduct(dir, self.normal)
+
+        if abs(denom) > 0.0001:
+            t = mathDotProduct(self.normal, mathVectorSubstraction(self.position, orig)) / denom
+            return 0 < t < max_distance
+
+        return False
+
+    # (origenes, direcciones) - arreglos (N, 3)
+    # interseccion de un paquete de rayos con el plano (no tiene uvs)
+    def ray_intersect_packet(self, orig, dir):
+        normal = np.asarray(self.normal, dtype = float)
+        denom = dir @ normal
+        valid = np.abs(denom) > 0.0001
+
+        t = ((np.asarray(self.position, dtype = float) - orig) @ normal) / np.where(valid, denom, 1)
+        t = np.where(valid & (t > 0), t, np.inf)
+
+        norm = np.broadcast_to(normal, dir.shape)
+        uvs = np.full((len(t), 2), np.nan)
+
+        return t, norm, uvs
+
 # Cubos
 class Cube(object):
     def __init__(self, position, size, material):
         self.position = position
         self.size = size
         self.material = material
-        self.planes = []
 
-        halfSizeX = size[0] / 2
-        halfSizeY = size[1] / 2
-        halfSizeZ = size[2] / 2
+        epsilon = 0.001
 
-        self.planes.append(Plane(mathVectorAdd(position, [halfSizeX, 0, 0]), [1, 0, 0], material))
-        self.planes.append(Plane(mathVectorAdd(position, [-halfSizeX, 0, 0]), [-1, 0, 0], material))
+        # caras del cubo y limites con tolerancia, se calculan una sola vez
+        self.faceMin = [position[i] - size[i] / 2 for i in range(3)]
+        self.faceMax = [position[i] + size[i] / 2 for i in range(3)]
+        self.boundsMin = [position[i] - (epsilon + size[i] / 2) for i in range(3)]
+        self.boundsMax = [position[i] + (epsilon + size[i] / 2) for i in range(3)]
+
+    # no tiene parámetros
+    # caja alineada a los ejes que contiene al cubo (minimo, maximo)
+    # incluye el mismo epsilon que se usa en ray_intersect
+    def bounds(self):
+        return (list(self.boundsMin), list(self.boundsMax))
+
+    # (origen, direccion)
+    # metodo de slabs, se busca la cara de entrada (o de salida si el origen esta dentro)
+    # regresa (distancia, eje, signo de la normal, punto) o None si no hay interseccion
+    def slab(self, orig, dir):
+        faceMin = self.faceMin
+        faceMax = self.faceMax
+        boundsMin = self.boundsMin
+        boundsMax = self.boundsMax
+
+        tnear = -float('inf')
+        tfar = float('inf')
+        near_axis = far_axis = -1
 
-        self.planes.append(Plane(mathVectorAdd(position, [0, halfSizeY, 0]), [0, 1, 0], material))
-        self.planes.append(Plane(mathVectorAdd(position, [0, -halfSizeY, 0]), [0, -1, 0], material))
+        for i in range(3):
+            d = dir[i]
+
+            # rayo paralelo a las caras de este eje
+            if -0.0001 <= d <= 0.0001:
+                if orig[i] < boundsMin[i] or orig[i] > boundsMax[i]:
+                    return None
+                continue
+
+            inverse = 1 / d
+            t1 = (faceMin[i] - orig[i]) * inverse
+            t2 = (faceMax[i] - orig[i]) * inverse
+            if t1 > t2:
+                t1, t2 = t2, t1
+
+            if t1 > tnear:
+                tnear = t1
+                near_axis = i
+            if t2 < tfar:
+                tfar = t2
+                far_axis = i
+
+        if tfar <= 0:
+            return None
 
-        self.planes.append(Plane(mathVectorAdd(position, [0, 0, halfSizeZ]), [0, 0, 1], material))
-        self.planes.append(Plane(mathVectorAdd(position, [0, 0, -halfSizeZ]), [0, 0, -1], material))
+        if tnear > 0:
+            t = tnear
+            axis = near_axis
+            sign = -1 if dir[axis] > 0 else 1
+        else:
+            # el origen esta dentro del cubo, se usa la cara de salida
+            t = tfar
+            axis = far_axis
+            sign = 1 if dir[axis] > 0 else -1
+
+        if axis < 0:
+            return None
 
+        point = [orig[0] + t * dir[0], orig[1] + t * dir[1], orig[2] + t * dir[2]]
 
+        # igual que con los planos, el punto debe estar dentro de los limites con tolerancia
+        for i in range(3):
+            if point[i] < boundsMin[i] or point[i] > boundsMax[i]:
+                return None
+
+        return t, axis, sign, point
+
+    # (origen, direccion)
+    # interseccion con el cubo, solo para la cara ganadora se calculan la normal y las uvs
     def ray_intersect(self, orig, dir):
+        hit = self.slab(orig, dir)
+        if hit is None:
+            return None
 
-        epsilon = 0.001
+        t, axis, sign, point = hit
+        boundsMin = self.boundsMin
+        boundsMax = self.boundsMax
 
-        boundsMin = [0, 0, 0]
-        boundsMax = [0, 0, 0]
+        normal = [0, 0, 0]
+        normal[axis] = sign
 
-        for i in range(3):
-            boundsMin[i] = self.position[i] - (epsilon + self.size[i] / 2)
-            boundsMax[i] = self.position[i] + (epsilon + self.size[i] / 2)
-
-        t = float('inf')
-        intersect = None
-
-        for plane in self.planes:
-            planeInter = plane.ray_intersect(orig, dir)
-
-            if planeInter is not None:
-                # Si estoy dentro del bounding box
-                if planeInter.point[0] >= boundsMin[0] and planeInter.point[0] <= boundsMax[0]:
-                    if planeInter.point[1] >= boundsMin[1] and planeInter.point[1] <= boundsMax[1]:
-                        if planeInter.point[2] >= boundsMin[2] and planeInter.point[2] <= boundsMax[2]:
-                            if planeInter.distance < t:
-                                t = planeInter.distance
-                                intersect = planeInter
-
-                                if abs(plane.normal[0]) > 0:
-                                    # mapear uvs para eje x. Uso coordenadas en Y y Z.
-                                    u = (planeInter.point [1] - boundsMin[1]) / (boundsMax[1] - boundsMin[1])
-                                    v = (planeInter.point [2] - boundsMin[2]) / (boundsMax[2] - boundsMin[2])
-
-                                elif abs(plane.normal[1]) > 0:
-                                    # mapear uvs para eje y. Uso coordenadas en X y Z.
-                                    u = (planeInter.point [0] - boundsMin[0]) / (boundsMax[0] - boundsMin[0])
-                                    v = (planeInter.point [2] - boundsMin[2]) / (boundsMax[2] - boundsMin[2])
-
-                                elif abs(plane.normal[2]) > 0:
-                                    # mapear uvs para eje Z. Uso coordenadas en X y Y.
-                                    u = (planeInter.point [0] - boundsMin[0]) / (boundsMax[0] - boundsMin[0])
-                                    v = (planeInter.point [1] - boundsMin[1]) / (boundsMax[1] - boundsMin[1])
-
-                                uvs = [u, v]
-
-        if intersect is None:
-            return None
+        # mapear uvs con los dos ejes restantes
+        a, b = (1, 2) if axis == 0 else (0, 2) if axis == 1 else (0, 1)
+        u = (point[a] - boundsMin[a]) / (boundsMax[a] - boundsMin[a])
+        v = (point[b] - boundsMin[b]) / (boundsMax[b] - boundsMin[b])
 
         return Intersect(
-            distance = intersect.distance,
-            point = intersect.point,
-            normal = intersect.normal,
-            texture = uvs,
+            distance = t,
+            point = point,
+            normal = normal,
+            texture = [u, v],
             obj = self
-        )
\ No newline at end of file
+        )
+
+    # (origen, direccion, distancia maxima)
+    # regresa verdadero si el rayo choca con el cubo antes de max_distance
+    def ray_occluded(self, orig, dir, max_distance = float('inf')):
+        hit = self.slab(orig, dir)
+        return hit is not None and hit[0] < max_distance
+
+    # (origenes, direcciones) - arreglos (N, 3)
+    # version por paquetes de ray_intersect
+    def ray_intersect_packet(self, orig, dir):
+        n = len(orig)
+        faceMin = np.asarray(self.faceMin)
+        faceMax = np.asarray(self.faceMax)
+        boundsMin = np.asarray(self.boundsMin)
+        boundsMax = np.asarray(self.boundsMax)
+
+        parallel = np.abs(dir) <= 0.0001
+        inverse = 1 / np.where(parallel, 1, dir)
+
+        t1 = (faceMin - orig) * inverse
+        t2 = (faceMax - orig) * inverse
+        entry = np.where(parallel, -np.inf, np.minimum(t1, t2))
+        exit = np.where(parallel, np.inf, np.maximum(t1, t2))
+
+        near_axis = entry.argmax(axis = 1)
+        far_axis = exit.argmin(axis = 1)
+        rows = np.arange(n)
+        tnear = entry[rows, near_axis]
+        tfar = exit[rows, far_axis]
+
+        inside = tnear <= 0
+        t = np.where(inside, tfar, tnear)
+        axis = np.where(inside, far_axis, near_axis)
+
+        valid = (tfar > 0) & ~(parallel.all(axis = 1))
+        valid &= ~(parallel & ((orig < boundsMin) | (orig > boundsMax))).any(axis = 1)
+
+        point = orig + np.where(valid, t, 0)[:, None] * dir
+        valid &= np.all((point >= boundsMin) & (point <= boundsMax), axis = 1)
+
+        outward = dir[rows, axis] > 0
+        sign = np.where(inside == outward, 1, -1)
+
+        norm = np.zeros((n, 3))
+        norm[rows, axis] = sign
+
+        others = np.array([[1, 2], [0, 2], [0, 1]])[axis]
+        extent = boundsMax - boundsMin
+        uvs = np.full((n, 2), np.nan)
+        uvs[:, 0] = (point[rows, others[:, 0]] - boundsMin[others[:, 0]]) / extent[others[:, 0]]
+        uvs[:, 1] = (point[rows, others[:, 1]] - boundsMin[others[:, 1]]) / extent[others[:, 1]]
+
+        return np.where(valid, t, np.inf), norm, uvs
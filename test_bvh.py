@@ -0,0 +1,60 @@
+import random
+import unittest
+import numpy as np
+from gl import RayTracer, color
+from bvh import BVH
+from sphere import Sphere, Cube, Plane, Material, PointLight, REFLECTIVE
+
+# (render)
+# esferas y cubos al azar sobre un plano, con una luz de punto
+def scene(r, seed = 0):
+    rng = random.Random(seed)
+    red = Material(diffuse = color(1, 0.2, 0.2), spec = 16)
+    blue = Material(diffuse = color(0.2, 0.3, 1))
+    mirror = Material(spec = 64, t = REFLECTIVE)
+
+    r.point_lights.append(PointLight(position = [2, 4, -3], intensity = 0.8))
+    for i in range(40):
+        position = [rng.uniform(-4, 4), rng.uniform(-2, 2), rng.uniform(-12, -4)]
+        if i % 2:
+            r.scene.append(Sphere(position, rng.uniform(0.2, 0.8), red if i % 3 else mirror))
+        else:
+            r.scene.append(Cube(position, [1, 1, 1], blue))
+    r.scene.append(Plane([0, -3, 0], [0, 1, 0], blue))
+
+    return r
+
+class BVHTest(unittest.TestCase):
+    # el BVH debe encontrar el mismo objeto a la misma distancia que la busqueda lineal
+    def test_intersect(self):
+        r = scene(RayTracer(8, 8))
+        tree = BVH(r.scene)
+
+        rng = np.random.RandomState(1)
+        for direction in rng.normal(size = (300, 3)):
+            direction = (direction / np.linalg.norm(direction)).tolist()
+            origin = [0, 0, 0]
+
+            r.bvh = None
+            material, hit = r.scene_intercept(origin, direction)
+            occluded = r.scene_occluded(origin, direction, 6)
+
+            r.bvh = tree
+            self.assertIs(r.scene_intercept(origin, direction)[0], material)
+            if hit is not None:
+                self.assertEqual(r.scene_intercept(origin, direction)[1].distance, hit.distance)
+            self.assertEqual(r.scene_occluded(origin, direction, 6), occluded)
+
+    # mismo render con y sin BVH
+    def test_render(self):
+        linear = scene(RayTracer(24, 24))
+        linear.glRayTracingRender()
+
+        tree = scene(RayTracer(24, 24))
+        tree.glBuildBVH()
+        tree.glRayTracingRender()
+
+        np.testing.assert_array_equal(tree.pixels, linear.pixels)
+
+if __name__ == '__main__':
+    unittest.main()
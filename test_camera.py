@@ -0,0 +1,25 @@
+import unittest
+import numpy as np
+from gl import RayTracer
+
+class LookAtTest(unittest.TestCase):
+    # toma desde arriba: la direccion de la cámara es paralela a arriba
+    def test_top_down(self):
+        r = RayTracer(8, 8)
+        r.glLookAt([0, 5, 0], [0, 0, 0])
+
+        self.assertTrue(np.isfinite(r.cam_rotation).all())
+        np.testing.assert_allclose(r.cam_rotation.T @ r.cam_rotation, np.identity(3), atol = 1e-12)
+        # la cámara mira hacia -z local, que debe apuntar hacia abajo
+        np.testing.assert_allclose(-r.cam_rotation[:, 2], [0, -1, 0], atol = 1e-12)
+
+        directions = r.glPrimaryDirectionPacket(np.array([4.0]), np.array([4.0]))
+        self.assertTrue(np.isfinite(directions).all())
+
+    def test_same_point(self):
+        r = RayTracer(8, 8)
+        with self.assertRaises(ValueError):
+            r.glLookAt([1, 2, 3], [1, 2, 3])
+
+if __name__ == '__main__':
+    unittest.main()
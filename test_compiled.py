@@ -0,0 +1,65 @@
+import random
+import unittest
+import numpy as np
+from gl import RayTracer, color
+from sphere import Sphere, Cube, Plane, Material, PointLight, DirectionalLight, AmbientLight, REFLECTIVE, TRANSPARENT
+
+# (render)
+# esferas, cubos y planos con materiales opacos, espejos y vidrio
+def scene(r, seed = 0):
+    rng = random.Random(seed)
+    materials = [
+        Material(diffuse = color(1, 0.2, 0.2), spec = 16),
+        Material(diffuse = color(0.2, 0.3, 1)),
+        Material(spec = 64, t = REFLECTIVE),
+        Material(spec = 64, ior = 1.5, t = TRANSPARENT)
+    ]
+
+    r.point_lights.append(PointLight(position = [2, 4, -3], intensity = 0.7))
+    r.point_lights.append(PointLight(position = [-3, 2, -6], intensity = 0.3))
+    r.directional_light = DirectionalLight(direction = [0.3, -1, -0.2], intensity = 0.5)
+    r.ambient_light = AmbientLight(strength = 0.2)
+
+    for i in range(24):
+        position = [rng.uniform(-4, 4), rng.uniform(-2, 2), rng.uniform(-12, -4)]
+        material = materials[i % len(materials)]
+        if i % 2:
+            r.scene.append(Sphere(position, rng.uniform(0.2, 0.8), material))
+        else:
+            r.scene.append(Cube(position, [1, 1, 1], material))
+    r.scene.append(Plane([0, -3, 0], [0, 1, 0], materials[1]))
+
+    return r
+
+class CompiledSceneTest(unittest.TestCase):
+    # los grupos de la escena compilada dan lo mismo que los kernels de cada objeto
+    def test_intersect(self):
+        r = scene(RayTracer(8, 8))
+
+        rng = np.random.RandomState(1)
+        directions = rng.normal(size = (500, 3))
+        directions /= np.linalg.norm(directions, axis = 1)[:, None]
+        origins = np.tile([0.0, 0.5, -1.0], (500, 1))
+        exclude = rng.randint(-1, len(r.scene), 500)
+
+        r.compiled = None
+        expected = r.scene_intercept_packet(origins, directions, exclude)
+
+        r.glCompileScene()
+        result = r.scene_intercept_packet(origins, directions, exclude)
+
+        for a, b in zip(result, expected):
+            np.testing.assert_array_equal(a, b)
+
+    # el modo por paquetes (con la escena compilada) da el mismo render que el modo original
+    def test_render(self):
+        scalar = scene(RayTracer(32, 32))
+        scalar.glRayTracingRender()
+
+        packet = scene(RayTracer(32, 32))
+        packet.glRayTracingRenderPacket()
+
+        np.testing.assert_array_equal(packet.pixels, scalar.pixels)
+
+if __name__ == '__main__':
+    unittest.main()
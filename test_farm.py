@@ -0,0 +1,39 @@
+import threading
+import unittest
+import numpy as np
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+from gl import RayTracer, color
+from sphere import Sphere, Material, PointLight
+from farm import Coordinator, runWorker
+
+def scene():
+    r = RayTracer(16, 16)
+    r.point_lights.append(PointLight(position = [0, 3, 0], intensity = 0.8))
+    r.scene.append(Sphere([0, 0, -5], 1, Material(diffuse = color(1, 0.2, 0.2))))
+    return r
+
+class FarmTest(unittest.TestCase):
+    # un cliente con la clave incorrecta no debe detener al coordinador
+    def test_bad_authkey(self):
+        expected = scene()
+        expected.glRayTracingRender()
+
+        r = scene()
+        coordinator = Coordinator(r, ('localhost', 0), b'clave', tile_size = 8)
+        thread = threading.Thread(target = coordinator.run, daemon = True)
+        thread.start()
+
+        with self.assertRaises(AuthenticationError):
+            Client(coordinator.address, authkey = b'otra')
+
+        # sin el coordinador aceptando conexiones el worker se queda esperando, por eso va en otro hilo
+        worker = threading.Thread(target = runWorker, args = (coordinator.address, b'clave', 10), daemon = True)
+        worker.start()
+        thread.join(30)
+
+        self.assertFalse(thread.is_alive())
+        np.testing.assert_array_equal(r.pixels, expected.pixels)
+
+if __name__ == '__main__':
+    unittest.main()
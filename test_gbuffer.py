@@ -0,0 +1,55 @@
+import unittest
+import numpy as np
+from gl import RayTracer, color
+from sphere import Sphere, Cube, Plane, Material, PointLight, DirectionalLight, AmbientLight, REFLECTIVE
+
+# (render)
+# cubos, esferas, un espejo y un plano con dos luces de punto
+def scene(r):
+    red = Material(diffuse = color(1, 0.2, 0.2), spec = 16)
+    gray = Material(diffuse = color(0.6, 0.6, 0.6))
+    mirror = Material(spec = 64, t = REFLECTIVE)
+
+    r.point_lights.append(PointLight(position = [2, 4, -3], intensity = 0.7))
+    r.point_lights.append(PointLight(position = [-3, 2, -6], intensity = 0.3))
+    r.directional_light = DirectionalLight(direction = [0.3, -1, -0.2], intensity = 0.4)
+    r.ambient_light = AmbientLight(strength = 0.2)
+
+    for x in range(-2, 3):
+        r.scene.append(Cube([x * 1.5, -1, -7], [1, 1, 1], red if x % 2 else gray))
+    r.scene.append(Sphere([0, 1, -8], 0.8, mirror))
+    r.scene.append(Sphere([-2, 1, -6], 0.5, red))
+    r.scene.append(Plane([0, -2, 0], [0, 1, 0], gray))
+
+    return r
+
+class GBufferTest(unittest.TestCase):
+    # despues de cada cambio el render incremental es igual a un render completo de la misma escena
+    def test_incremental(self):
+        changes = [
+            ('luz movida', lambda r: setattr(r.point_lights[0], 'position', [0, 5, -4])),
+            ('intensidad', lambda r: setattr(r.point_lights[1], 'intensity', 0.6)),
+            ('material', lambda r: setattr(r.scene[1].material, 'diffuse', color(0.2, 0.9, 0.2))),
+            ('objeto movido', lambda r: r.scene.__setitem__(2, Cube([0.5, 0, -6], [1, 1, 1], r.scene[2].material))),
+            ('objeto nuevo', lambda r: r.scene.append(Sphere([2, 0.5, -5], 0.6, r.scene[0].material)))
+        ]
+
+        r = scene(RayTracer(32, 32))
+        r.glRayTracingRenderIncremental()
+
+        applied = []
+        for name, change in changes:
+            change(r)
+            applied.append(change)
+            stats = r.glRayTracingRenderIncremental()
+
+            full = scene(RayTracer(32, 32))
+            for previous in applied:
+                previous(full)
+            full.glRayTracingRenderPacket()
+
+            np.testing.assert_array_equal(r.pixels, full.pixels, err_msg = name)
+            self.assertLess(stats['traced'], 32 * 32, name)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import numpy as np
+from gl import RayTracer, color
+from sphere import Material, PointLight, AmbientLight
+from mesh import Mesh
+
+# (material, hoja)
+# esfera de triangulos (latitud y longitud) de radio 1 centrada en (0, 0, -5), cerrada
+def sphereMesh(material, leaf_size = 8, rings = 12, segments = 16):
+    vertices = [[0, 1, -5]]
+    for i in range(1, rings):
+        theta = np.pi * i / rings
+        for j in range(segments):
+            phi = 2 * np.pi * j / segments
+            vertices.append([np.sin(theta) * np.cos(phi), np.cos(theta), np.sin(theta) * np.sin(phi) - 5])
+    vertices.append([0, -1, -5])
+
+    def ring(i, j):
+        return 1 + (i - 1) * segments + j % segments
+
+    faces = []
+    for j in range(segments):
+        faces.append([0, ring(1, j + 1), ring(1, j)])
+        faces.append([len(vertices) - 1, ring(rings - 1, j), ring(rings - 1, j + 1)])
+    for i in range(1, rings - 1):
+        for j in range(segments):
+            faces.append([ring(i, j), ring(i, j + 1), ring(i + 1, j + 1)])
+            faces.append([ring(i, j), ring(i + 1, j + 1), ring(i + 1, j)])
+
+    return Mesh(vertices, faces, material, leaf_size = leaf_size)
+
+class MeshTest(unittest.TestCase):
+    # el BVH de la malla da lo mismo que probar todos los triangulos (una sola hoja)
+    def test_bvh(self):
+        material = Material(diffuse = color(0.8, 0.6, 0.2))
+        tree = sphereMesh(material, leaf_size = 2)
+        flat = sphereMesh(material, leaf_size = len(tree.triangles))
+        self.assertEqual(len(flat.node_count), 1)
+        self.assertGreater(len(tree.node_count), 1)
+
+        rng = np.random.RandomState(3)
+        # rayos desde puntos al azar hacia puntos cerca de la esfera, la mayoria la toca
+        origins = rng.uniform(-3, 3, (2000, 3)) + [0, 0, -5]
+        directions = rng.uniform(-1.2, 1.2, (2000, 3)) + [0, 0, -5] - origins
+        directions /= np.linalg.norm(directions, axis = 1)[:, None]
+
+        for a, b in zip(tree.ray_intersect_packet(origins, directions), flat.ray_intersect_packet(origins, directions)):
+            np.testing.assert_array_equal(a, b)
+
+    # la prueba watertight no deja huecos en las aristas compartidas
+    def test_watertight(self):
+        mesh = sphereMesh(Material())
+
+        rng = np.random.RandomState(4)
+        directions = rng.normal(size = (2000, 3))
+        directions /= np.linalg.norm(directions, axis = 1)[:, None]
+        origins = np.tile([0.0, 0.0, -5.0], (2000, 1))
+
+        t = mesh.ray_intersect_packet(origins, directions)[0]
+        self.assertTrue(np.isfinite(t).all())
+
+    # mismo render en el modo original y por paquetes
+    def test_render(self):
+        renders = []
+        for packet in (False, True):
+            r = RayTracer(32, 32)
+            r.point_lights.append(PointLight(position = [2, 3, 0], intensity = 0.8))
+            r.ambient_light = AmbientLight(strength = 0.2)
+            r.scene.append(sphereMesh(Material(diffuse = color(0.8, 0.6, 0.2), spec = 16)))
+
+            if packet:
+                r.glRayTracingRenderPacket()
+            else:
+                r.glRayTracingRender()
+            renders.append(r.pixels)
+
+        np.testing.assert_array_equal(renders[1], renders[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import numpy as np
+from gl import RayTracer, color
+from sphere import Sphere, Cube, Material, PointLight, DirectionalLight
+from voxel import VoxelGrid
+
+# (render)
+# terreno de bloques unitarios con alturas distintas y una esfera encima
+def scene(r):
+    grass = Material(diffuse = color(0.3, 0.8, 0.3), spec = 16)
+    stone = Material(diffuse = color(0.5, 0.5, 0.5))
+
+    r.point_lights.append(PointLight(position = [2, 4, -3], intensity = 0.8))
+    r.directional_light = DirectionalLight(direction = [0.3, -1, -0.4], intensity = 0.4)
+    for x in range(-4, 5):
+        for z in range(-10, -4):
+            for y in range((x * x + z) % 3):
+                r.scene.append(Cube([x, y - 2, z], [1, 1, 1], stone if y else grass))
+    r.scene.append(Sphere([0, 1.5, -7], 0.8, grass))
+
+    return r
+
+# (render)
+# la misma escena con los cubos dentro de un VoxelGrid
+def voxelScene(r):
+    scene(r)
+    grid, others = VoxelGrid.fromCubes(r.scene)
+    r.scene = others + [grid]
+    return r
+
+class VoxelGridTest(unittest.TestCase):
+    # el recorrido 3D-DDA encuentra el mismo bloque que los cubos por separado
+    # (el sombreado cambia a proposito: las caras de espaldas a la luz las sombrea su propio bloque)
+    def test_same_as_cubes(self):
+        cubes = scene(RayTracer(8, 8))
+        grid = voxelScene(RayTracer(8, 8))
+
+        rng = np.random.RandomState(2)
+        origin = [0.3, 1.2, 0.1]
+        for direction in rng.normal(size = (400, 3)) * [1, 0.5, 1] - [0, 0.3, 1]:
+            direction = (direction / np.linalg.norm(direction)).tolist()
+
+            material, hit = cubes.scene_intercept(origin, direction)
+            grid_material, grid_hit = grid.scene_intercept(origin, direction)
+
+            self.assertEqual(grid_hit is None, hit is None)
+            if hit is None:
+                continue
+
+            self.assertEqual(grid_material.diffuse, material.diffuse)
+            self.assertAlmostEqual(grid_hit.distance, hit.distance, places = 9)
+            np.testing.assert_allclose(grid_hit.normal, hit.normal, atol = 1e-12)
+
+    # el recorrido por paquetes da el mismo render que el recorrido de un rayo a la vez
+    def test_packet(self):
+        for size in (48, 64):
+            scalar = voxelScene(RayTracer(size, size))
+            scalar.glRayTracingRender()
+
+            packet = voxelScene(RayTracer(size, size))
+            packet.glRayTracingRenderPacket()
+
+            np.testing.assert_array_equal(packet.pixels, scalar.pixels)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,286 @@
+import numpy as np
+from sphere import Intersect
+
+class VoxelGrid(object):
+    # (origen, dimensiones, escala)
+    # origen es el centro del voxel (0, 0, 0) en el mundo y escala el tamaño de cada bloque
+    # cada celda guarda el indice del material (0 es vacio, i es materials[i - 1])
+    def __init__(self, origin, dimensions, scale = 1):
+        self.origin = [float(x) for x in origin]
+        self.dimensions = tuple(int(d) for d in dimensions)
+        self.scale = scale
+
+        self.cells = np.zeros(self.dimensions, dtype = np.uint16)
+        self.materials = []
+
+        # la cuadricula no tiene un solo material, cada interseccion indica el suyo
+        self.material = None
+
+        # un rayo que sale de un bloque puede chocar con otro bloque de la misma cuadricula
+        self.concave = True
+
+    # (material)
+    # agrega el material a la paleta si no existe y regresa su indice en las celdas
+    def addMaterial(self, material):
+        for i, m in enumerate(self.materials):
+            if m is material:
+                return i + 1
+
+        self.materials.append(material)
+        return len(self.materials)
+
+    # (posicion) - coordenadas en el mundo
+    # regresa el indice de la celda que contiene la posicion
+    def cell(self, position):
+        return tuple(int(round((position[i] - self.origin[i]) / self.scale)) for i in range(3))
+
+    # (posicion, material)
+    # coloca un bloque en la posicion indicada, None para borrarlo
+    def setBlock(self, position, material):
+        self.cells[self.cell(position)] = self.addMaterial(material) if material is not None else 0
+
+    # (posicion)
+    # regresa el material del bloque en la posicion o None si esta vacio
+    def getBlock(self, position):
+        value = self.cells[self.cell(position)]
+        return self.materials[value - 1] if value else None
+
+    # (cubos, escala)
+    # crea una cuadricula con los cubos de tamaño escala alineados a una malla entera
+    # regresa la cuadricula y la lista de objetos que no se pudieron convertir
+    @staticmethod
+    def fromCubes(objects, scale = 1):
+        blocks = []
+        others = []
+
+        for obj in objects:
+            position = getattr(obj, 'position', None)
+            size = getattr(obj, 'size', None)
+
+            if (size is not None and position is not None and all(s == scale for s in size)
+                and all(float(p / scale).is_integer() for p in position)):
+                blocks.append(obj)
+            else:
+                others.append(obj)
+
+        if not blocks:
+            return None, others
+
+        low = [min(b.position[i] for b in blocks) for i in range(3)]
+        high = [max(b.position[i] for b in blocks) for i in range(3)]
+
+        grid = VoxelGrid(low, [round((high[i] - low[i]) / scale) + 1 for i in range(3)], scale)
+        for block in blocks:
+            grid.setBlock(block.position, block.material)
+
+        return grid, others
+
+    # no tiene parámetros
+    # caja alineada a los ejes que contiene a la cuadricula (minimo, maximo)
+    def bounds(self):
+        return (
+            [self.origin[i] - self.scale / 2 for i in range(3)],
+            [self.origin[i] + (self.dimensions[i] - 0.5) * self.scale for i in range(3)]
+        )
+
+    # (origen, direccion)
+    # interseccion con el primer bloque en el camino del rayo
+    def ray_intersect(self, orig, dir):
+        hit = self.traverse(orig, dir)
+        if hit is None:
+            return None
+
+        t, cell, axis, step, value = hit
+        return self.hit(orig, dir, t, cell, axis, step, self.materials[value - 1])
+
+    # (origen, direccion, distancia maxima)
+    # regresa verdadero si hay un bloque en el camino antes de max_distance
+    def ray_occluded(self, orig, dir, max_distance = float('inf')):
+        return self.traverse(orig, dir, max_distance) is not None
+
+    # (origen, direccion, distancia maxima)
+    # recorrido 3D-DDA (Amanatides-Woo) por las celdas que atraviesa el rayo
+    # solo se revisan las celdas del camino hasta encontrar un bloque
+    # regresa (distancia, celda, eje, paso en ese eje, valor de la celda) o None
+    def traverse(self, orig, dir, max_distance = float('inf')):
+        epsilon = 0.0001
+        dims = self.dimensions
+
+        # coordenadas de la cuadricula, la celda i va de i a i + 1
+        g = [(orig[i] - self.origin[i]) / self.scale + 0.5 for i in range(3)]
+
+        tnear = epsilon
+        tfar = float('inf')
+        axis = -1
+
+        # mismas operaciones que ray_intersect_packet para que los dos modos den la misma distancia
+        inverse = [self.scale / dir[i] if dir[i] != 0 else float('inf') for i in range(3)]
+
+        for i in range(3):
+            if dir[i] != 0:
+                t1 = -g[i] * inverse[i]
+                t2 = (dims[i] - g[i]) * inverse[i]
+                if t1 > t2:
+                    t1, t2 = t2, t1
+                if t1 > tnear:
+                    tnear = t1
+                    axis = i
+                if t2 < tfar:
+                    tfar = t2
+            elif g[i] < 0 or g[i] >= dims[i]:
+                return None
+
+        # el rayo sale de la cuadricula en tfar, max_distance solo limita los rayos de sombra
+        if tnear > tfar or tnear >= max_distance:
+            return None
+
+        cell = [0, 0, 0]
+        step = [0, 0, 0]
+        tMax = [float('inf')] * 3
+        tDelta = [float('inf')] * 3
+
+        for i in range(3):
+            p = g[i] + tnear / self.scale * dir[i]
+            cell[i] = min(max(int(np.floor(p)), 0), dims[i] - 1)
+
+            if dir[i] > 0:
+                step[i] = 1
+                tMax[i] = (cell[i] + 1 - g[i]) * inverse[i]
+                tDelta[i] = abs(inverse[i])
+            elif dir[i] < 0:
+                step[i] = -1
+                tMax[i] = (cell[i] - g[i]) * inverse[i]
+                tDelta[i] = abs(inverse[i])
+
+        t = tnear
+        cells = self.cells
+
+        while True:
+            value = cells[cell[0], cell[1], cell[2]]
+            if value:
+                if axis < 0:
+                    # el rayo empezo dentro de un bloque
+                    axis = max(range(3), key = lambda i: abs(dir[i]))
+                return t, cell, axis, step[axis], value
+
+            axis = tMax.index(min(tMax))
+            t = tMax[axis]
+            if t > tfar or t >= max_distance:
+                return None
+
+            cell[axis] += step[axis]
+            if cell[axis] < 0 or cell[axis] >= dims[axis]:
+                return None
+
+            tMax[axis] += tDelta[axis]
+
+    # (origen, direccion, distancia, celda, eje, paso, material)
+    # construye la interseccion con la cara del bloque por la que entro el rayo
+    def hit(self, orig, dir, t, cell, axis, step, material):
+        point = [orig[i] + t * dir[i] for i in range(3)]
+
+        normal = [0, 0, 0]
+        normal[axis] = -step if step != 0 else 1
+
+        boundsMin = [self.origin[i] + (cell[i] - 0.5) * self.scale for i in range(3)]
+
+        # mismas uvs que Cube, se usan los dos ejes restantes
+        a, b = [i for i in range(3) if i != axis]
+        u = min(max((point[a] - boundsMin[a]) / self.scale, 0), 1)
+        v = min(max((point[b] - boundsMin[b]) / self.scale, 0), 1)
+
+        # scene_object es None para que los rayos secundarios revisen la misma cuadricula
+        return Intersect(
+            distance = t,
+            point = point,
+            normal = normal,
+            texture = [u, v],
+            obj = None,
+            material = material
+        )
+
+    # (origenes, direcciones) - arreglos (N, 3)
+    # version por paquetes de ray_intersect, todos los rayos avanzan una celda por iteracion
+    # regresa distancias, normales, uvs e indices de material en la paleta
+    def ray_intersect_packet(self, orig, dir):
+        epsilon = 0.0001
+        n = len(orig)
+        dims = np.array(self.dimensions)
+        origin = np.array(self.origin)
+
+        g = (orig - origin) / self.scale + 0.5
+
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            moving = dir != 0
+            inverse = np.where(moving, self.scale / np.where(moving, dir, 1), np.inf)
+
+            t1 = np.where(moving, -g * inverse, -np.inf)
+            t2 = np.where(moving, (dims - g) * inverse, np.inf)
+
+        # los rayos paralelos a un eje solo pueden entrar si estan dentro de ese rango
+        outside = ~moving & ((g < 0) | (g >= dims))
+
+        entry = np.minimum(t1, t2)
+        tnear = entry.max(axis = 1)
+        tfar = np.maximum(t1, t2).min(axis = 1)
+        axis = np.where(tnear > epsilon, entry.argmax(axis = 1), -1)
+        tnear = np.maximum(tnear, epsilon)
+
+        active = (tnear <= tfar) & ~outside.any(axis = 1)
+
+        step = np.sign(dir).astype(int)
+        p = g + (np.where(active, tnear, 0) / self.scale)[:, None] * dir
+        cell = np.clip(np.floor(p).astype(int), 0, dims - 1)
+
+        with np.errstate(invalid = 'ignore'):
+            tMax = np.where(moving, (cell + (step > 0) - g) * inverse, np.inf)
+        tDelta = np.abs(inverse)
+
+        t = tnear.copy()
+        distance = np.full(n, np.inf)
+        local = np.zeros(n, dtype = int)
+
+        rays = np.nonzero(active)[0]
+        while len(rays):
+            values = self.cells[cell[rays, 0], cell[rays, 1], cell[rays, 2]]
+
+            found = values > 0
+            if found.any():
+                selected = rays[found]
+                distance[selected] = t[selected]
+                local[selected] = values[found] - 1
+                rays = rays[~found]
+
+            if not len(rays):
+                break
+
+            a = tMax[rays].argmin(axis = 1)
+            t[rays] = tMax[rays, a]
+            axis[rays] = a
+            cell[rays, a] += step[rays, a]
+            tMax[rays, a] += tDelta[rays, a]
+
+            inside = (t[rays] <= tfar[rays]) & (cell[rays, a] >= 0) & (cell[rays, a] < dims[a])
+            rays = rays[inside]
+
+        hit = np.isfinite(distance)
+
+        # rayos que empezaron dentro de un bloque
+        started_inside = hit & (axis < 0)
+        axis[started_inside] = np.abs(dir[started_inside]).argmax(axis = 1)
+        axis = np.maximum(axis, 0)
+
+        rows = np.arange(n)
+        normal = np.zeros((n, 3))
+        normal[rows, axis] = np.where(step[rows, axis] != 0, -step[rows, axis], 1)
+
+        point = orig + np.where(hit, distance, 0)[:, None] * dir
+        boundsMin = origin + (cell - 0.5) * self.scale
+
+        others = np.array([[1, 2], [0, 2], [0, 1]])[axis]
+        uvs = np.full((n, 2), np.nan)
+        uvs[hit, 0] = (point[rows, others[:, 0]] - boundsMin[rows, others[:, 0]])[hit] / self.scale
+        uvs[hit, 1] = (point[rows, others[:, 1]] - boundsMin[rows, others[:, 1]])[hit] / self.scale
+        uvs[hit] = np.clip(uvs[hit], 0, 1)
+
+        return distance, normal, uvs, local
@@ -0,0 +1,24 @@
+import argparse
+from farm import runWorker, startWorkers, parseAddress
+
+# worker del modo granja (RayTracer.glRayTracingRenderFarm)
+# python worker.py host:puerto --authkey clave --processes 4
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'worker de render, recibe bloques de un coordinador')
+    parser.add_argument('address', help = 'host:puerto del coordinador')
+    parser.add_argument('--authkey', required = True, help = 'clave que imprime el coordinador (o la que se le paso)')
+    parser.add_argument('--processes', type = int, default = 1, help = 'cantidad de workers en esta maquina')
+    parser.add_argument('--retry', type = float, default = 60, help = 'segundos para esperar al coordinador')
+    args = parser.parse_args(argv)
+
+    address = parseAddress(args.address)
+    authkey = args.authkey.encode()
+
+    if args.processes == 1:
+        runWorker(address, authkey, args.retry)
+    else:
+        for worker in startWorkers(address, authkey, args.processes, args.retry):
+            worker.join()
+
+if __name__ == '__main__':
+    main()